@@ -1,46 +1,310 @@
-import subprocess
+import asyncio
+import importlib
+import inspect
+import multiprocessing
 import os
+import queue
 import sys
+import threading
+import time
 from uuid import uuid4
+
+import numpy as np
+
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from s3_save_file import load_file_s3
-
-
-def cogvideox_generate(
-    prompt: str,
-    image_or_video_path: str,
-    model_path: str,
-    lora_path: str,
-    generate_type: str = "i2v",
-    num_frames: int = 16,
-    output_path: str = f"./output_{str(uuid4())}.mp4"
-) -> str:
-    command = [
-        "python", "/manga_animation_backend/CogVideo/inference/cli_demo.py",
-        "--prompt", prompt,
-        "--image_or_video_path", image_or_video_path,
-        "--model_path", model_path,
-        "--lora_path", lora_path,
-        "--generate_type", generate_type,
-        "--num_frames", str(num_frames),
-        "--output_path", output_path
-    ]
-
-    result = subprocess.run(command, capture_output=True, text=True)
-    try:
-        url = load_file_s3(output_path)
-        return {'file_url': url, 'file_name': output_path}
-    except:
-        print(output_path)
-    
+from ai_models.generation_client import GenerationError, ProgressEvent
+
+COGVIDEOX_MODEL_PATH = os.getenv("COGVIDEOX_MODEL_PATH", "THUDM/CogVideoX1.5-5B-I2V")
+# the fine-tuned checkpoint from the README, e.g. ./CogVideo/checkpoint/checkpoint-1050
+COGVIDEOX_LORA_PATH = os.getenv("COGVIDEOX_LORA_PATH")
+COGVIDEOX_LORA_RANK = int(os.getenv("COGVIDEOX_LORA_RANK", 128))
+COGVIDEOX_STEPS = int(os.getenv("COGVIDEOX_STEPS", 50))
+COGVIDEOX_FPS = int(os.getenv("COGVIDEOX_FPS", 16))
+COGVIDEOX_OFFLOAD = os.getenv("COGVIDEOX_OFFLOAD", "sequential")
+# "module:function" returning the pipeline; load_fake_pipeline runs on a CPU in seconds
+COGVIDEOX_LOADER = os.getenv("COGVIDEOX_LOADER", "ai_models.cogvideox_run:load_pipeline")
+
+
+class Cancelled(Exception):
+    pass
+
+
+class DiffusersCogVideoX:
+    # what CogVideo/inference/cli_demo.py does per run, minus loading the model
+
+    def __init__(self, pipe, steps: int = COGVIDEOX_STEPS):
+        self.pipe = pipe
+        self.steps = steps
+
+    def generate(self, prompt: str, image_path: str, num_frames: int, on_step) -> list[np.ndarray]:
+        import torch
+        from diffusers.utils import load_image
+
+        def step_end(pipe, step, timestep, callback_kwargs):
+            on_step(step + 1, self.steps)
+            return callback_kwargs
+
+        frames = self.pipe(
+            prompt=prompt, image=load_image(image_path), num_videos_per_prompt=1,
+            num_inference_steps=self.steps, num_frames=num_frames, use_dynamic_cfg=True, guidance_scale=6.0,
+            generator=torch.Generator().manual_seed(42), output_type="np", callback_on_step_end=step_end,
+        ).frames[0]
+        return [(frame * 255).round().astype(np.uint8) for frame in frames]
+
+
+def load_pipeline(model_path: str = COGVIDEOX_MODEL_PATH, lora_path: str | None = COGVIDEOX_LORA_PATH) -> DiffusersCogVideoX:
+    import torch
+    from diffusers import CogVideoXDPMScheduler, CogVideoXImageToVideoPipeline
+
+    pipe = CogVideoXImageToVideoPipeline.from_pretrained(model_path, torch_dtype=torch.bfloat16)
+    if lora_path:
+        pipe.load_lora_weights(lora_path, weight_name="pytorch_lora_weights.safetensors", adapter_name="manga")
+        pipe.fuse_lora(components=["transformer"], lora_scale=1 / COGVIDEOX_LORA_RANK)
+    pipe.scheduler = CogVideoXDPMScheduler.from_config(pipe.scheduler.config, timestep_spacing="trailing")
+    if COGVIDEOX_OFFLOAD == "sequential":
+        pipe.enable_sequential_cpu_offload()
+    elif COGVIDEOX_OFFLOAD == "model":
+        pipe.enable_model_cpu_offload()
+    else:
+        pipe.to("cuda")
+    pipe.vae.enable_slicing()
+    pipe.vae.enable_tiling()
+    return DiffusersCogVideoX(pipe)
+
+
+class FakeCogVideoX:
+    # same interface as DiffusersCogVideoX: a slow zoom on the input image, with the model's
+    # load and step times simulated by sleeping
+
+    def __init__(self, steps: int, step_seconds: float, size: tuple[int, int] = (480, 320)):
+        self.steps = steps
+        self.step_seconds = step_seconds
+        self.size = size
+
+    def generate(self, prompt: str, image_path: str, num_frames: int, on_step) -> list[np.ndarray]:
+        from PIL import Image
+
+        image = Image.open(image_path).convert("RGB").resize(self.size)
+        for step in range(self.steps):
+            time.sleep(self.step_seconds)
+            on_step(step + 1, self.steps)
+        w, h = self.size
+        frames = []
+        for i in range(num_frames):
+            dx, dy = int(w * 0.1 * i / num_frames), int(h * 0.1 * i / num_frames)
+            frames.append(np.asarray(image.crop((dx, dy, w - dx, h - dy)).resize(self.size)))
+        return frames
+
+
+def load_fake_pipeline() -> FakeCogVideoX:
+    time.sleep(float(os.getenv("COGVIDEOX_FAKE_LOAD_SECONDS", 5)))
+    return FakeCogVideoX(int(os.getenv("COGVIDEOX_FAKE_STEPS", COGVIDEOX_STEPS)),
+                         float(os.getenv("COGVIDEOX_FAKE_STEP_SECONDS", 0.02)))
+
+
+def _serve(loader: str, requests, events, cancel, fps: int):
+    # worker process: load once, then take one request at a time until None arrives
+    from encoder_profiles import encoding
+    from video_encoder import ENCODER_SETTINGS, encode_to_s3
+
+    started = time.perf_counter()
+    module, _, name = loader.partition(":")
+    pipeline = getattr(importlib.import_module(module), name)()
+    events.put((None, "ready", time.perf_counter() - started))
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        seq, prompt, image_path, num_frames, output_name = request
+
+        def on_step(step, steps):
+            if cancel.value == seq:
+                raise Cancelled()
+            events.put((seq, "running", (step, steps)))
+
+        try:
+            frames = pipeline.generate(prompt, image_path, num_frames, on_step)
+            events.put((seq, "encoding", None))
+            h, w = frames[0].shape[:2]
+            with encoding("generated", ENCODER_SETTINGS["cogvideox_animate"], (w, h), fps, len(frames) / fps) as settings:
+                url = encode_to_s3(iter(frames), (w, h), fps, settings, output_name)
+            events.put((seq, "done", url))
+        except Cancelled:
+            events.put((seq, "cancelled", None))
+        except Exception as e:
+            events.put((seq, "error", f"{type(e).__name__}: {e}"))
+
+
+class CogVideoXWorker:
+    # One long-lived process holding the pipeline (and fused LoRA), started on first use or
+    # by warm_up(). Jobs wait their turn on an asyncio lock, so only one at a time is handed
+    # to the process; cancelling the waiting coroutine cancels the job, at the next
+    # denoising step if it is already running.
+
+    def __init__(self, loader: str = COGVIDEOX_LOADER, fps: int = COGVIDEOX_FPS):
+        self.loader = loader
+        self.fps = fps
+        self.process = None
+        self.lock = asyncio.Lock()
+        self.pending: dict[int, tuple] = {}
+        self.seq = 0
+        self.ready: asyncio.Future | None = None
+        self.load_seconds: float | None = None
+
+    def start(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        context = multiprocessing.get_context("spawn")
+        self.requests, self.events = context.Queue(), context.Queue()
+        self.cancel = context.Value("q", 0)
+        self.loop = asyncio.get_running_loop()
+        self.ready = self.loop.create_future()
+        self.process = context.Process(
+            target=_serve, args=(self.loader, self.requests, self.events, self.cancel, self.fps), daemon=True,
+        )
+        self.process.start()
+        threading.Thread(target=self._read_events, args=(self.process, self.events, self.ready), daemon=True).start()
+
+    async def warm_up(self):
+        self.start()
+        await asyncio.shield(self.ready)
+
+    def stop(self):
+        if self.process is not None and self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.kill()
+        self.process = None
+
+    def _read_events(self, process, events, ready):
+        # runs in a thread; hands every event to the loop, and fails whatever is in flight
+        # if the process dies (e.g. out of GPU memory)
+        while True:
+            try:
+                seq, kind, value = events.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    self.loop.call_soon_threadsafe(self._lost, process, ready)
+                    return
+                continue
+            if seq is None:
+                self.loop.call_soon_threadsafe(self._ready, ready, value)
+            else:
+                self.loop.call_soon_threadsafe(self._dispatch, seq, kind, value)
+
+    def _ready(self, ready, load_seconds: float):
+        self.load_seconds = load_seconds
+        if not ready.done():
+            ready.set_result(None)
+
+    def status(self) -> dict:
+        # same shape as InferencePool.status() entries
+        if self.ready is not None and self.ready.done() and self.ready.exception() is not None:
+            state, error = "failed", str(self.ready.exception())
+        elif self.ready is None or self.process is None:
+            state, error = "unloaded", None
+        elif not self.ready.done():
+            state, error = "loading", None
+        else:
+            state, error = "ready", None
+        return {"state": state, "load_seconds": self.load_seconds, "error": error}
+
+    def _lost(self, process, ready):
+        error = GenerationError(f"CogVideoX worker exited with code {process.exitcode}")
+        if not ready.done():
+            ready.set_exception(error)
+            ready.exception()
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+        if self.process is process:
+            self.process = None
+
+    def _dispatch(self, seq: int, kind: str, value):
+        if seq not in self.pending:
+            return
+        future, emit = self.pending[seq]
+        if kind == "running":
+            step, steps = value
+            self._spawn(emit("running", step=step, steps=steps))
+        elif kind == "encoding":
+            self._spawn(emit("uploading"))
+        else:
+            del self.pending[seq]
+            if future.done():
+                return
+            if kind == "done":
+                future.set_result(value)
+            elif kind == "cancelled":
+                future.cancel()
+            else:
+                future.set_exception(GenerationError(value))
+
+    def _spawn(self, awaitable):
+        if awaitable is not None:
+            asyncio.ensure_future(awaitable)
+
+    async def generate(self, prompt: str, image_path: str, num_frames: int = 16, output_name: str | None = None,
+                       on_event=None) -> str:
+        started = time.monotonic()
+
+        def emit(stage: str, **info):
+            event = ProgressEvent("cogvideox", COGVIDEOX_MODEL_PATH, stage, round(time.monotonic() - started, 3), **info)
+            if on_event is not None:
+                result = on_event(event)
+                return result if inspect.isawaitable(result) else None
+
+        self._spawn(emit("queued"))
+        async with self.lock:
+            self.start()
+            if not self.ready.done():
+                self._spawn(emit("loading"))
+            await asyncio.shield(self.ready)
+            self.seq += 1
+            seq = self.seq
+            future = self.loop.create_future()
+            self.pending[seq] = (future, emit)
+            self.requests.put((seq, prompt, image_path, num_frames, output_name or f"cogvideox_{uuid4()}.mp4"))
+            try:
+                url = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # stop the process at its next step; the lock is only released once it has,
+                # so the next job never waits behind a cancelled one
+                self.cancel.value = seq
+                if not future.done():
+                    await asyncio.wait([future])
+                raise
+        self._spawn(emit("completed"))
+        return url
+
+
+_worker: CogVideoXWorker | None = None
+
+
+def get_worker() -> CogVideoXWorker:
+    global _worker
+    if _worker is None:
+        _worker = CogVideoXWorker()
+    return _worker
+
+
+async def cogvideox_generate(prompt: str, image_or_video_path: str, num_frames: int = 16, on_event=None) -> dict:
+    output_name = f"cogvideox_{uuid4()}.mp4"
+    url = await get_worker().generate(prompt, image_or_video_path, num_frames, output_name, on_event)
+    return {"file_url": url, "file_name": output_name}
+
+
 if __name__ == '__main__':
-    video_path = cogvideox_generate(
-        prompt="a anime boy is talking",
-        image_or_video_path="/manga_animation_backend/CogVideo/img2.png",
-        model_path="THUDM/CogVideoX1.5-5B-I2V",
-        lora_path="/workspace/manga_animation_backend/CogVideo/checkpoint/ephemeral/CogVideo/my_output3/checkpoint-1050",
-        generate_type="i2v",
-        num_frames=16,
-    )
-    
-    print("Сгенерированное видео:", video_path)
+    async def main():
+        result = await cogvideox_generate(
+            prompt="a anime boy is talking",
+            image_or_video_path="/manga_animation_backend/CogVideo/img2.png",
+            num_frames=16,
+            on_event=lambda event: print(event.as_dict()),
+        )
+        print("Сгенерированное видео:", result)
+        get_worker().stop()
+
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+COLORIZER_SIZE = int(os.getenv("COLORIZER_SIZE", 576))
+COLORIZER_DENOISE = os.getenv("COLORIZER_DENOISE", "1") == "1"
+COLORIZER_DENOISE_SIGMA = int(os.getenv("COLORIZER_DENOISE_SIGMA", 25))
+
+
+def load_colorizer():
+    try:
+        import torch
+        import colorizer
+        from colorizer.colorizator import MangaColorizator
+    except ImportError:
+        # older checkouts only expose the file based entry point
+        from colorizer.inference import main_colorize
+        return main_colorize
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    networks = os.path.join(os.path.dirname(colorizer.__file__), "networks")
+    return MangaColorizator(device, os.path.join(networks, "generator.zip"), os.path.join(networks, "extractor.pth"))
+
+
+def _to_float(image: np.ndarray) -> np.ndarray:
+    # same layout plt.imread gives inference.py for a PNG: float32 RGB in [0, 1]
+    return np.ascontiguousarray(image[..., :3], dtype=np.float32) / 255
+
+
+def _to_uint8(colorized: np.ndarray) -> np.ndarray:
+    return (np.clip(colorized, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+
+def _colorize_with_files(main_colorize, image: np.ndarray) -> np.ndarray:
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "page.png")
+        Image.fromarray(image).save(input_path)
+        main_colorize(input_path)
+        with Image.open(os.path.join(tmp, "page_colorized.png")) as colorized:
+            return np.array(colorized.convert("RGB"))
+
+
+def colorize_array(colorizator, image: np.ndarray) -> np.ndarray:
+    if callable(colorizator):
+        return _colorize_with_files(colorizator, image)
+    colorizator.set_image(_to_float(image), COLORIZER_SIZE, COLORIZER_DENOISE, COLORIZER_DENOISE_SIGMA)
+    return _to_uint8(colorizator.colorize())
+
+
+def colorize_batch(colorizator, images: list[np.ndarray]) -> list[np.ndarray]:
+    if callable(colorizator) or not hasattr(colorizator, "colorizer"):
+        return [colorize_array(colorizator, image) for image in images]
+
+    import torch
+
+    # set_image denoises and pads each page; pages that end up the same tensor shape go
+    # through the generator together
+    prepared = []
+    for image in images:
+        colorizator.set_image(_to_float(image), COLORIZER_SIZE, COLORIZER_DENOISE, COLORIZER_DENOISE_SIGMA)
+        prepared.append((torch.cat([colorizator.current_image, colorizator.current_hint], 1), colorizator.current_pad))
+
+    groups: dict[tuple, list[int]] = {}
+    for i, (tensor, _) in enumerate(prepared):
+        groups.setdefault(tuple(tensor.shape), []).append(i)
+
+    results: list[np.ndarray | None] = [None] * len(images)
+    with torch.no_grad():
+        for indices in groups.values():
+            fake_color, _ = colorizator.colorizer(torch.cat([prepared[i][0] for i in indices]))
+            fake_color = fake_color.detach().cpu().permute(0, 2, 3, 1) * 0.5 + 0.5
+            for i, colorized in zip(indices, fake_color.numpy()):
+                pad_h, pad_w = prepared[i][1]
+                colorized = colorized[:colorized.shape[0] - pad_h, :colorized.shape[1] - pad_w]
+                results[i] = _to_uint8(colorized)
+    return results
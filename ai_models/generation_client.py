@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+import fal_client
+import httpx
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GENERATION_RETRIES = int(os.getenv("GENERATION_RETRIES", 3))
+GENERATION_BACKOFF = float(os.getenv("GENERATION_BACKOFF_SECONDS", 2.0))
+GENERATION_POLL_INTERVAL = float(os.getenv("GENERATION_POLL_INTERVAL", 1.0))
+# fal storage keeps uploads for a while; re-upload well before that runs out
+UPLOAD_TTL = float(os.getenv("UPLOAD_TTL_SECONDS", 6 * 3600))
+PROVIDER_CONCURRENCY = {"fal": int(os.getenv("FAL_CONCURRENCY", 4))}
+
+
+class GenerationError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    # stage: uploading, uploaded, submitted, queued, loading, running, retrying, completed or failed
+    provider: str
+    application: str
+    stage: str
+    elapsed: float
+    attempt: int = 1
+    request_id: str | None = None
+    queue_position: int | None = None
+    step: int | None = None
+    steps: int | None = None
+    message: str | None = None
+
+    def as_dict(self) -> dict:
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+
+def request_key(provider: str, application: str, image: bytes | str, arguments: dict, content_type: str = "image/png") -> str:
+    # identical generations (same model, image bytes and arguments) share one key; `image`
+    # is the bytes or the hex sha256 of them (uploads are hashed while they are ingested)
+    digest = hashlib.sha256()
+    digest.update(json.dumps([provider, application, arguments, content_type], sort_keys=True).encode())
+    digest.update(bytes.fromhex(image) if isinstance(image, str) else hashlib.sha256(image).digest())
+    return digest.hexdigest()
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, (httpx.TransportError, fal_client.FalClientTimeoutError)):
+        return True
+    if isinstance(error, fal_client.FalClientHTTPError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+@dataclass
+class Submission:
+    # one submitted generation; polling that fails part way resumes from here with the same
+    # request instead of submitting (and paying for) another
+    request_id: str
+    handle: object
+    submitted: float
+    started: float | None = None
+    position: int | None = None
+    seen_logs: int = 0
+
+
+class FalProvider:
+    name = "fal"
+
+    def __init__(self, key: str | None = None, poll_interval: float = GENERATION_POLL_INTERVAL):
+        self.client = fal_client.AsyncClient(key=key)
+        self.poll_interval = poll_interval
+
+    async def upload(self, data: bytes, content_type: str) -> str:
+        return await self.client.upload(data, content_type)
+
+    async def submit(self, application: str, arguments: dict) -> Submission:
+        handle = await self.client.submit(application, arguments)
+        return Submission(handle.request_id, handle, time.perf_counter())
+
+    async def wait(self, submission: Submission, emit) -> dict:
+        handle = submission.handle
+        async for status in handle.iter_events(with_logs=True, interval=self.poll_interval):
+            if submission.started is None and not isinstance(status, fal_client.Queued):
+                # out of fal's queue; the rest is the model running (to within a poll interval)
+                submission.started = time.perf_counter()
+                metrics.record("fal_queue_wait", submission.started - submission.submitted, submission.submitted)
+            if isinstance(status, fal_client.Queued):
+                if status.position != submission.position:
+                    submission.position = status.position
+                    await emit("queued", queue_position=status.position)
+            elif isinstance(status, fal_client.InProgress):
+                logs = status.logs or []
+                if submission.seen_logs == 0 and not logs:
+                    await emit("running")
+                for log in logs[submission.seen_logs:]:
+                    await emit("running", message=log.get("message"))
+                submission.seen_logs = max(submission.seen_logs, len(logs), 1)
+            elif isinstance(status, fal_client.Completed) and status.error:
+                raise GenerationError(status.error)
+        result = await handle.get()
+        if submission.started is not None:
+            metrics.record("fal_run", time.perf_counter() - submission.started, submission.started)
+        return result
+
+
+PROVIDERS = {"fal": FalProvider}
+
+
+class GenerationClient:
+    # Shared by every job that talks to one provider. Input images are uploaded to the
+    # provider's storage once per content hash and passed by URL, at most `concurrency`
+    # generations are in flight at the provider, transient failures are retried with
+    # exponential backoff, and every step is reported as a ProgressEvent.
+
+    def __init__(self, provider, concurrency: int = 4, retries: int = GENERATION_RETRIES,
+                 backoff: float = GENERATION_BACKOFF, upload_ttl: float = UPLOAD_TTL, max_uploads: int = 1024):
+        self.provider = provider
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.upload_ttl = upload_ttl
+        self.max_uploads = max_uploads
+        self.uploads: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.pending_uploads: dict[str, asyncio.Task] = {}
+        self.stats = {"uploads": 0, "upload_hits": 0, "upload_bytes": 0, "runs": 0, "retries": 0, "failures": 0}
+
+    async def _with_retries(self, operation, emit):
+        for attempt in range(1, self.retries + 2):
+            try:
+                return await operation(attempt)
+            except Exception as e:
+                if attempt > self.retries or not is_transient(e):
+                    raise
+                self.stats["retries"] += 1
+                await emit("retrying", attempt=attempt, message=f"{type(e).__name__}: {e}")
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.0))
+
+    async def _upload(self, key: str, data: bytes, content_type: str, emit) -> str:
+        with metrics.span(f"{self.provider.name}_upload"):
+            url = await self._with_retries(lambda attempt: self.provider.upload(data, content_type), emit)
+        self.stats["uploads"] += 1
+        self.stats["upload_bytes"] += len(data)
+        self.uploads[key] = (time.monotonic() + self.upload_ttl, url)
+        while len(self.uploads) > self.max_uploads:
+            self.uploads.popitem(last=False)
+        return url
+
+    async def upload(self, data: bytes, content_type: str, emit=None) -> str:
+        emit = emit or self._emitter("upload", None)
+        key = f"{hashlib.sha256(data).hexdigest()}:{content_type}"
+        cached = self.uploads.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.uploads.move_to_end(key)
+            self.stats["upload_hits"] += 1
+            return cached[1]
+        # the same image submitted twice at once is still uploaded once
+        task = self.pending_uploads.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._upload(key, data, content_type, emit))
+            self.pending_uploads[key] = task
+            task.add_done_callback(lambda _: self.pending_uploads.pop(key, None))
+        else:
+            self.stats["upload_hits"] += 1
+        return await asyncio.shield(task)
+
+    def _emitter(self, application: str, on_event):
+        started = time.monotonic()
+
+        async def emit(stage: str, **info):
+            event = ProgressEvent(self.provider.name, application, stage, round(time.monotonic() - started, 3), **info)
+            logger.info("%s %s", application, stage, extra={"progress": event.as_dict()})
+            if on_event is not None:
+                result = on_event(event)
+                if inspect.isawaitable(result):
+                    await result
+        return emit
+
+    async def generate(self, application: str, image, arguments: dict, content_type: str = "image/png",
+                       image_field: str = "image_url", on_event=None) -> dict:
+        # `image` is the raw file, or a URL the provider can fetch itself
+        emit = self._emitter(application, on_event)
+        try:
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                await emit("uploading")
+                image = await self.upload(bytes(image), content_type, emit)
+                await emit("uploaded")
+            waited = time.perf_counter()
+            async with self.semaphore:
+                # generations beyond the provider concurrency wait here, before fal's own queue
+                metrics.record(f"{self.provider.name}_slot_wait", time.perf_counter() - waited, waited)
+                self.stats["runs"] += 1
+                # only the submission is retried as a whole; a poll or result fetch that fails
+                # resumes watching the request already submitted
+                submission = await self._with_retries(
+                    lambda attempt: self.provider.submit(application, {**arguments, image_field: image}), emit)
+                await emit("submitted", request_id=submission.request_id)
+                result = await self._with_retries(
+                    lambda attempt: self.provider.wait(
+                        submission,
+                        lambda stage, **info: emit(stage, attempt=attempt, request_id=submission.request_id, **info),
+                    ),
+                    emit,
+                )
+        except Exception as e:
+            self.stats["failures"] += 1
+            await emit("failed", message=f"{type(e).__name__}: {e}")
+            raise
+        await emit("completed")
+        return result
+
+
+_clients: dict[str, GenerationClient] = {}
+
+
+def get_client(provider: str = "fal") -> GenerationClient:
+    if provider not in _clients:
+        _clients[provider] = GenerationClient(PROVIDERS[provider](), PROVIDER_CONCURRENCY.get(provider, 4))
+    return _clients[provider]
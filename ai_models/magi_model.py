@@ -0,0 +1,56 @@
+import numpy as np
+
+
+def load_magi():
+    import torch
+    from transformers import AutoModel
+
+    if torch.cuda.is_available():
+        device = torch.device("cuda")
+        print("Using device: CUDA")
+    else:
+        device = torch.device("cpu")
+        print("Using device: CPU")
+
+    model = AutoModel.from_pretrained(
+        "ragavsachdeva/magi",
+        trust_remote_code=True
+    )
+    model = model.to(device)
+    model.eval()
+    return model
+
+
+def detect_panels(model, images: list[np.ndarray]) -> list[list[list[float]]]:
+    import torch
+
+    with torch.no_grad():
+        results = model.predict_detections_and_associations(images)
+    return [[[float(v) for v in bbox] for bbox in r["panels"]] for r in results]
+
+
+def crop_boxes(shape: tuple, bboxes) -> list[tuple[int, int, int, int]]:
+    # same clamping as magi's processor.crop_image, so crops can be cut without the model
+    h, w = shape[:2]
+    boxes = []
+    for bbox in bboxes:
+        x1, y1, x2, y2 = (int(v) for v in bbox)
+        x1, y1, x2, y2 = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+        x1, y1 = min(max(0, x1), w), min(max(0, y1), h)
+        x2, y2 = min(max(0, x2), w), min(max(0, y2), h)
+        if x2 - x1 < 10:
+            if w - x1 > 10:
+                x2 = x1 + 10
+            else:
+                x1 = x2 - 10
+        if y2 - y1 < 10:
+            if h - y1 > 10:
+                y2 = y1 + 10
+            else:
+                y1 = y2 - 10
+        boxes.append((x1, y1, x2, y2))
+    return boxes
+
+
+def crop_image(image: np.ndarray, bboxes) -> list[np.ndarray]:
+    return [image[y1:y2, x1:x2] for x1, y1, x2, y2 in crop_boxes(image.shape, bboxes)]
@@ -1,20 +1,22 @@
-import asyncio
-import fal_client
-import json
- 
-async def vidu_generate(base64_image, prompt):
-    handler = await fal_client.submit_async(
-        "fal-ai/vidu/q1/image-to-video",
-        arguments={
-            "prompt": prompt,
-            "image_url": base64_image
-        },
-    )
+from ai_models.generation_client import get_client, request_key
+
+APPLICATION = "fal-ai/vidu/q1/image-to-video"
+
 
-    async for event in handler.iter_events(with_logs=True):
-        print(event)
+def vidu_arguments(prompt):
+    return {"prompt": prompt}
 
-    result = await handler.get()
 
-    print(result)
-    return result
\ No newline at end of file
+def vidu_key(image, prompt, content_type="image/png"):
+    return request_key("fal", APPLICATION, image, vidu_arguments(prompt), content_type)
+
+
+async def vidu_generate(image, prompt, content_type="image/png", on_event=None):
+    # `image` is the raw image file (uploaded once to fal storage) or a URL
+    return await get_client("fal").generate(
+        APPLICATION,
+        image,
+        vidu_arguments(prompt),
+        content_type=content_type,
+        on_event=on_event,
+    )
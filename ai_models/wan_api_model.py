@@ -1,20 +1,22 @@
-import asyncio
-import fal_client
+from ai_models.generation_client import get_client, request_key
 
-async def wan_generate(base64_image, prompt):
-    handler = await fal_client.submit_async(
-        "fal-ai/wan-i2v",
-        arguments={
-            "prompt": prompt,
-            "image_url": base64_image,
-            "resolution": "480p"
-        },
-    )
+APPLICATION = "fal-ai/wan-i2v"
+
+
+def wan_arguments(prompt):
+    return {"prompt": prompt, "resolution": "480p"}
 
-    async for event in handler.iter_events(with_logs=True):
-        print(event)
 
-    result = await handler.get()
+def wan_key(image, prompt, content_type="image/png"):
+    return request_key("fal", APPLICATION, image, wan_arguments(prompt), content_type)
 
-    print(result)
-    return result
\ No newline at end of file
+
+async def wan_generate(image, prompt, content_type="image/png", on_event=None):
+    # `image` is the raw image file (uploaded once to fal storage) or a URL
+    return await get_client("fal").generate(
+        APPLICATION,
+        image,
+        wan_arguments(prompt),
+        content_type=content_type,
+        on_event=on_event,
+    )
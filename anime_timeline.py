@@ -0,0 +1,109 @@
+import random
+from dataclasses import dataclass
+
+# moviepy.editor would also pull in IPython and every fx; this module (imported by each
+# render worker) only needs these
+from moviepy.video.VideoClip import ColorClip
+from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
+from moviepy.video.fx.resize import resize
+from moviepy.video.io.VideoFileClip import VideoFileClip
+
+CANVAS_WIDTH, CANVAS_HEIGHT = 1080, 1920
+CANVAS = (CANVAS_WIDTH, CANVAS_HEIGHT)
+DIRECTIONS = ['right', 'left', 'down', 'up']
+# transitions between clips: a slide in one of DIRECTIONS, or one of these
+WIPES = ['wipe_right', 'wipe_left', 'wipe_down', 'wipe_up']
+TRANSITION_STYLES = {
+    'slide': DIRECTIONS,
+    'wipe': WIPES,
+    'crossfade': ['crossfade'],
+    'zoom': ['zoom'],
+    'mixed': [*DIRECTIONS, *WIPES, 'crossfade', 'zoom'],
+}
+
+
+@dataclass(frozen=True)
+class Layer:
+    clip: int
+    src_start: float
+    src_end: float
+    start: float
+    transition: str | None = None
+    role: str | None = None
+
+    @property
+    def end(self) -> float:
+        return self.start + self.src_end - self.src_start
+
+
+def random_transitions(n_clips: int, style: str = 'slide') -> list[str]:
+    return [random.choice(TRANSITION_STYLES[style]) for _ in range(max(0, n_clips - 1))]
+
+
+def plan_layers(durations: list[float], transition: float, kinds: list[str]) -> list[Layer]:
+    # clip bodies centred on the canvas, and between every pair of clips a `transition`
+    # long change from the previous tail to the next head
+    layers = []
+    current_t = 0.0
+    for idx, duration in enumerate(durations):
+        if idx == 0:
+            layers.append(Layer(0, 0, duration - transition, current_t))
+            current_t += duration - transition
+            continue
+
+        kind = kinds[idx - 1]
+        prev_duration = durations[idx - 1]
+        layers.extend([
+            Layer(idx - 1, prev_duration - transition, prev_duration, current_t, kind, 'prev'),
+            Layer(idx, 0, transition, current_t, kind, 'next'),
+            Layer(idx, transition, duration, current_t + transition),
+        ])
+        current_t += duration - transition
+    return layers
+
+
+def timeline_duration(durations: list[float], transition: float) -> float:
+    return sum(durations) - max(0, len(durations) - 1) * transition
+
+
+def slide_position(direction: str, role: str, transition: float, canvas: tuple[int, int] = CANVAS):
+    width, height = canvas
+    if direction == 'right':
+        if role == 'prev':
+            return lambda t: (width * (t / transition), 'center')
+        return lambda t: (-width + width * (t / transition), 'center')
+    if direction == 'left':
+        if role == 'prev':
+            return lambda t: (-width * (t / transition), 'center')
+        return lambda t: (width - width * (t / transition), 'center')
+    if direction == 'down':
+        if role == 'prev':
+            return lambda t: ('center', height * (t / transition))
+        return lambda t: ('center', -height + height * (t / transition))
+    if role == 'prev':
+        return lambda t: ('center', -height * (t / transition))
+    return lambda t: ('center', height - height * (t / transition))
+
+
+def scale_clip(clip: VideoFileClip, canvas_w: int = CANVAS_WIDTH, canvas_h: int = CANVAS_HEIGHT, limit: float = 1.5) -> VideoFileClip:
+    scale = min(limit, canvas_w / clip.w, canvas_h / clip.h)
+    return clip if scale == 1 else clip.fx(resize, scale)
+
+
+def build_composite(layers: list[Layer], clips: dict[int, VideoFileClip], duration: float, transition: float,
+                    canvas: tuple[int, int] = CANVAS) -> CompositeVideoClip:
+    # `clips` are already scaled to the canvas. create_anime takes the duration, fps and
+    # audio from this; frames come from transition_compositor.Compositor, which renders
+    # slides exactly like this composite does
+    background = (
+        ColorClip(canvas, color=(255, 255, 255))
+        .set_duration(duration)
+    )
+    placed = []
+    for layer in layers:
+        clip = clips[layer.clip].subclip(layer.src_start, layer.src_end).set_start(layer.start)
+        if layer.transition in DIRECTIONS:
+            placed.append(clip.set_position(slide_position(layer.transition, layer.role, transition, canvas)))
+        else:
+            placed.append(clip.set_position(('center', 'center')))
+    return CompositeVideoClip([background, *placed], size=canvas)
@@ -1,223 +1,730 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import io
 import os
-from pathlib import Path
 from uuid import uuid4
 import base64
 import asyncio
 import json
-import fal_client
-import shutil
+import contextlib
+import logging
+import sys
+from contextvars import ContextVar
+from types import SimpleNamespace
 
 import numpy as np
 from PIL import Image
-import torch
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks
-from fastapi.responses import JSONResponse
-from transformers import AutoModel
-
-from colorizer.inference import main_colorize
-from ai_models.vidu_api_model import vidu_generate
-from ai_models.wan_api_model import wan_generate
-from ai_models.base64_uri import path2base64URI
-from manual_creation import Manual
-from create_anime import create_anime
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from ai_models.colorizer_model import colorize_array, colorize_batch
+from ai_models.magi_model import detect_panels, crop_boxes, crop_image
+import metrics
+from panel_batcher import PanelBatcher
+from inference_pool import READY, InferencePool, PoolBusy, WorkerCrashed
+from result_cache import ResultCache, image_key
+from job_store import JobRunner, make_job_store, public_view
+from panel_encoding import FORMATS, encode_all, encode_image, multipart_boundary, multipart_stream, zip_stream
+from chapter_pipeline import GENERATED_EFFECTS, ChapterSpec, check_transition_style, is_url, effect_pool, render_effect, run_chapter, shutdown_effect_pool
+from profiling import PROFILING_ENABLED, ProfileStore, SamplingProfiler
+from quality import DEFAULT_QUALITY, QUALITY_TIERS
+from effect_timeline import Timeline
+from image_ingest import PAGE_MAX_SIZE, ImageTooLarge, InvalidImage, decode_image
+from upload_ingest import UPLOAD_BATCH_MAX_BYTES, Upload, UploadLimit, ingest_image, ingest_json
 
 from dotenv import load_dotenv
-from s3_save_file import load_file_s3
-from ai_models.cogvideox_run import cogvideox_generate
+
+# moviepy, boto3, fal_client and the model modules are imported by the handlers that use
+# them, so a process that only serves status polls or panel crops never loads them
 
 load_dotenv()
 api_key = os.getenv("FAL_KEY")
 
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
 
+logger = logging.getLogger(__name__)
+
+# models to load at startup ("magi,colorizer,cogvideox" or "all"); the rest load on first use
+MODELS = ["magi", "colorizer", "cogvideox"]
+MODEL_WARM_UP = [name.strip() for name in os.getenv("MODEL_WARM_UP", "").split(",") if name.strip()]
+if "all" in MODEL_WARM_UP:
+    MODEL_WARM_UP = MODELS
 
 app = FastAPI()
 
-if torch.cuda.is_available():
-    device = torch.device("cuda")
-    print("Using device: CUDA")
-else:
-    device = torch.device("cpu")
-    print("Using device: CPU")
-    
-
-model = AutoModel.from_pretrained(
-    "ragavsachdeva/magi",
-    trust_remote_code=True
+HTTP_REQUESTS = metrics.REGISTRY.counter("manga_http_requests_total", "HTTP requests by route and status",
+                                         ("method", "route", "status"))
+HTTP_SECONDS = metrics.REGISTRY.histogram("manga_http_request_seconds", "Time from a request to the last byte of its response",
+                                          ("method", "route"))
+
+profiles = ProfileStore()
+# set for requests that asked for a profile, so the jobs they submit are profiled too
+profile_requested: ContextVar[bool] = ContextVar("profile_requested", default=False)
+
+
+class ObserveRequests:
+    # Plain ASGI rather than @app.middleware, so streamed responses are timed to their last
+    # chunk. With PROFILING_ENABLED=1, a request with ?profile=1 or "X-Profile: 1" runs under
+    # the sampling profiler; the report is at /profiles/<X-Profile-Id of the response>.
+    in_flight = 0
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        profile = PROFILING_ENABLED and "1" in (request.query_params.get("profile"), request.headers.get("x-profile"))
+        profile_id = uuid4().hex if profile else None
+        status = 500
+
+        async def observed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile_id:
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        started = time.perf_counter()
+        ObserveRequests.in_flight += 1
+        token = profile_requested.set(profile)
+        profiler = SamplingProfiler().start() if profile else None
+        try:
+            with metrics.trace() if profile else contextlib.nullcontext() as spans:
+                await self.app(scope, receive, observed_send)
+        finally:
+            profile_requested.reset(token)
+            ObserveRequests.in_flight -= 1
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status)
+            HTTP_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route)
+            if profiler is not None:
+                profiler.stop()
+                profiles.put(profile_id, profiler.report(spans))
+
+
+# ObserveRequests goes outside, so bodies UploadLimit turns away are counted too
+app.add_middleware(UploadLimit, limits={path: UPLOAD_BATCH_MAX_BYTES
+                                        for path in ("/crop_panels_batch/", "/colorize_batch/", "/chapter_pipeline/")})
+app.add_middleware(ObserveRequests)
+
+# MAGI and the colorizer live in worker processes so inference never blocks the event loop
+inference_pool = InferencePool(
+    {
+        "magi": "ai_models.magi_model:load_magi",
+        "colorizer": "ai_models.colorizer_model:load_colorizer",
+    },
+    workers=int(os.getenv("INFERENCE_WORKERS", 1)),
+    queue_size=int(os.getenv("INFERENCE_QUEUE_SIZE", 16)),
+    limits={
+        "crop_panels": int(os.getenv("CROP_PANELS_CONCURRENCY", 2)),
+        "colorize": int(os.getenv("COLORIZE_CONCURRENCY", 4)),
+    },
+    timeout=float(os.getenv("INFERENCE_TIMEOUT", 300)),
+    share_weights=os.getenv("INFERENCE_SHARE_WEIGHTS") == "1",
+    warm=MODEL_WARM_UP,
+)
+
+
+def cogvideox_worker():
+    from ai_models.cogvideox_run import get_worker
+
+    return get_worker()
+
+
+async def warm_up():
+    # in the background: the process answers /healthz meanwhile, and /readyz once it's done
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(
+            inference_pool.warm_up(),
+            *([cogvideox_worker().warm_up()] if "cogvideox" in MODEL_WARM_UP else []),
+        )
+    except Exception:
+        logger.exception("model warm-up failed")
+    else:
+        logger.info("models %s warm in %.2f s", MODEL_WARM_UP, time.perf_counter() - started)
+
+
+@app.on_event("startup")
+async def start_inference_pool():
+    app.state.warm_up = asyncio.create_task(warm_up())
+
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    inference_pool.shutdown()
+
+
+async def run_inference(endpoint: str, model_name: str, fn, *args):
+    try:
+        return await inference_pool.run(endpoint, model_name, fn, *args)
+    except PoolBusy:
+        raise HTTPException(status_code=429, detail="Inference queue is full, retry later")
+    except WorkerCrashed:
+        # the pool has already been restarted for the next request
+        raise HTTPException(status_code=503, detail="Inference worker crashed, retry later")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Inference timed out")
+
+
+# bump the revisions when weights or pre/post-processing change, so stale results stop matching
+MAGI_VERSION = {"model": "ragavsachdeva/magi", "revision": os.getenv("MAGI_REVISION", "main")}
+COLORIZER_VERSION = {"model": "manga-colorization-v2", "revision": os.getenv("COLORIZER_REVISION", "1")}
+
+result_cache = ResultCache(
+    os.getenv("RESULT_CACHE_DIR", "./cache"),
+    memory_bytes=int(os.getenv("RESULT_CACHE_MEMORY_MB", 256)) * 1024 * 1024,
+    disk_bytes=int(os.getenv("RESULT_CACHE_DISK_MB", 2048)) * 1024 * 1024,
+)
+
+def read_imagefile(file_bytes, max_size: tuple[int, int] | None = PAGE_MAX_SIZE) -> np.ndarray:
+    # `file_bytes`: bytes, or the spool file of an Upload
+    with metrics.span("image_decode"):
+        try:
+            return decode_image(file_bytes, max_size)
+        except ImageTooLarge as e:
+            raise HTTPException(413, str(e))
+        except InvalidImage as e:
+            raise HTTPException(400, str(e))
+
+
+async def read_image_upload(file: UploadFile) -> Upload:
+    # byte and pixel limits are checked from the upload's size and the image header, so
+    # oversized pages are turned away before they are decoded or queued. The upload stays
+    # in the parser's spool file: handlers decode from it, and jobs store a view of it.
+    try:
+        return await asyncio.to_thread(ingest_image, file)
+    except ImageTooLarge as e:
+        raise HTTPException(413, str(e))
+    except InvalidImage as e:
+        raise HTTPException(400, str(e))
+
+
+async def detect_panels_batch(images: list[np.ndarray]) -> list:
+    return await run_inference("crop_panels", "magi", detect_panels, images)
+
+
+panel_batcher = PanelBatcher(
+    detect_panels_batch,
+    max_batch=int(os.getenv("MAGI_MAX_BATCH", 8)),
+    max_wait_ms=float(os.getenv("MAGI_MAX_WAIT_MS", 10)),
+    max_concurrent_batches=inference_pool.workers,
 )
-model = model.to(device)
-model.eval()
 
 
-processor = model.processor
+CROP_MODES = ("json", "zip", "multipart", "bboxes")
 
 
-OUTPUT_DIR = Path("./output")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+async def page_panel_boxes(image_np: np.ndarray) -> list[tuple[int, int, int, int]]:
+    # the clamped rectangles crops are cut from, cached apart from any encoding
+    key = await asyncio.to_thread(image_key, image_np, task="panel_boxes", **MAGI_VERSION)
+    cached = await asyncio.to_thread(result_cache.get, key)
+    if cached is not None:
+        return [tuple(box) for box in json.loads(cached)]
+
+    boxes = crop_boxes(image_np.shape, await panel_batcher.submit(image_np))
+    await asyncio.to_thread(result_cache.put, key, json.dumps(boxes).encode())
+    return boxes
+
+
+async def page_panel_crops(image_np: np.ndarray, format: str = "png", level: int | None = None) -> list[str]:
+    key = await asyncio.to_thread(image_key, image_np, task="crop_panels", format=format, level=level, **MAGI_VERSION)
+    cached = await asyncio.to_thread(result_cache.get, key)
+    if cached is not None:
+        return json.loads(cached)
+
+    boxes = await page_panel_boxes(image_np)
+    encoded = await asyncio.gather(*encode_all(crop_image(image_np, boxes), format, level))
+    with metrics.span("base64_encode"):
+        encoded_images = [base64.b64encode(data).decode("utf-8") for data in encoded]
+    await asyncio.to_thread(result_cache.put, key, json.dumps(encoded_images).encode())
+    return encoded_images
+
+
+def check_crop_options(mode: str, format: str, level: int | None):
+    if mode not in CROP_MODES:
+        raise HTTPException(400, f"mode must be one of {', '.join(CROP_MODES)}")
+    if format not in FORMATS:
+        raise HTTPException(400, f"format must be one of {', '.join(FORMATS)}")
+    levels = FORMATS[format][3]
+    if level is not None and level not in levels:
+        raise HTTPException(400, f"level for {format} must be between {levels.start} and {levels.stop - 1}")
 
-def read_imagefile(file_bytes: bytes) -> np.ndarray:
-    img = Image.open(io.BytesIO(file_bytes)).convert("RGB")
-    return np.array(img)
 
 @app.post("/crop_panels/")
-async def crop_panels(file: UploadFile = File(...)):
-    contents = await file.read()
-    image_np = read_imagefile(contents)
-
-    with torch.no_grad():
-        results = model.predict_detections_and_associations([image_np])
-    panel_bboxes = results[0]["panels"]  
-    crops = processor.crop_image(image_np, panel_bboxes)
-    encoded_images = []
-    for i, crop_np in enumerate(crops):
-        crop_img = Image.fromarray(crop_np)
-        
-        buf = io.BytesIO()
-        crop_img.save(buf, format="PNG")
-        base64_str = base64.b64encode(buf.getvalue()).decode("utf-8")
-        encoded_images.append(base64_str)
-
-    return JSONResponse({"panel_crops": encoded_images})
+async def crop_panels(file: UploadFile = File(...), mode: str = Form("json"), format: str = Form("png"),
+                      level: int | None = Form(None)):
+    # json: base64 crops in one body (the original response); zip / multipart: crops
+    # streamed as binary parts while the rest are still encoding; bboxes: only the
+    # rectangles, for clients that crop the page themselves
+    check_crop_options(mode, format, level)
+    image_np = await asyncio.to_thread(read_imagefile, (await read_image_upload(file)).file)
+
+    if mode == "json":
+        return JSONResponse({"panel_crops": await page_panel_crops(image_np, format, level)})
+
+    boxes = await page_panel_boxes(image_np)
+    if mode == "bboxes":
+        h, w = image_np.shape[:2]
+        return JSONResponse({"width": w, "height": h, "panels": boxes})
+
+    encoded = encode_all(crop_image(image_np, boxes), format, level)
+    if mode == "zip":
+        return StreamingResponse(zip_stream(boxes, encoded, format), media_type="application/zip",
+                                 headers={"Content-Disposition": 'attachment; filename="panels.zip"'})
+    boundary = multipart_boundary()
+    return StreamingResponse(multipart_stream(boxes, encoded, format, boundary),
+                             media_type=f"multipart/mixed; boundary={boundary}")
+
+
+@app.post("/crop_panels_batch/")
+async def crop_panels_batch(files: list[UploadFile] = File(...)):
+    pages = [await asyncio.to_thread(read_imagefile, (await read_image_upload(file)).file) for file in files]
+
+    page_crops = await asyncio.gather(*(page_panel_crops(image_np) for image_np in pages))
+    results = [{"panel_crops": crops} for crops in page_crops]
+
+    return JSONResponse({"pages": results})
+
+
+def encode_png(image_np: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    with metrics.span("png_encode"):
+        Image.fromarray(image_np).save(buf, format="PNG")
+    return buf.getvalue()
 
 
 @app.post("/colorize/")
 async def colorize(file: UploadFile = File(...)):
-    contents = await file.read()
-    input_img = Image.open(io.BytesIO(contents)).convert("RGB")
+    image_np = await asyncio.to_thread(read_imagefile, (await read_image_upload(file)).file)
+
+    key = await asyncio.to_thread(image_key, image_np, task="colorize", **COLORIZER_VERSION)
+    colorized = await asyncio.to_thread(result_cache.get, key)
+    if colorized is None:
+        colorized_np = await run_inference("colorize", "colorizer", colorize_array, image_np)
+        colorized = await asyncio.to_thread(encode_png, colorized_np)
+        await asyncio.to_thread(result_cache.put, key, colorized)
 
-    uid = str(uuid4())
-    input_path = OUTPUT_DIR / f"{uid}.png"
-    input_img.save(input_path)
+    with metrics.span("base64_encode"):
+        encoded = base64.b64encode(colorized).decode("utf-8")
+    return JSONResponse({"colorized_image": encoded})
 
-    main_colorize(str(input_path))
 
-    colorized_path = input_path.with_stem(f"{input_path.stem}_colorized")
-    if not colorized_path.exists():
-        raise HTTPException(status_code=500, detail=str(e))
+@app.post("/colorize_batch/")
+async def colorize_pages(files: list[UploadFile] = File(...)):
+    pages = [await asyncio.to_thread(read_imagefile, (await read_image_upload(file)).file) for file in files]
+    keys = [await asyncio.to_thread(image_key, image_np, task="colorize", **COLORIZER_VERSION) for image_np in pages]
+    results = [await asyncio.to_thread(result_cache.get, key) for key in keys]
 
-    with open(colorized_path, "rb") as img_file:
-        encoded = base64.b64encode(img_file.read()).decode("utf-8")
+    missing = [i for i, colorized in enumerate(results) if colorized is None]
+    if missing:
+        colorized_pages = await run_inference("colorize", "colorizer", colorize_batch, [pages[i] for i in missing])
+        for i, colorized_np in zip(missing, colorized_pages):
+            results[i] = await asyncio.to_thread(encode_png, colorized_np)
+            await asyncio.to_thread(result_cache.put, keys[i], results[i])
 
-    return JSONResponse({"colorized_image": encoded})
+    with metrics.span("base64_encode"):
+        encoded = [base64.b64encode(colorized).decode("utf-8") for colorized in results]
+    return JSONResponse({"colorized_images": encoded})
 
 
-TASKS: dict[str, dict] = {}
+@app.get("/cache_stats/")
+def cache_stats():
+    return result_cache.snapshot()
 
-async def do_generate(task_id: str, b64_uri: str, prompt: str):
-    TASKS[task_id]["status"] = "running"
-    handler = await fal_client.submit_async(
-        "fal-ai/vidu/q1/image-to-video",
-        arguments={"image_url": b64_uri, "prompt": prompt},
-    )
-    result = await handler.get()
-    TASKS[task_id]["status"] = "done"
-    TASKS[task_id]["result"] = result
 
-@app.post("/vidu_animate/", status_code=202)
-async def enqueue(file: UploadFile = File(...), prompt: str = Form(...), bg: BackgroundTasks = ...):
-    contents = await file.read()
-    b64 = base64.b64encode(contents).decode()
-    uri = f"data:{file.content_type};base64,{b64}"
+@app.get("/coalesce_stats/")
+async def coalesce_stats():
+    # submissions that were attached to an identical pending, running or recently finished
+    # generation instead of calling the provider again
+    return {"upstream_calls_saved": await asyncio.to_thread(job_store.coalesced)}
+
+
+def report_progress(job: dict):
+    async def report(event):
+        await asyncio.to_thread(job_store.progress, job["id"], event.as_dict())
+    return report
+
+
+async def do_generate(job: dict):
+    from ai_models.vidu_api_model import vidu_generate
+
+    return await vidu_generate(job["data"], job["payload"]["prompt"], job["payload"]["content_type"],
+                               on_event=report_progress(job))
+
+
+async def do_wan(job: dict):
+    from ai_models.wan_api_model import wan_generate
+
+    return await wan_generate(job["data"], job["payload"]["prompt"], job["payload"]["content_type"],
+                              on_event=report_progress(job))
+
+
+async def do_cogvideox(job: dict):
+    from ai_models.cogvideox_run import cogvideox_generate
+
+    tmp_path = f"/tmp/{uuid4()}{job['payload']['suffix']}"
+    with open(tmp_path, "wb") as out:
+        out.write(job["data"])
+    try:
+        return await cogvideox_generate(job["payload"]["prompt"], tmp_path, on_event=report_progress(job))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def manual_job(effect: str):
+    async def run(job: dict):
+        from anime_timeline import CANVAS
+        from manual_creation import Manual
+
+        # effects are rendered no larger than the video canvas, so neither is the page;
+        # decoded off the event loop, which the other jobs and requests share
+        manual = Manual(await asyncio.to_thread(read_imagefile, job["data"], CANVAS))
+        return await asyncio.to_thread(getattr(manual, effect), quality=job["payload"].get("quality", DEFAULT_QUALITY))
+    return run
+
+
+async def do_manual_timeline(job: dict):
+    from anime_timeline import CANVAS
+    from manual_creation import Manual
+
+    manual = Manual(await asyncio.to_thread(read_imagefile, job["data"], CANVAS))
+    return await asyncio.to_thread(manual.timeline, Timeline.from_dict(job["payload"]["spec"]),
+                                   quality=job["payload"].get("quality", DEFAULT_QUALITY))
 
-    task_id = str(uuid4())
-    TASKS[task_id] = {"status": "pending", "result": None}
-    bg.add_task(do_generate, task_id, uri, prompt)
 
-    return JSONResponse({"task_id": task_id, "status_url": f"/vidu_status/{task_id}"})
+async def do_create_anime(job: dict):
+    from create_anime import create_anime
 
+    return await asyncio.to_thread(create_anime, job["payload"]["videos"], music_url=job["payload"]["music"],
+                                   quality=job["payload"].get("quality", DEFAULT_QUALITY),
+                                   transition_style=job["payload"].get("transition_style", "slide"))
+
+
+async def animate_panel(panel_spec, panel: np.ndarray, quality: str = DEFAULT_QUALITY) -> str:
+    if panel_spec.effect in GENERATED_EFFECTS:
+        from ai_models.vidu_api_model import vidu_generate
+        from ai_models.wan_api_model import wan_generate
+
+        generate = vidu_generate if panel_spec.effect == "vidu" else wan_generate
+        result = await generate(await asyncio.to_thread(encode_image, panel), panel_spec.prompt, "image/png")
+        return result["video"]["url"]
+    # manual effects are CPU bound, so panels render side by side in worker processes
+    url, spans = await asyncio.wrap_future(effect_pool().submit(render_effect, panel_spec.effect, panel, quality))
+    metrics.replay(spans)
+    return url
+
+
+async def assemble_chapter(urls: list[str], spec: ChapterSpec) -> dict:
+    from create_anime import create_anime
+
+    return await asyncio.to_thread(create_anime, urls, transition=spec.transition, music_url=spec.music, quality=spec.quality,
+                                   transition_style=spec.transition_style)
+
+
+# the stages of /chapter_pipeline/, with panels passed between them as arrays
+chapter_ops = SimpleNamespace(
+    decode=lambda data: asyncio.to_thread(read_imagefile, data),
+    detect=page_panel_boxes,
+    colorize=lambda crops: run_inference("colorize", "colorizer", colorize_batch, crops),
+    animate=animate_panel,
+    assemble=assemble_chapter,
+)
+
+
+async def do_chapter(job: dict):
+    pages, offset = [], 0
+    for size in job["payload"]["page_sizes"]:
+        pages.append(job["data"][offset:offset + size])
+        offset += size
+
+    progress_lock = asyncio.Lock()
+
+    async def on_stage(stage: str, timings: dict):
+        # the lock hands out turns in call order, so a later summary is never overwritten
+        async with progress_lock:
+            await asyncio.to_thread(job_store.progress, job["id"], {"stage": stage, "timings": timings})
+
+    return await run_chapter(pages, ChapterSpec.from_dict(job["payload"]["spec"]), chapter_ops, on_stage)
+
+
+def profiled(handler):
+    # jobs submitted by a profiled request run under the sampler too; the report is kept
+    # under the job id
+    async def run(job: dict):
+        if not (PROFILING_ENABLED and job["payload"].get("profile")):
+            return await handler(job)
+        profiler = SamplingProfiler().start()
+        try:
+            with metrics.trace() as spans:
+                return await handler(job)
+        finally:
+            profiler.stop()
+            profiles.put(job["id"], profiler.report(spans))
+    return run
+
+
+job_store = make_job_store()
+job_runner = JobRunner(
+    job_store,
+    {kind: profiled(handler) for kind, handler in {
+        "vidu_animate": do_generate,
+        "wan_animate": do_wan,
+        "cogvideox_animate": do_cogvideox,
+        "manual_reveal": manual_job("reveal"),
+        "manual_zoom": manual_job("zoom"),
+        "manual_shake": manual_job("shake"),
+        "manual_timeline": do_manual_timeline,
+        "create_anime": do_create_anime,
+        "chapter_pipeline": do_chapter,
+    }.items()},
+    concurrency=int(os.getenv("JOB_CONCURRENCY", 4)),
+)
+
+# read on every scrape of /metrics
+metrics.REGISTRY.gauge("manga_http_requests_in_flight", "Requests being served by this process",
+                       lambda: ObserveRequests.in_flight)
+metrics.REGISTRY.gauge("manga_job_queue_depth", "Pending jobs in the store, by kind", job_store.depth, ("kind",))
+metrics.REGISTRY.gauge("manga_jobs_in_flight", "Jobs this process is running, by kind", job_runner.in_flight, ("kind",))
+metrics.REGISTRY.gauge("manga_inference_in_flight", "Calls admitted to the inference pool, by endpoint",
+                       lambda: dict(inference_pool.per_endpoint), ("endpoint",))
+
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    await job_runner.stop()
+
+
+@app.on_event("shutdown")
+def stop_effect_pool():
+    shutdown_effect_pool()
+
+
+@app.on_event("shutdown")
+def stop_cogvideox_worker():
+    if "ai_models.cogvideox_run" in sys.modules:
+        cogvideox_worker().stop()
+
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+BOOT = {"import_seconds": round(IMPORT_SECONDS, 3), "startup_seconds": None}
+
+
+@app.on_event("startup")
+async def report_boot():
+    # registered last, so this runs after the other startup hooks (warm-up continues in the background)
+    BOOT["startup_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    logger.info("app imported in %.3f s, started in %.3f s", IMPORT_SECONDS, BOOT["startup_seconds"])
+
+
+def model_status() -> dict[str, dict]:
+    models = inference_pool.status()
+    if "ai_models.cogvideox_run" in sys.modules:
+        models["cogvideox"] = cogvideox_worker().status()
+    else:
+        models["cogvideox"] = {"state": "unloaded", "load_seconds": None, "error": None}
+    return models
+
+
+@app.get("/healthz")
+def healthz():
+    # liveness: the process is up and its event loop answers
+    return {"status": "ok", "uptime_seconds": round(time.perf_counter() - IMPORT_STARTED, 3), **BOOT}
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    # a plain def, so the store query behind the queue depth runs in the threadpool
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/profiles/{profile_id}")
+def profile_report(profile_id: str, format: str = "json"):
+    # a request's profile is under its X-Profile-Id, a job's under its task id; format=folded
+    # gives the stacks for flamegraph.pl or speedscope
+    report = profiles.get(profile_id)
+    if report is None:
+        raise HTTPException(404, "Profile not found (profiles are kept by the process that ran the request)")
+    if format == "folded":
+        return PlainTextResponse(report["folded"])
+    return report
+
+
+@app.get("/readyz")
+def readyz():
+    # readiness: the job runner is up and every model in MODEL_WARM_UP has loaded; models
+    # left to load on first use are listed but don't hold readiness back
+    models = model_status()
+    ready = job_runner.task is not None and all(models[name]["state"] == READY for name in MODEL_WARM_UP if name in models)
+    body = {"status": "ready" if ready else "starting", "warm_up": MODEL_WARM_UP, "models": models, **BOOT}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+async def submit_job(kind: str, payload: dict, data: bytes | memoryview | None = None, status_prefix: str = "/jobs",
+                     key: str | None = None) -> JSONResponse:
+    if profile_requested.get():
+        payload = {**payload, "profile": True}
+    task_id = await asyncio.to_thread(job_store.create, kind, payload, data, key)
+    job_runner.notify()
+    return JSONResponse({"task_id": task_id, "status_url": f"{status_prefix}/{task_id}"}, status_code=202)
+
+
+@app.get("/jobs/{task_id}")
 @app.get("/vidu_status/{task_id}")
-def status(task_id: str):
-    task = TASKS.get(task_id)
+async def status(task_id: str):
+    task = await asyncio.to_thread(job_store.get, task_id)
     if not task:
         raise HTTPException(404, "Task not found")
-    return {"status": task["status"], **({"result": task["result"]} if task["status"]=="done" else {})}
+    return public_view(task)
+
 
+@app.delete("/jobs/{task_id}")
+async def cancel_job(task_id: str):
+    if not await asyncio.to_thread(job_store.cancel, task_id):
+        task = await asyncio.to_thread(job_store.get, task_id)
+        if not task:
+            raise HTTPException(404, "Task not found")
+        raise HTTPException(409, f"Task is already {task['status']}")
+    job_runner.cancel(task_id)
+    return public_view(await asyncio.to_thread(job_store.get, task_id))
 
-@app.post("/wan_animate/")
+
+@app.post("/vidu_animate/", status_code=202)
+async def enqueue(file: UploadFile = File(...), prompt: str = Form(...)):
+    upload = await read_image_upload(file)
+    from ai_models.vidu_api_model import vidu_key
+
+    key = vidu_key(upload.sha256, prompt, upload.content_type)
+    return await submit_job("vidu_animate", {"prompt": prompt, "content_type": upload.content_type}, upload.view(),
+                            "/vidu_status", key)
+
+
+@app.post("/wan_animate/", status_code=202)
 async def wan_animation(file: UploadFile = File(...), prompt: str = Form(...)):
-    contents = await file.read()
-    base64_file = base64.b64encode(contents).decode("utf-8")
-    base64_uri = f"data:{file.content_type};base64,{base64_file}"
+    upload = await read_image_upload(file)
+    from ai_models.wan_api_model import wan_key
 
-    try:
-        result = await wan_generate(base64_uri, prompt)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    key = wan_key(upload.sha256, prompt, upload.content_type)
+    return await submit_job("wan_animate", {"prompt": prompt, "content_type": upload.content_type}, upload.view(), key=key)
 
-    return JSONResponse(content=result)
 
-@app.post("/cogvideox_animate/")
+@app.post("/cogvideox_animate/", status_code=202)
 async def cogvideox_animation(file: UploadFile = File(...), prompt: str = Form(...)):
-    tmp_path = f"/tmp/{uuid4()}{os.path.splitext(file.filename)[1] or ".png"}"
-    try:
-        with open(tmp_path, "wb") as out:
-            shutil.copyfileobj(file.file, out)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    upload = await read_image_upload(file)
+    suffix = os.path.splitext(file.filename or "")[1] or ".png"
+    return await submit_job("cogvideox_animate", {"prompt": prompt, "suffix": suffix}, upload.view())
 
-    try:
-        result = cogvideox_generate(prompt=prompt, image_or_video_path=tmp_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
-    return JSONResponse(content=result)
 
+def quality_payload(quality: str) -> dict:
+    # drafts keep their input after finishing, so POST /jobs/{id}/rerender can render them again
+    if quality not in QUALITY_TIERS:
+        raise HTTPException(400, f"quality must be one of {', '.join(QUALITY_TIERS)}")
+    return {"quality": quality, "keep_data": quality == "draft"}
 
-@app.post("/manual_reveal/")
-async def manual_reveal(file: UploadFile = File(...)):
-    contents = await file.read()
-    image_np = read_imagefile(contents)
 
-    try:
-        manual = Manual(image_np)
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, manual.reveal)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.post("/manual_reveal/", status_code=202)
+async def manual_reveal(file: UploadFile = File(...), quality: str = Form(DEFAULT_QUALITY)):
+    return await submit_job("manual_reveal", quality_payload(quality), (await read_image_upload(file)).view())
 
-    return JSONResponse(content=result)
 
-@app.post("/manual_zoom/")
-async def manual_zoom(file: UploadFile = File(...)):
-    contents = await file.read()
-    image_np = read_imagefile(contents)
+@app.post("/manual_zoom/", status_code=202)
+async def manual_zoom(file: UploadFile = File(...), quality: str = Form(DEFAULT_QUALITY)):
+    return await submit_job("manual_zoom", quality_payload(quality), (await read_image_upload(file)).view())
+
+
+@app.post("/manual_shake/", status_code=202)
+async def manual_shake(file: UploadFile = File(...), quality: str = Form(DEFAULT_QUALITY)):
+    return await submit_job("manual_shake", quality_payload(quality), (await read_image_upload(file)).view())
 
-    try:
-        manual = Manual(image_np)
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, manual.zoom)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
 
-    return JSONResponse(content=result)
+@app.post("/manual_timeline/", status_code=202)
+async def manual_timeline(file: UploadFile = File(...), spec: str = Form(...), quality: str = Form(DEFAULT_QUALITY)):
+    # spec as in effect_timeline.Timeline, e.g.
+    # {"tracks": [{"effect": "reveal", "duration": 1}, {"effect": "zoom", "duration": 3, "end_scale": 1.3},
+    #             {"effect": "shake", "start": 1, "duration": 3}]}
+    try:
+        spec_data = json.loads(spec)
+        Timeline.from_dict(spec_data)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid spec: {e}")
+    return await submit_job("manual_timeline", {"spec": spec_data, **quality_payload(quality)},
+                            (await read_image_upload(file)).view())
+
+
+MAX_ANIME_VIDEOS = int(os.getenv("CREATE_ANIME_MAX_VIDEOS", 64))
+
+
+def anime_payload(data) -> dict:
+    # {"videos": [url, ...], "music": url or null, "transition_style": "slide"}
+    if not isinstance(data, dict) or "videos" not in data or "music" not in data:
+        raise ValueError("Expected a JSON object with 'videos' and 'music'")
+    videos, music = data["videos"], data["music"]
+    if not isinstance(videos, list) or not videos or not all(is_url(url) for url in videos):
+        raise ValueError("'videos' must be a non-empty list of http(s) URLs")
+    if len(videos) > MAX_ANIME_VIDEOS:
+        raise ValueError(f"at most {MAX_ANIME_VIDEOS} videos")
+    if music is not None and not is_url(music):
+        raise ValueError("'music' must be an http(s) URL or null")
+    style = data.get("transition_style", "slide")
+    if not isinstance(style, str):
+        raise ValueError("'transition_style' must be a string")
+    check_transition_style(style)
+    return {"videos": videos, "music": music, "transition_style": style}
+
+
+@app.post("/create_anime/", status_code=202)
+async def create_anime_from_urls(file: UploadFile = File(...), quality: str = Form(DEFAULT_QUALITY)):
+    try:
+        payload = anime_payload(await asyncio.to_thread(ingest_json, file))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await submit_job("create_anime", {**payload, **quality_payload(quality)})
 
-@app.post("/manual_shake/")
-async def manual_shake(file: UploadFile = File(...)):
-    contents = await file.read()
-    image_np = read_imagefile(contents)
 
+@app.post("/chapter_pipeline/", status_code=202)
+async def chapter_pipeline(files: list[UploadFile] = File(...), spec: str = Form("{}")):
+    # pages in reading order; spec as in chapter_pipeline.ChapterSpec, e.g.
+    # {"effect": "zoom", "music": "...", "panels": {"0/2": {"effect": "vidu", "prompt": "..."}}}
     try:
-        manual = Manual(image_np)
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, manual.shake)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    return JSONResponse(content=result)
-
-
-@app.post("/create_anime/")
-async def create_anime_from_urls(file: UploadFile = File(...)):
-    if file.content_type != "application/json":
-        raise HTTPException(status_code=400)
-    content = await file.read()
-    
-    data = json.loads(content)
-
-    videos = data["videos"]
-    music = data["music"]
-    result = create_anime(videos, music_url=music)
-    return JSONResponse(content=result)
\ No newline at end of file
+        spec_data = json.loads(spec)
+        ChapterSpec.from_dict(spec_data)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid spec: {e}")
+    pages = [await read_image_upload(file) for file in files]
+    payload = {"spec": spec_data, "page_sizes": [page.size for page in pages],
+               "keep_data": spec_data.get("quality") == "draft"}
+    return await submit_job("chapter_pipeline", payload, b"".join(page.view() for page in pages))
+
+
+RERENDERABLE = ("manual_reveal", "manual_zoom", "manual_shake", "manual_timeline", "create_anime", "chapter_pipeline")
+
+
+@app.post("/jobs/{task_id}/rerender", status_code=202)
+async def rerender(task_id: str, quality: str = Form("final")):
+    # the same job spec and input as `task_id` (typically a draft) at another quality
+    job = await asyncio.to_thread(job_store.get, task_id)
+    if not job:
+        raise HTTPException(404, "Task not found")
+    if job["kind"] not in RERENDERABLE:
+        raise HTTPException(400, f"{job['kind']} jobs have no quality to change")
+    data = await asyncio.to_thread(job_store.data, task_id) if job["kind"] != "create_anime" else None
+    if job["kind"] != "create_anime" and data is None:
+        raise HTTPException(410, "The input of this task is no longer stored; only drafts keep it after finishing")
+    if job["kind"] == "chapter_pipeline":
+        if quality not in QUALITY_TIERS:
+            raise HTTPException(400, f"quality must be one of {', '.join(QUALITY_TIERS)}")
+        payload = {**job["payload"], "spec": {**job["payload"]["spec"], "quality": quality}, "keep_data": quality == "draft"}
+    else:
+        payload = {**job["payload"], **quality_payload(quality)}
+    payload.pop("profile", None)
+    return await submit_job(job["kind"], payload, data)
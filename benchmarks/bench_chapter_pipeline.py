@@ -0,0 +1,106 @@
+import asyncio
+import base64
+import json
+import os
+import socket
+import sys
+import time
+
+import httpx
+import uvicorn
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from stubs import serve_s3, stub_detect_panels
+
+if __name__ == '__main__':
+    # effect and render workers are spawned processes: they find S3 through the environment
+    endpoint, s3_server, objects = serve_s3(latency_s=0.005)
+    os.environ.update({
+        "S3_ENDPOINT_URL": endpoint, "ACCESS_KEY": "bench", "SECRET_KEY": "bench", "BUCKET_NAME": "bench",
+        "JOB_STORE": "memory", "MODEL_WARM_UP": "",
+        # the multi-call client colorizes every panel at once; don't let the limiter answer 429
+        "COLORIZE_CONCURRENCY": "64", "INFERENCE_QUEUE_SIZE": "64",
+    })
+
+import app
+from bench_crop_panels import manga_page
+
+POLL = 0.05
+
+
+async def wait_job(client: httpx.AsyncClient, task_id: str) -> dict:
+    while True:
+        view = (await client.get(f"/jobs/{task_id}")).json()
+        if view["status"] == "done":
+            return view["result"]
+        if view["status"] != "pending" and view["status"] != "running":
+            raise RuntimeError(view)
+        await asyncio.sleep(POLL)
+
+
+async def multi_call(client: httpx.AsyncClient, page: bytes, effect: str) -> tuple[dict, int]:
+    # what a client does today: crop, colorize each panel, animate each panel, assemble
+    sent = 0
+
+    async def post(path, **kwargs):
+        nonlocal sent
+        response = await client.post(path, **kwargs)
+        response.raise_for_status()
+        sent += int(response.request.headers["content-length"]) + len(response.content)
+        return response.json()
+
+    crops = (await post("/crop_panels/", files={"file": ("page.png", page, "image/png")}))["panel_crops"]
+    colorized = await asyncio.gather(*(
+        post("/colorize/", files={"file": ("panel.png", base64.b64decode(crop), "image/png")}) for crop in crops
+    ))
+    tasks = await asyncio.gather(*(
+        post(f"/manual_{effect}/", files={"file": ("panel.png", base64.b64decode(c["colorized_image"]), "image/png")})
+        for c in colorized
+    ))
+    videos = await asyncio.gather(*(wait_job(client, task["task_id"]) for task in tasks))
+    body = json.dumps({"videos": [video["file_url"] for video in videos], "music": None}).encode()
+    task = await post("/create_anime/", files={"file": ("videos.json", body, "application/json")})
+    return await wait_job(client, task["task_id"]), sent
+
+
+async def pipeline(client: httpx.AsyncClient, page: bytes, effect: str) -> tuple[dict, int]:
+    spec = json.dumps({"effect": effect, "colorize": True})
+    response = await client.post("/chapter_pipeline/", files={"files": ("page.png", page, "image/png")}, data={"spec": spec})
+    response.raise_for_status()
+    return await wait_job(client, response.json()["task_id"]), int(response.request.headers["content-length"]) + len(response.content)
+
+
+async def main(effect: str = os.getenv("BENCH_EFFECT", "reveal")):
+    app.inference_pool.loaders.update(magi="stubs:load_stub_magi", colorizer="stubs:load_stub_colorizator")
+    app.detect_panels = stub_detect_panels
+    app.result_cache.get = lambda key: None
+    app.result_cache.put = lambda key, data: None
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app.app, port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    page = manga_page(720, 1080)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        # warm the inference and effect workers so neither flow pays for process start-up
+        await pipeline(client, page, effect)
+        for label, flow in (("multi-call", multi_call), ("pipeline", pipeline)):
+            started = time.perf_counter()
+            result, sent = await flow(client, page, effect)
+            print(f"{label:10s} {time.perf_counter() - started:6.2f} s end to end | {sent / 1e6:6.2f} MB over HTTP")
+        print("pipeline stages:", json.dumps(result["timings"]))
+
+    server.should_exit = True
+    await serving
+    s3_server.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
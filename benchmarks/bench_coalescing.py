@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from stubs import install_fal, serve_fal
+from bench_generation_client import noisy_png
+
+
+async def wait_done(client: httpx.AsyncClient, task_id: str) -> dict:
+    while True:
+        view = (await client.get(f"/jobs/{task_id}")).json()
+        if view["status"] in ("done", "failed"):
+            return view
+        await asyncio.sleep(0.05)
+
+
+async def burst(client: httpx.AsyncClient, endpoint: str, requests: list[tuple[bytes, str]]) -> tuple[float, set]:
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(
+        client.post(endpoint, files={"file": ("page.png", image, "image/png")}, data={"prompt": prompt})
+        for image, prompt in requests
+    ))
+    task_ids = [r.json()["task_id"] for r in responses]
+    await asyncio.gather(*(wait_done(client, task_id) for task_id in set(task_ids)))
+    return time.perf_counter() - start, set(task_ids)
+
+
+async def main(store: str):
+    os.environ["JOB_STORE"] = store
+    os.environ["JOB_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+    os.environ["GENERATION_POLL_INTERVAL"] = "0.05"
+    base, server, stats = serve_fal(run_s=0.5, queue_s=0.05)
+    install_fal(base)
+
+    import app
+
+    app.job_runner.start()
+    images = [noisy_png(seed, side=256) for seed in range(4)]
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        # a user double-clicking, a retrying client and a few users on the same page: 40
+        # submissions, 8 distinct (image, prompt) pairs, per endpoint
+        requests = [(images[i % 4], f"prompt {i // 4 % 2}") for i in range(40)]
+        for endpoint in ("/vidu_animate/", "/wan_animate/"):
+            submits = stats["submits"]
+            elapsed, task_ids = await burst(client, endpoint, requests)
+            print(f"{store:6s} {endpoint:15s} 40 requests -> {len(task_ids)} jobs, "
+                  f"{stats['submits'] - submits} upstream calls, {elapsed:.2f} s")
+
+        # the same burst again inside the reuse TTL is answered from the finished jobs
+        submits = stats["submits"]
+        elapsed, task_ids = await burst(client, "/vidu_animate/", requests)
+        print(f"{store:6s} repeat vidu      40 requests -> {len(task_ids)} jobs, "
+              f"{stats['submits'] - submits} upstream calls, {elapsed:.2f} s")
+        print(f"{store:6s} /coalesce_stats/ {(await client.get('/coalesce_stats/')).json()}")
+    await app.job_runner.stop()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "sqlite"))
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from stubs import serve_s3
+
+# the worker is a spawned process: everything it needs goes through the environment
+endpoint, server, objects = serve_s3()
+os.environ.update({
+    "S3_ENDPOINT_URL": endpoint, "ACCESS_KEY": "bench", "SECRET_KEY": "bench", "BUCKET_NAME": "bench",
+    "COGVIDEOX_LOADER": "ai_models.cogvideox_run:load_fake_pipeline",
+    "COGVIDEOX_FAKE_LOAD_SECONDS": os.getenv("COGVIDEOX_FAKE_LOAD_SECONDS", "5"),
+    "COGVIDEOX_FAKE_STEPS": "50", "COGVIDEOX_FAKE_STEP_SECONDS": "0.02",
+})
+
+from ai_models.cogvideox_run import CogVideoXWorker
+
+
+async def timed(worker: CogVideoXWorker, image_path: str, events: list | None = None) -> float:
+    start = time.perf_counter()
+    await worker.generate("a anime boy is talking", image_path, 16, on_event=events.append if events is not None else None)
+    return time.perf_counter() - start
+
+
+async def main(requests: int = 4):
+    image_path = os.path.join(tempfile.mkdtemp(), "page.png")
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (640, 960, 3), dtype=np.uint8)).save(image_path)
+
+    # before: every request started python, imported everything and loaded the model
+    cold = []
+    for _ in range(requests):
+        worker = CogVideoXWorker()
+        cold.append(await timed(worker, image_path))
+        worker.stop()
+    print(f"process per request: {np.mean(cold):.2f} s per request")
+
+    worker = CogVideoXWorker()
+    start = time.perf_counter()
+    await worker.warm_up()
+    print(f"warm worker: loaded in {time.perf_counter() - start:.2f} s (once)")
+    events = []
+    warm = [await timed(worker, image_path, events if i == 0 else None) for i in range(requests)]
+    print(f"warm worker: {np.mean(warm):.2f} s per request")
+    stages = [e.stage for e in events]
+    print(f"progress: {stages.count('running')} step events, stages {list(dict.fromkeys(stages))}")
+
+    # cancel one job mid-run while another waits behind it
+    first = asyncio.ensure_future(timed(worker, image_path))
+    second = asyncio.ensure_future(timed(worker, image_path))
+    await asyncio.sleep(0.4)
+    start = time.perf_counter()
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+    print(f"cancel: running job stopped after {time.perf_counter() - start:.3f} s, "
+          f"next job finished in {await second:.2f} s")
+    worker.stop()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+import base64
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from uuid import uuid4
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from ai_models.colorizer_model import colorize_array
+from bench_frame_engine import synthetic_page
+from stubs import StubColorizator, stub_main_colorize
+
+
+def through_files(upload: bytes, output_dir: str) -> str:
+    # what /colorize/ used to do around main_colorize
+    input_img = Image.open(io.BytesIO(upload)).convert("RGB")
+    input_path = os.path.join(output_dir, f"{uuid4()}.png")
+    input_img.save(input_path)
+    stub_main_colorize(input_path)
+    with open(input_path.replace(".png", "_colorized.png"), "rb") as img_file:
+        return base64.b64encode(img_file.read()).decode("utf-8")
+
+
+def in_memory(upload: bytes, colorizator) -> str:
+    image_np = np.array(Image.open(io.BytesIO(upload)).convert("RGB"))
+    buf = io.BytesIO()
+    Image.fromarray(colorize_array(colorizator, image_np)).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+def timed(fn, *args, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+if __name__ == '__main__':
+    repeat = int(os.getenv("BENCH_REPEAT", 5))
+    buf = io.BytesIO()
+    Image.fromarray(synthetic_page(1200, 1800)).save(buf, format="PNG")
+    upload = buf.getvalue()
+
+    output_dir = tempfile.mkdtemp()
+    try:
+        files_ms = timed(through_files, upload, output_dir, repeat=repeat)
+        left_behind = len(os.listdir(output_dir))
+    finally:
+        shutil.rmtree(output_dir)
+    memory_ms = timed(in_memory, upload, StubColorizator(), repeat=repeat)
+
+    print(f"through files: {files_ms:7.1f} ms/page ({left_behind} files left in the output dir)")
+    print(f"in memory:     {memory_ms:7.1f} ms/page (0 files)")
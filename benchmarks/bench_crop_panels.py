@@ -0,0 +1,112 @@
+import asyncio
+import io
+import os
+import socket
+import sys
+import time
+
+import httpx
+import numpy as np
+import uvicorn
+from PIL import Image, ImageDraw
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+os.environ.setdefault("JOB_STORE", "memory")
+
+import app
+import panel_encoding
+
+ROWS, COLS = 5, 2
+
+
+def manga_page(width: int = 1654, height: int = 2339, seed: int = 0) -> bytes:
+    # A4 at 200 dpi: white gutters, 10 bordered panels with line art, screentone and grain
+    rng = np.random.default_rng(seed)
+    page = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    for r in range(ROWS):
+        for c in range(COLS):
+            x1, y1 = 40 + c * (width - 40) // COLS, 40 + r * (height - 40) // ROWS
+            x2, y2 = x1 + (width - 40) // COLS - 40, y1 + (height - 40) // ROWS - 40
+            draw.rectangle((x1, y1, x2, y2), outline=0, width=6)
+            for _ in range(60):
+                draw.line([tuple(rng.integers((x1, y1), (x2, y2))) for _ in range(2)], fill=0, width=int(rng.integers(1, 5)))
+    pixels = np.asarray(page, dtype=np.int16)
+    yy, xx = np.mgrid[:height, :width]
+    tone = ((xx % 8 < 3) & (yy % 8 < 3) & (yy > height // 3) & (yy < 2 * height // 3))
+    pixels = np.where(tone & (pixels > 128), 90, pixels) + rng.normal(0, 6, pixels.shape)
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).convert("RGB").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+async def grid_panels(image: np.ndarray):
+    # stands in for MAGI so only the response path is measured
+    h, w = image.shape[:2]
+    return [[40 + c * (w - 40) / COLS, 40 + r * (h - 40) / ROWS,
+             c * (w - 40) / COLS + (w - 40) / COLS, r * (h - 40) / ROWS + (h - 40) / ROWS]
+            for r in range(ROWS) for c in range(COLS)]
+
+
+async def measure(client: httpx.AsyncClient, page: bytes, **form) -> tuple[float, float, int]:
+    started = time.perf_counter()
+    first, size = None, 0
+    async with client.stream("POST", "/crop_panels/", files={"file": ("page.png", page, "image/png")}, data=form) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw():
+            if first is None:
+                first = time.perf_counter() - started
+            size += len(chunk)
+    return first, time.perf_counter() - started, size
+
+
+async def main(runs: int = 5):
+    app.panel_batcher.submit = grid_panels
+    app.result_cache.get = lambda key: None  # every request does the full work
+    app.result_cache.put = lambda key, data: None
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app.app, port=port, log_level="warning", lifespan="off"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    page = manga_page()
+    print(f"page: 1654x2339, {ROWS * COLS} panels, upload {len(page) / 1e6:.2f} MB, "
+          f"{panel_encoding.encode_pool._max_workers} encode threads")
+    cases = [
+        ("json png", {}),
+        ("json webp q90", {"format": "webp"}),
+        ("zip png", {"mode": "zip"}),
+        ("zip png level 1", {"mode": "zip", "level": "1"}),
+        ("multipart png", {"mode": "multipart"}),
+        ("multipart webp q90", {"mode": "multipart", "format": "webp"}),
+        ("multipart jpeg q90", {"mode": "multipart", "format": "jpeg"}),
+        ("bboxes", {"mode": "bboxes"}),
+    ]
+    # what the endpoint did before: PNG-encode the crops one after another on the event loop
+    image = app.read_imagefile(page)
+    crops = app.crop_image(image, app.crop_boxes(image.shape, await grid_panels(image)))
+    started = time.perf_counter()
+    for crop in crops:
+        panel_encoding.encode_image(crop)
+    print(f"serial png encode of the crops: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+        await measure(client, page)
+        for label, form in cases:
+            results = [await measure(client, page, **form) for _ in range(runs)]
+            ttfb, total, size = (np.median([r[i] for r in results]) for i in range(3))
+            print(f"{label:20s} {size / 1e6:7.3f} MB | TTFB {ttfb * 1000:7.1f} ms | total {total * 1000:7.1f} ms")
+
+    server.should_exit = True
+    await serving
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+os.environ.setdefault("DOWNLOAD_CACHE_DIR", tempfile.mkdtemp())
+import downloader
+from stubs import serve_files
+
+
+def sequential(urls: list[str], suffix: str) -> list[str]:
+    # the per-clip loop create_anime used before the download subsystem
+    paths = []
+    for url in urls:
+        response = requests.get(url, stream=True)
+        response.raise_for_status()
+        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+        for chunk in response.iter_content(8192):
+            if chunk:
+                tmp_file.write(chunk)
+        tmp_file.close()
+        paths.append(tmp_file.name)
+    return paths
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def cached(url: str) -> str:
+    with downloader.download_cached(url, ".mp3") as path:
+        return path
+
+
+if __name__ == '__main__':
+    clip_mb = float(os.getenv("BENCH_CLIP_MB", 4))
+    files = {f"/clip{i}.mp4": os.urandom(int(clip_mb * 1024 * 1024)) for i in range(16)}
+    files["/track1.mp3"] = os.urandom(3 * 1024 * 1024)
+    base, server = serve_files(files, latency_s=float(os.getenv("BENCH_LATENCY_S", 0.2)))
+
+    for n in (1, 4, 8, 16):
+        urls = [f"{base}/clip{i}.mp4" for i in range(n)]
+        old_s, old_paths = timed(sequential, urls, ".mp4")
+        new_s, new_paths = timed(downloader.download_all, urls, ".mp4")
+        for path in old_paths + new_paths:
+            os.remove(path)
+        print(f"{n:2d} clips: sequential {old_s:6.2f} s | concurrent {new_s:6.2f} s")
+
+    cold_s, _ = timed(cached, f"{base}/track1.mp3")
+    warm_s, _ = timed(cached, f"{base}/track1.mp3")
+    print(f"music track: first fetch {cold_s * 1000:.0f} ms | cached {warm_s * 1000:.1f} ms")
+    server.shutdown()
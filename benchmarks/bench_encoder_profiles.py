@@ -0,0 +1,81 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from stubs import install_local_s3, serve_files
+from bench_segment_render import synthetic_clips
+from bench_frame_engine import synthetic_page
+
+
+class Chosen(logging.Handler):
+    # the profile line encoder_profiles logs for every job
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+
+def calibrate(frames, size: tuple[int, int], fps: float):
+    # megapixels a second per core for each preset: the seeds of PRESET_SPEEDS
+    from encoder_profiles import PRESETS, available_cores
+    from video_encoder import EncoderSettings, encode_frames_to_file
+
+    cores = available_cores()
+    megapixels = size[0] * size[1] * len(frames) / 1e6
+    with tempfile.TemporaryDirectory() as tmp:
+        for preset in PRESETS:
+            settings = EncoderSettings(preset=preset, tune="animation", threads=cores)
+            started = time.perf_counter()
+            encode_frames_to_file(iter(frames), size, fps, settings, os.path.join(tmp, "out.mp4"))
+            elapsed = time.perf_counter() - started
+            print(f"  {preset:9s} {len(frames) / elapsed:6.1f} fps | {megapixels / elapsed / cores:6.1f} MP/s per core | "
+                  f"{os.path.getsize(os.path.join(tmp, 'out.mp4')) / 1e6:5.2f} MB")
+
+
+if __name__ == '__main__':
+    import encoder_profiles
+    from create_anime import create_anime
+    from effect_timeline import Timeline, TimelineEngine
+    from manual_creation import Manual
+
+    chosen = Chosen()
+    logging.getLogger("encoder_profiles").addHandler(chosen)
+    logging.getLogger("encoder_profiles").setLevel(logging.INFO)
+
+    panel = synthetic_page()
+    engine = TimelineEngine(panel, Timeline.from_dict({"fps": 30, "tracks": [{"effect": "zoom", "duration": 2}]}), 30)
+    frames = [frame.copy() for frame in engine.frames()]
+    print(f"x264 presets, {engine.n_frames} zoom frames {engine.width}x{engine.height}, "
+          f"{encoder_profiles.available_cores()} cores")
+    calibrate(frames, engine.size, engine.fps)
+    del frames
+
+    s3 = install_local_s3()
+    n_clips = int(os.getenv("BENCH_CLIPS", 4))
+    base, server = serve_files(synthetic_clips(n_clips, float(os.getenv("BENCH_CLIP_SECONDS", 3))), latency_s=0)
+    urls = [f"{base}/clip{i}.mp4" for i in range(n_clips)]
+    jobs = [("manual zoom", lambda: Manual(panel).zoom()), ("manual shake", lambda: Manual(panel).shake()),
+            ("create_anime", lambda: create_anime(urls, workers=1, copy_bodies=False))]
+    budgets = [float(b) for b in os.getenv("BENCH_BUDGETS", "0,10,4,2").split(",")]
+    print("render time per output second budget (0: endpoint presets)")
+    for label, render in jobs:
+        for budget in budgets:
+            encoder_profiles.RENDER_BUDGET_RATIO = budget
+            # every budget starts from the seeds, as a fresh process would; the second job
+            # uses what the first one observed
+            encoder_profiles._corrections.clear()
+            for attempt in ("first", "second"):
+                started = time.perf_counter()
+                result = render()
+                elapsed = time.perf_counter() - started
+                size = len(s3.objects[f"videos/{result['file_name']}"]) / 1e6
+                print(f"  {label:12s} budget {budget:4.1f}x {attempt:6s} {elapsed:6.1f} s | {size:5.2f} MB | {chosen.lines[-1]}")
+    server.shutdown()
@@ -0,0 +1,302 @@
+import asyncio
+import ctypes
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+# Every endpoint through the app with offline stand-ins: stub MAGI / colorizer in the
+# inference workers, a mock fal server, an S3-compatible server, and synthetic pages,
+# panels, clips and music served locally. Results go to BENCH_OUTPUT as JSON; with
+# BENCH_BASELINE set to an earlier file, the differences are printed too.
+#
+#   BENCH_SCENARIOS=crop_panels,colorize BENCH_REQUESTS=16 BENCH_CONCURRENCY=4 python benchmarks/bench_endpoints.py
+SCENARIOS = ("crop_panels", "colorize", "manual_reveal", "manual_zoom", "manual_shake", "create_anime", "wan_animate")
+POLL = 0.05
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def descendants(pid: int) -> list[int]:
+    # the inference, effect and render workers are spawned children of this process
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError):
+                pass
+    found, frontier = [], [pid]
+    while frontier:
+        children = [child for child, parent in parents.items() if parent in frontier]
+        found += children
+        frontier = children
+    return found
+
+
+def cpu_seconds(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLK_TCK
+    except (OSError, IndexError):
+        return 0.0
+
+
+def rss_kb(pid: int, field: str = "VmRSS") -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class Resources:
+    # CPU time of this process and all its workers (live ones from /proc, exited ones
+    # from RUSAGE_CHILDREN) and peak RSS: this process's exact high-water mark, plus the
+    # whole process tree sampled every `interval`
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+
+    def __enter__(self):
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        self.pid = os.getpid()
+        self.cpu = {pid: cpu_seconds(pid) for pid in [self.pid, *descendants(self.pid)]}
+        self.reaped = self.reaped_cpu()
+        self.total_peak_kb = 0
+        self.stop = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        return self
+
+    @staticmethod
+    def reaped_cpu() -> float:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    def sample(self):
+        while not self.stop.is_set():
+            self.total_peak_kb = max(self.total_peak_kb, sum(rss_kb(pid) for pid in [self.pid, *descendants(self.pid)]))
+            self.stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.sampler.join()
+        live = [self.pid, *descendants(self.pid)]
+        self.cpu_s = sum(cpu_seconds(pid) - self.cpu.get(pid, 0.0) for pid in live) + self.reaped_cpu() - self.reaped
+        self.rss_peak_mb = rss_kb(self.pid, "VmHWM") / 1024
+        self.rss_peak_total_mb = max(self.total_peak_kb, sum(rss_kb(pid) for pid in live)) / 1024
+
+
+def synthetic_music(seconds: float = 10) -> bytes:
+    from moviepy.config import get_setting
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "track.mp3")
+        subprocess.run([get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-f", "lavfi",
+                        "-i", f"sine=frequency=440:duration={seconds}", "-c:a", "libmp3lame", path], check=True)
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def git_commit() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def summarize(latencies: list[float], statuses: list[str], wall: float, resources: Resources) -> dict:
+    ok = [latency for latency, status in zip(latencies, statuses) if status == "ok"]
+    counts = {status: statuses.count(status) for status in sorted(set(statuses))}
+    return {
+        "requests": len(statuses),
+        "errors": len(statuses) - len(ok),
+        "statuses": counts,
+        "latency_ms": {name: round(percentile(ok, q) * 1000, 1) for name, q in
+                       (("p50", 50), ("p90", 90), ("p95", 95), ("p99", 99), ("max", 100))} | {
+                       "mean": round(float(np.mean(ok)) * 1000, 1) if ok else float("nan")},
+        "throughput_rps": round(len(ok) / wall, 3),
+        "wall_s": round(wall, 3),
+        "cpu_s": round(resources.cpu_s, 3),
+        "cpu_s_per_request": round(resources.cpu_s / len(statuses), 3),
+        "cpu_util": round(resources.cpu_s / wall, 3),
+        "rss_peak_mb": round(resources.rss_peak_mb, 1),
+        "rss_peak_total_mb": round(resources.rss_peak_total_mb, 1),
+    }
+
+
+def compare(baseline: dict, results: dict):
+    print(f"\nvs {baseline.get('commit', '?')[:10]} ({baseline.get('created', '?')})")
+    changed = {k: (baseline.get("config", {}).get(k), v) for k, v in results["config"].items() if baseline.get("config", {}).get(k) != v}
+    if changed:
+        print("config differs: " + ", ".join(f"{k} {old} -> {new}" for k, (old, new) in changed.items()))
+    columns = (("p50", lambda s: s["latency_ms"]["p50"]), ("p95", lambda s: s["latency_ms"]["p95"]),
+               ("rps", lambda s: s["throughput_rps"]), ("cpu/req", lambda s: s["cpu_s_per_request"]),
+               ("rss", lambda s: s["rss_peak_total_mb"]))
+    print(f"{'scenario':14s}" + "".join(f"{name:>10s}" for name, _ in columns))
+    for name, current in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        cells = []
+        for _, value in columns:
+            old, new = value(before), value(current)
+            cells.append(f"{(new / old - 1) * 100:+9.1f}%" if old else f"{'n/a':>10s}")
+        print(f"{name:14s}" + "".join(cells))
+
+
+async def main():
+    import httpx
+    import uvicorn
+
+    import app
+    from app import encode_png
+    from bench_crop_panels import manga_page
+    from bench_frame_engine import synthetic_page
+    from bench_segment_render import synthetic_clips
+    from stubs import install_fal, serve_fal, serve_files, stub_detect_panels
+
+    scenarios = [s for s in os.getenv("BENCH_SCENARIOS", ",".join(SCENARIOS)).split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"unknown scenarios {', '.join(sorted(unknown))}; choose from {', '.join(SCENARIOS)}")
+    n_requests = int(os.getenv("BENCH_REQUESTS", 4))
+    concurrency = int(os.getenv("BENCH_CONCURRENCY", 2))
+    quality = os.getenv("BENCH_QUALITY", "final")
+    config = {"requests": n_requests, "concurrency": concurrency, "quality": quality,
+              "page": os.getenv("BENCH_PAGE", "1654x2339"), "panel": os.getenv("BENCH_PANEL", "800x1200"),
+              "clips": int(os.getenv("BENCH_CLIPS", 4)), "clip_seconds": float(os.getenv("BENCH_CLIP_SECONDS", 3))}
+
+    app.inference_pool.loaders.update(magi="stubs:load_stub_magi", colorizer="stubs:load_stub_colorizator")
+    app.detect_panels = stub_detect_panels
+    fal_base, fal_server, _ = serve_fal(run_s=0.5, queue_s=0.1)
+    install_fal(fal_base)
+
+    # a distinct input per request, so neither the result cache nor job coalescing answers
+    page_w, page_h = (int(v) for v in config["page"].split("x"))
+    panel_w, panel_h = (int(v) for v in config["panel"].split("x"))
+    pages = [manga_page(page_w, page_h, seed=i) for i in range(n_requests)] if {"crop_panels", "colorize"} & set(scenarios) else []
+    panels = [encode_png(synthetic_page(panel_w, panel_h, seed=i)) for i in range(n_requests)]
+    files_base, files_server = None, None
+    if "create_anime" in scenarios:
+        files = synthetic_clips(config["clips"], config["clip_seconds"])
+        files["/music.mp3"] = synthetic_music()
+        files_base, files_server = serve_files(files, latency_s=0.01)
+
+    def form(name: str, i: int) -> dict:
+        if name in ("crop_panels", "colorize"):
+            return {"files": {"file": ("page.png", pages[i], "image/png")}}
+        if name == "create_anime":
+            # clip order rotates, so every job has its own spec
+            clips = [f"{files_base}/clip{(i + k) % config['clips']}.mp4" for k in range(config["clips"])]
+            body = json.dumps({"videos": clips, "music": f"{files_base}/music.mp3"}).encode()
+            return {"files": {"file": ("videos.json", body, "application/json")}, "data": {"quality": quality}}
+        data = {"prompt": f"panel {i} comes alive"} if name == "wan_animate" else {"quality": quality}
+        return {"files": {"file": ("panel.png", panels[i], "image/png")}, "data": data}
+
+    async def request(client: httpx.AsyncClient, name: str, i: int) -> str:
+        response = await client.post(f"/{name}/", **form(name, i))
+        if response.status_code != 202:
+            return "ok" if response.status_code == 200 else f"http_{response.status_code}"
+        task_id = response.json()["task_id"]
+        while True:
+            view = (await client.get(f"/jobs/{task_id}")).json()
+            if view["status"] == "done":
+                return "ok"
+            if view["status"] not in ("pending", "running"):
+                return view["status"]
+            await asyncio.sleep(POLL)
+
+    async def run(client: httpx.AsyncClient, name: str, indices: range) -> tuple[list[float], list[str]]:
+        gate = asyncio.Semaphore(concurrency)
+        latencies, statuses = [0.0] * len(indices), ["" for _ in indices]
+
+        async def one(k: int, i: int):
+            async with gate:
+                started = time.perf_counter()
+                try:
+                    statuses[k] = await request(client, name, i)
+                except httpx.HTTPError as e:
+                    statuses[k] = type(e).__name__
+                latencies[k] = time.perf_counter() - started
+        await asyncio.gather(*(one(k, i) for k, i in enumerate(indices)))
+        return latencies, statuses
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app.app, port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    results = {**git_commit(), "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               "machine": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+               "config": config, "scenarios": {}}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        for name in scenarios:
+            # one unmeasured request starts the workers and loads the stub models
+            await run(client, name, range(1))
+            with Resources() as resources:
+                started = time.perf_counter()
+                latencies, statuses = await run(client, name, range(n_requests))
+                wall = time.perf_counter() - started
+            summary = results["scenarios"][name] = summarize(latencies, statuses, wall, resources)
+            latency = summary["latency_ms"]
+            print(f"{name:14s} p50 {latency['p50']:8.1f} ms  p95 {latency['p95']:8.1f} ms  "
+                  f"{summary['throughput_rps']:6.2f} req/s  cpu {summary['cpu_s']:6.1f} s  "
+                  f"rss {summary['rss_peak_mb']:6.0f} / {summary['rss_peak_total_mb']:6.0f} MB"
+                  + (f"  errors {summary['statuses']}" if summary["errors"] else ""))
+
+    server.should_exit = True
+    await serving
+    fal_server.shutdown()
+    if files_server is not None:
+        files_server.shutdown()
+
+    output = os.getenv("BENCH_OUTPUT", os.path.join(os.path.dirname(__file__), "results",
+                                                    f"endpoints-{results['commit'][:10] or 'local'}.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"wrote {output}")
+    if os.getenv("BENCH_BASELINE"):
+        with open(os.environ["BENCH_BASELINE"]) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    from stubs import serve_s3
+
+    # effect and render workers are spawned processes: they find S3 and the settings
+    # through the environment
+    endpoint, s3_server, objects = serve_s3(latency_s=0.005)
+    os.environ.update({
+        "S3_ENDPOINT_URL": endpoint, "ACCESS_KEY": "bench", "SECRET_KEY": "bench", "BUCKET_NAME": "bench",
+        "JOB_STORE": "memory", "MODEL_WARM_UP": "", "RESULT_CACHE_DIR": tempfile.mkdtemp(),
+        "DOWNLOAD_CACHE_DIR": tempfile.mkdtemp(),
+    })
+    asyncio.run(main())
+    s3_server.shutdown()
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+from moviepy.editor import ImageClip, CompositeVideoClip, ColorClip
+from moviepy.video.VideoClip import VideoClip
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from effect_timeline import Timeline, TimelineEngine
+from frame_engine import smootherstep
+
+
+# the moviepy compositing graphs Manual used before the frame engine, kept as the reference
+
+def moviepy_reveal(image, duration=3, fps=30):
+    h, w = image.shape[:2]
+    img_clip = ImageClip(image).set_duration(duration)
+
+    def make_mask(t):
+        progress = np.clip(t / duration, 0, 1)
+        gradient = np.tile(np.linspace(0, 1, w), (h, 1))
+        return (gradient < progress).astype(float)
+
+    mask_clip = VideoClip(make_mask, ismask=True, duration=duration).set_fps(fps)
+    bg = ColorClip(size=(w, h), color=(255, 255, 255)).set_duration(duration)
+    return CompositeVideoClip([bg, img_clip.set_mask(mask_clip)])
+
+
+def moviepy_zoom(image, duration=3.0, fps=120, start_scale=0.7, end_scale=1.0, upscale=2):
+    H, W = image.shape[:2]
+    img_clip = ImageClip(image).set_duration(duration)
+
+    def scale(t):
+        return start_scale + (end_scale - start_scale) * smootherstep(t / duration)
+
+    def position(t):
+        s = scale(t)
+        return ((W*upscale - W*s*upscale) / 2, (H*upscale - H*s*upscale) / 2)
+
+    zoom_hi = img_clip.resize(lambda t: scale(t) * upscale).set_position(position)
+    bg_hi = ColorClip(size=(W*upscale, H*upscale), color=(255, 255, 255)).set_duration(duration)
+    final_hi = CompositeVideoClip([bg_hi, zoom_hi], size=(W*upscale, H*upscale)).set_fps(fps)
+    return final_hi.fl_image(lambda f: np.array(Image.fromarray(f).resize((W, H), Image.LANCZOS)))
+
+
+def moviepy_shake(image, duration=3.0, fps=30, max_angle=1.0, frequency=1.0):
+    H, W = image.shape[:2]
+    img_clip = ImageClip(image).set_duration(duration)
+    angle_fn = lambda t: max_angle * np.sin(2 * np.pi * frequency * t)
+    shake_clip = img_clip.rotate(angle_fn, resample="bilinear", expand=False).set_position("center")
+    bg = ColorClip(size=(W, H), color=(255, 255, 255)).set_duration(duration)
+    return CompositeVideoClip([bg, shake_clip], size=(W, H))
+
+
+def synthetic_page(width=800, height=1200, seed=0):
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(12):
+        x0, y0 = rng.integers(0, width - 100), rng.integers(0, height - 100)
+        x1, y1 = x0 + rng.integers(50, 300), y0 + rng.integers(50, 300)
+        page[y0:y1, x0:x1] = rng.integers(0, 255, 3)
+    noise = rng.integers(-20, 20, page.shape)
+    return np.clip(page.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def one_track(image, effect: str, fps: int, background: int = 255, **params) -> TimelineEngine:
+    # what Manual.reveal/zoom/shake render: a timeline of the one effect
+    timeline = Timeline.from_dict({"fps": fps, "background": background,
+                                   "tracks": [{"effect": effect, "duration": 3, **params}]})
+    return TimelineEngine(image, timeline)
+
+
+def bench(name, reference, engine, n_frames):
+    indices = np.linspace(0, engine.n_frames - 1, n_frames).astype(int)
+
+    start = time.perf_counter()
+    ref_frames = [reference.get_frame(engine.times[i]).astype(np.uint8) for i in indices]
+    ref_ms = (time.perf_counter() - start) * 1000 / n_frames
+
+    start = time.perf_counter()
+    new_frames = [engine.frame(i).copy() for i in indices]
+    new_ms = (time.perf_counter() - start) * 1000 / n_frames
+
+    diffs = [np.abs(a.astype(np.int16) - b.astype(np.int16)) for a, b in zip(ref_frames, new_frames)]
+    print(f"{name:7s} moviepy {ref_ms:8.2f} ms/frame | engine {new_ms:8.2f} ms/frame | "
+          f"speedup {ref_ms / new_ms:5.1f}x | mean abs diff {np.mean([d.mean() for d in diffs]):.3f} "
+          f"| p99 abs diff {np.percentile(np.concatenate([d.ravel() for d in diffs]), 99):.0f}")
+
+
+if __name__ == '__main__':
+    n_frames = int(os.getenv("BENCH_FRAMES", 30))
+    image = synthetic_page()
+    bench("reveal", moviepy_reveal(image), one_track(image, "reveal", 30), n_frames)
+    bench("zoom", moviepy_zoom(image), one_track(image, "zoom", 120), n_frames)
+    bench("shake", moviepy_shake(image), one_track(image, "shake", 30, background=0), n_frames)
@@ -0,0 +1,99 @@
+import asyncio
+import base64
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from stubs import install_fal, serve_fal
+
+APPLICATION = "fal-ai/vidu/q1/image-to-video"
+
+
+def noisy_png(seed: int, side: int = 1024) -> bytes:
+    # noise doesn't compress, so this is about the size of a detailed colorized page
+    pixels = np.random.default_rng(seed).integers(0, 256, (side, side, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+async def legacy_job(image: bytes):
+    # what the vidu/wan handlers did before: the whole image inlined as a data URI
+    import fal_client
+
+    data_uri = f"data:image/png;base64,{base64.b64encode(image).decode()}"
+    handler = await fal_client.submit_async(APPLICATION, arguments={"prompt": "a boy is talking", "image_url": data_uri})
+    async for _ in handler.iter_events(with_logs=True, interval=0.05):
+        pass
+    return await handler.get()
+
+
+def make_client(concurrency: int = 4):
+    from ai_models.generation_client import FalProvider, GenerationClient
+
+    return GenerationClient(FalProvider(poll_interval=0.05), concurrency=concurrency, backoff=0.1)
+
+
+async def measure_one(run, image: bytes, stats: dict) -> tuple[float, int]:
+    sent = len(stats["submit_bytes"])
+    tracemalloc.start()
+    await run(image)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6, sum(stats["submit_bytes"][sent:])
+
+
+async def main():
+    images = [noisy_png(seed) for seed in range(4)]
+    print(f"input image: {len(images[0]) / 1e6:.1f} MB PNG")
+
+    base, server, stats = serve_fal(run_s=0.2, queue_s=0.05)
+    install_fal(base)
+    client = make_client()
+    new_job = lambda image: client.generate(APPLICATION, image, {"prompt": "a boy is talking"})
+
+    for label, run in (("data URI", legacy_job), ("client", new_job)):
+        await run(images[0])  # warm connections and the token
+        peak_mb, submit_bytes = await measure_one(run, images[1], stats)
+        print(f"{label:9s} submit request {submit_bytes / 1e3:8.1f} KB | peak traced memory per job {peak_mb:6.1f} MB")
+
+    # 32 jobs over 4 distinct images: each image is uploaded once
+    uploads_before = stats["uploads"]
+    client = make_client(concurrency=4)
+    start = time.perf_counter()
+    await asyncio.gather(*(client.generate(APPLICATION, images[i % 4], {"prompt": "p"}) for i in range(32)))
+    print(f"32 jobs, 4 images, concurrency 4: {time.perf_counter() - start:.2f} s | "
+          f"{stats['uploads'] - uploads_before} uploads | stats {client.stats}")
+    server.shutdown()
+
+    # transient 503s on submit are retried with backoff
+    base, server, stats = serve_fal(run_s=0.05, queue_s=0.0, fail_submits=3)
+    install_fal(base)
+    client = make_client()
+    events = []
+    await client.generate(APPLICATION, images[0], {"prompt": "p"}, on_event=events.append)
+    print("with 3 injected 503s:", " -> ".join(e.stage for e in events), f"| retries {client.stats['retries']}")
+    server.shutdown()
+
+    # ... and ones while polling resume the request already submitted
+    base, server, stats = serve_fal(run_s=0.05, queue_s=0.0, fail_polls=2)
+    install_fal(base)
+    client = make_client()
+    events = []
+    await client.generate(APPLICATION, images[0], {"prompt": "p"}, on_event=events.append)
+    print("with 2 failed polls:", " -> ".join(e.stage for e in events),
+          f"| retries {client.stats['retries']} | submits {stats['submits']}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from inference_pool import InferencePool, PoolBusy
+from stubs import StubMagi, stub_detect_panels
+
+
+async def poll_latencies(stop: asyncio.Event, interval: float = 0.005) -> list[float]:
+    # stands in for /vidu_status/ polls: how long a trivial handler waits for the loop
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def saturate(infer, n_requests: int):
+    stop = asyncio.Event()
+    poller = asyncio.create_task(poll_latencies(stop))
+    page = np.zeros((1200, 800, 3), dtype=np.uint8)
+    results = await asyncio.gather(*(infer([page]) for _ in range(n_requests)), return_exceptions=True)
+    stop.set()
+    latencies = np.array(await poller) * 1000
+    rejected = sum(isinstance(r, PoolBusy) for r in results)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), rejected
+
+
+async def main():
+    n_requests = int(os.getenv("BENCH_REQUESTS", 24))
+    model = StubMagi(call_overhead_s=0.2)
+
+    async def inline(images):
+        return stub_detect_panels(model, images)
+
+    print("inline on the event loop: p50 %.2f ms, p99 %.2f ms, rejected %d" % await saturate(inline, n_requests))
+
+    pool = InferencePool({"magi": "stubs:load_stub_magi"}, workers=2, queue_size=n_requests,
+                         limits={"crop_panels": n_requests}, warm=["magi"])
+    await pool.warm_up()
+
+    async def pooled(images):
+        return await pool.run("crop_panels", "magi", stub_detect_panels, images)
+
+    print("inference pool:           p50 %.2f ms, p99 %.2f ms, rejected %d" % await saturate(pooled, n_requests))
+
+    pool.queue_size = n_requests // 2
+    print("pool at half capacity:    p50 %.2f ms, p99 %.2f ms, rejected %d" % await saturate(pooled, n_requests))
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import asyncio
+import ctypes
+import io
+import os
+import re
+import sys
+import time
+
+import httpx
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+os.environ.setdefault("JOB_STORE", "memory")
+# the PNG scan is above the default byte limit; decoding is what is measured here
+os.environ.setdefault("IMAGE_MAX_BYTES", str(256 * 1024 * 1024))
+
+import app
+from anime_timeline import CANVAS
+from bench_crop_panels import grid_panels, manga_page
+from image_ingest import PAGE_MAX_SIZE, decode_image
+
+
+def rss_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        return int(re.search(rf"{field}:\s+(\d+)", f.read()).group(1))
+
+
+class PeakMemory:
+    # peak resident memory above what was in use on entry; resets the kernel's high-water
+    # mark, so it sees allocations of PIL and numpy alike. Freed heap goes back to the OS
+    # first, or a request reusing it would look free.
+    def __enter__(self):
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        self.base = rss_kb("VmRSS")
+        return self
+
+    def __exit__(self, *exc):
+        self.mb = (rss_kb("VmHWM") - self.base) / 1024
+
+
+def legacy_decode(data: bytes, max_size=None) -> np.ndarray:
+    # read_imagefile before the ingest layer
+    return np.array(Image.open(io.BytesIO(data)).convert("RGB"))
+
+
+def scan_pages(width: int, height: int) -> dict[str, bytes]:
+    png = manga_page(width, height)
+    buf = io.BytesIO()
+    Image.open(io.BytesIO(png)).save(buf, format="JPEG", quality=90)
+    return {"jpeg": buf.getvalue(), "png": png}
+
+
+def bomb(width: int = 12000, height: int = 12000) -> bytes:
+    # compresses to a few hundred KB, decodes to 432 MB of RGB
+    buf = io.BytesIO()
+    Image.new("L", (width, height), 255).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def decode_table(pages: dict[str, bytes]):
+    for fmt, data in pages.items():
+        for label, decode, size in [("legacy", legacy_decode, None), ("full", decode_image, None),
+                                    ("page 4096", decode_image, PAGE_MAX_SIZE), ("canvas", decode_image, CANVAS)]:
+            with PeakMemory() as peak:
+                started = time.perf_counter()
+                image = decode(data, size)
+                elapsed = time.perf_counter() - started
+            print(f"  {fmt:4s} {label:10s} {image.shape[1]:5d}x{image.shape[0]:<5d} {elapsed * 1000:7.0f} ms "
+                  f"peak {peak.mb:7.1f} MB")
+            del image
+
+
+async def bboxes(client: httpx.AsyncClient, data: bytes) -> httpx.Response:
+    return await client.post("/crop_panels/", data={"mode": "bboxes"}, files={"file": ("page", data, "image/jpeg")})
+
+
+async def request_table(pages: dict[str, bytes], concurrency: int = 4):
+    app.panel_batcher.submit = grid_panels
+    app.result_cache.get = lambda key: None
+    app.result_cache.put = lambda key, data: None
+    original = app.decode_image
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://bench", timeout=120) as client:
+        for label, decode in [("legacy", legacy_decode), ("ingest", original)]:
+            app.decode_image = decode
+            for fmt, data in pages.items():
+                with PeakMemory() as one:
+                    started = time.perf_counter()
+                    (await bboxes(client, data)).raise_for_status()
+                    elapsed = time.perf_counter() - started
+                with PeakMemory() as many:
+                    for response in await asyncio.gather(*(bboxes(client, data) for _ in range(concurrency))):
+                        response.raise_for_status()
+                print(f"  {label:6s} {fmt:4s} {elapsed * 1000:7.0f} ms, peak {one.mb:7.1f} MB; "
+                      f"{concurrency} concurrent: peak {many.mb:7.1f} MB")
+        app.decode_image = original
+
+        data = bomb()
+        with PeakMemory() as peak:
+            started = time.perf_counter()
+            response = await bboxes(client, data)
+            elapsed = time.perf_counter() - started
+        print(f"  12000x12000 png ({len(data) / 1e3:.0f} KB): {response.status_code} in {elapsed * 1000:.0f} ms, "
+              f"peak {peak.mb:.1f} MB")
+
+
+if __name__ == '__main__':
+    width, height = int(os.getenv("BENCH_PAGE_WIDTH", 6000)), int(os.getenv("BENCH_PAGE_HEIGHT", 9000))
+    pages = scan_pages(width, height)
+    print(f"{width}x{height} scan: " + ", ".join(f"{fmt} {len(data) / 1e6:.1f} MB" for fmt, data in pages.items()))
+    print("decode")
+    decode_table(pages)
+    print("POST /crop_panels/ mode=bboxes (MAGI stubbed)")
+    asyncio.run(request_table(pages))
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+os.environ.setdefault("JOB_STORE", "memory")
+os.environ["PROFILING_ENABLED"] = "1"
+
+import app
+import metrics
+from bench_crop_panels import grid_panels, manga_page
+
+
+def span_overhead(n: int = 200_000) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        with metrics.span("bench"):
+            pass
+    return (time.perf_counter() - started) / n
+
+
+async def crop(client: httpx.AsyncClient, page: bytes, runs: int, **params) -> float:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = await client.post("/crop_panels/", params=params, files={"file": ("page.png", page, "image/png")})
+        response.raise_for_status()
+        times.append(time.perf_counter() - started)
+    return float(np.median(times))
+
+
+async def main(runs: int = 9):
+    print(f"span: {span_overhead() * 1e6:.2f} us per span")
+
+    app.panel_batcher.submit = grid_panels
+    app.result_cache.get = lambda key: None
+    app.result_cache.put = lambda key, data: None
+    page = manga_page()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://bench", timeout=60) as client:
+        await crop(client, page, 1)
+        plain = await crop(client, page, runs)
+        profiled = await crop(client, page, runs, profile="1")
+        print(f"/crop_panels/ json: {plain * 1000:.1f} ms, profiled {profiled * 1000:.1f} ms "
+              f"({(profiled / plain - 1) * 100:+.1f}%)")
+
+        started = time.perf_counter()
+        body = (await client.get("/metrics")).text
+        print(f"/metrics: {len(body.splitlines())} lines in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for line in body.splitlines():
+            if line.startswith("manga_stage_seconds_sum") or line.startswith("manga_stage_seconds_count"):
+                print("  " + line)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
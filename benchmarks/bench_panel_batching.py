@@ -0,0 +1,47 @@
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from bench_frame_engine import synthetic_page
+from panel_batcher import PanelBatcher
+from stubs import StubMagi
+
+
+def load_model():
+    # BENCH_MAGI=1 measures the real model on CPU; the stub keeps the run offline
+    if os.getenv("BENCH_MAGI") == "1":
+        import torch
+        from transformers import AutoModel
+
+        model = AutoModel.from_pretrained("ragavsachdeva/magi", trust_remote_code=True).eval()
+
+        def predict(images):
+            with torch.no_grad():
+                return [r["panels"] for r in model.predict_detections_and_associations(images)]
+        return predict
+
+    model = StubMagi()
+    return lambda images: [r["panels"] for r in model.predict_detections_and_associations(images)]
+
+
+async def throughput(predict, pages: list[np.ndarray], max_batch: int) -> float:
+    batcher = PanelBatcher(predict, max_batch=max_batch, max_wait_ms=10)
+    start = time.perf_counter()
+    # every page is its own concurrent request, like a chapter uploaded page by page
+    await asyncio.gather(*(batcher.submit(page) for page in pages))
+    return len(pages) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    predict = load_model()
+    n_pages = int(os.getenv("BENCH_PAGES", 24))
+    pages = [synthetic_page(800 + 16 * (i % 3), 1200, seed=i) for i in range(n_pages)]
+    for max_batch in (1, 4, 8):
+        print(f"batch {max_batch}: {asyncio.run(throughput(predict, pages, max_batch)):.2f} pages/sec")
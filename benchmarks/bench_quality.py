@@ -0,0 +1,37 @@
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from stubs import install_local_s3, serve_files
+from bench_segment_render import synthetic_clips
+from bench_frame_engine import synthetic_page
+
+if __name__ == '__main__':
+    from create_anime import create_anime
+    from manual_creation import Manual
+    from quality import QUALITY_TIERS
+
+    s3 = install_local_s3()
+    panel = synthetic_page()
+    n_clips = int(os.getenv("BENCH_CLIPS", 4))
+    base, server = serve_files(synthetic_clips(n_clips, float(os.getenv("BENCH_CLIP_SECONDS", 3))), latency_s=0)
+    urls = [f"{base}/clip{i}.mp4" for i in range(n_clips)]
+
+    print(f"panel {panel.shape[1]}x{panel.shape[0]}, create_anime from {n_clips} clips")
+    jobs = [(f"manual {effect}", lambda quality, effect=effect: getattr(Manual(panel), effect)(quality=quality))
+            for effect in ("reveal", "zoom", "shake")]
+    jobs.append(("create_anime", lambda quality: create_anime(urls, quality=quality)))
+    for label, render in jobs:
+        times = {}
+        for quality in QUALITY_TIERS:
+            started = time.perf_counter()
+            result = render(quality)
+            times[quality] = time.perf_counter() - started
+            size = len(s3.objects[f"videos/{result['file_name']}"]) / 1e6
+            print(f"{label:14s} {quality:8s} {times[quality]:7.2f} s | {size:5.2f} MB")
+        print(f"{'':14s} draft is {times['final'] / times['draft']:.1f}x faster than final")
+    server.shutdown()
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from stubs import serve_s3
+
+endpoint, server, objects = serve_s3(latency_s=float(os.getenv("BENCH_S3_LATENCY_MS", 5)) / 1000)
+os.environ["S3_ENDPOINT_URL"] = endpoint
+
+import boto3
+import s3_save_file
+
+
+def legacy_upload(path: str) -> str:
+    # what load_file_s3 did before: a fresh session and client for every upload
+    session = boto3.session.Session()
+    s3 = session.client(service_name="s3", endpoint_url=endpoint, region_name="ru-central1",
+                        aws_access_key_id="bench", aws_secret_access_key="bench")
+    s3.upload_file(Filename=path, Bucket="bench", Key=f"videos/{path}",
+                   ExtraArgs={"ACL": "public-read", "ContentType": "video/mp4"})
+    return s3.generate_presigned_url("get_object", Params={"Bucket": "bench", "Key": f"videos/{path}"})
+
+
+def timed(fn, paths: list[str], threads: int = 1) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(fn, paths))
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    uploader = s3_save_file.S3Uploader("bench", "bench", "bench")
+    cases = [
+        ("40 x 200 KB, sequential", 40, 200 * 1024, 1),
+        ("40 x 200 KB, 8 threads", 40, 200 * 1024, 8),
+        ("4 x 64 MB, sequential", 4, 64 * 1024 * 1024, 1),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, count, size, threads in cases:
+            paths = []
+            for i in range(count):
+                path = os.path.join(tmp, f"{size}_{i}.mp4")
+                with open(path, "wb") as f:
+                    f.write(os.urandom(size))
+                paths.append(path)
+
+            before = timed(legacy_upload, paths, threads)
+            after = timed(uploader.upload_path, paths, threads)
+            with open(paths[0], "rb") as f:
+                data = f.read()
+            start = time.perf_counter()
+            for i in range(count):
+                uploader.upload_bytes(data, f"buffer_{i}.mp4")
+            from_memory = time.perf_counter() - start
+            print(f"{label:26s} per-session {before / count * 1000:7.1f} ms/upload | pooled {after / count * 1000:7.1f} ms/upload"
+                  f" | pooled from memory {from_memory / count * 1000:7.1f} ms/upload")
+    server.shutdown()
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from moviepy.config import get_setting
+
+from stubs import install_local_s3, serve_files
+
+
+def synthetic_clips(n: int, seconds: float, size: str = "720x1280", fps: int = 30, extra: tuple = ()) -> dict[str, bytes]:
+    # fal-like h264 clips from ffmpeg's test pattern, each with a different hue
+    clips = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(n):
+            path = os.path.join(tmp, f"clip{i}.mp4")
+            subprocess.run([
+                get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+                "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}:duration={seconds}",
+                "-vf", f"hue=h={i * 36}", "-c:v", "libx264", "-pix_fmt", "yuv420p", *extra, path,
+            ], check=True)
+            with open(path, "rb") as f:
+                clips[f"/clip{i}.mp4"] = f.read()
+    return clips
+
+
+if __name__ == '__main__':
+    from create_anime import create_anime
+    from video_encoder import ENCODER_SETTINGS
+
+    n_clips = int(os.getenv("BENCH_CLIPS", 10))
+    seconds = float(os.getenv("BENCH_CLIP_SECONDS", 3))
+    encoder = ENCODER_SETTINGS["create_anime"].with_overrides(preset=os.getenv("BENCH_PRESET"))
+    s3 = install_local_s3()
+    base, server = serve_files(synthetic_clips(n_clips, seconds), latency_s=0)
+    urls = [f"{base}/clip{i}.mp4" for i in range(n_clips)]
+
+    baseline = None
+    for workers in (1, 4, 8, 16):
+        if workers > (os.cpu_count() or 1) and workers != 1 and os.getenv("BENCH_OVERSUBSCRIBE") != "1":
+            print(f"{workers:2d} workers: skipped, only {os.cpu_count()} cores")
+            continue
+        start = time.perf_counter()
+        result = create_anime(urls, encoder=encoder, workers=workers, copy_bodies=False)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        size_mb = len(s3.objects[f"videos/{result['file_name']}"]) / 1e6
+        print(f"{workers:2d} workers: {elapsed:6.1f} s | speedup {baseline / elapsed:4.2f}x | {size_mb:.1f} MB")
+    server.shutdown()
@@ -0,0 +1,53 @@
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# what app.py imported at module level before models and handlers were loaded lazily
+EAGER = ("import app, create_anime, manual_creation, moviepy.editor, ai_models.vidu_api_model, "
+         "ai_models.wan_api_model, ai_models.cogvideox_run")
+
+
+def fresh_import(statement: str) -> float:
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    return float(subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_healthy(timeout: float = 60) -> tuple[float, dict]:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port)], cwd=ROOT,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz") as response:
+                    elapsed = time.perf_counter() - started
+                    return elapsed, json.loads(response.read())
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError("app never became healthy")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    runs = int(os.getenv("BENCH_RUNS", 5))
+    lazy = statistics.median(fresh_import("import app") for _ in range(runs))
+    eager = statistics.median(fresh_import(EAGER) for _ in range(runs))
+    print(f"import app: {lazy:.3f} s (with the formerly eager imports: {eager:.3f} s), median of {runs}")
+    elapsed, health = time_to_healthy()
+    print(f"uvicorn spawn -> /healthz 200: {elapsed:.3f} s | {health}")
@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from bench_segment_render import synthetic_clips
+from stubs import install_local_s3, serve_files
+
+# clips already in the output format with a keyframe every second, and fal-like ones
+# (smaller, one keyframe per clip) that the planner normalizes first
+SOURCES = {
+    "matching": ("1080x1920", ("-g", "30")),
+    "fal-like": ("720x1280", ()),
+}
+
+
+if __name__ == '__main__':
+    from create_anime import create_anime
+    from video_encoder import ENCODER_SETTINGS
+
+    n_clips = int(os.getenv("BENCH_CLIPS", 6))
+    seconds = float(os.getenv("BENCH_CLIP_SECONDS", 5))
+    workers = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+    encoder = ENCODER_SETTINGS["create_anime"].with_overrides(preset=os.getenv("BENCH_PRESET"))
+    s3 = install_local_s3()
+
+    for name, (size, extra) in SOURCES.items():
+        base, server = serve_files(synthetic_clips(n_clips, seconds, size, extra=extra), latency_s=0)
+        urls = [f"{base}/clip{i}.mp4" for i in range(n_clips)]
+        timings = {}
+        for copy_bodies in (False, True):
+            start = time.perf_counter()
+            result = create_anime(urls, encoder=encoder, workers=workers, copy_bodies=copy_bodies)
+            timings[copy_bodies] = time.perf_counter() - start
+            size_mb = len(s3.objects[f"videos/{result['file_name']}"]) / 1e6
+            label = "copy bodies" if copy_bodies else "render all "
+            print(f"{name:9s} {label}: {timings[copy_bodies]:6.1f} s | {timings[copy_bodies] / (n_clips - 1):5.2f} s per transition | {size_mb:.1f} MB")
+        print(f"{name:9s} speedup {timings[False] / timings[True]:.2f}x")
+        server.shutdown()
@@ -0,0 +1,54 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+
+def run(mode: str, seconds: float):
+    from moviepy.video.VideoClip import VideoClip
+    from bench_frame_engine import one_track, synthetic_page
+    from stubs import install_local_s3
+    import s3_save_file
+    from video_encoder import ENCODER_SETTINGS, encode_to_s3
+
+    s3 = install_local_s3()
+    engine = one_track(synthetic_page(1080, 1920), "zoom", 30, duration=seconds)
+    settings = ENCODER_SETTINGS["manual_zoom"].with_overrides(preset="veryfast")
+    name = f"bench_{mode}.mp4"
+
+    start = time.perf_counter()
+    if mode == "write_videofile":
+        clip = VideoClip(engine.frame_at, duration=engine.duration).set_fps(engine.fps)
+        clip.write_videofile(name, codec=settings.codec, fps=engine.fps, audio=False, preset=settings.preset,
+                             ffmpeg_params=["-crf", str(settings.crf), "-pix_fmt", settings.pix_fmt], logger=None)
+        s3_save_file.load_file_s3(name)
+        os.remove(name)
+    else:
+        encode_to_s3(engine.frames(), engine.size, engine.fps, settings, name)
+    wall = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "wall_s": round(wall, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "ffmpeg_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "uploaded_mb": round(len(s3.objects[f"videos/{name}"]) / 1e6, 2),
+        "s3_requests": s3.requests,
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        print(json.dumps(run(sys.argv[1], float(sys.argv[2]))))
+    else:
+        seconds = os.getenv("BENCH_SECONDS", "4")
+        # separate processes so each mode gets its own peak RSS
+        for mode in ("write_videofile", "stream"):
+            out = subprocess.run([sys.executable, __file__, mode, seconds], capture_output=True, text=True, check=True)
+            print(out.stdout.strip().splitlines()[-1])
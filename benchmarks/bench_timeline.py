@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from stubs import install_local_s3, serve_files
+from bench_frame_engine import synthetic_page
+
+# reveal, then zoom in, then shake: before /manual_timeline/ this took one job per effect
+# and a create_anime job to join them
+STEPS = [("reveal", {"duration": 1}), ("zoom", {"duration": 2, "start_scale": 1.0, "end_scale": 1.3}),
+         ("shake", {"duration": 1, "max_angle": 2.0, "frequency": 2.0})]
+
+if __name__ == '__main__':
+    from create_anime import create_anime
+    from effect_timeline import Timeline
+    from manual_creation import Manual
+
+    s3 = install_local_s3()
+    panel = synthetic_page()
+    print(f"panel {panel.shape[1]}x{panel.shape[0]}: " + " -> ".join(effect for effect, _ in STEPS))
+
+    started = time.perf_counter()
+    before = len(s3.objects)
+    clips = {}
+    for effect, params in STEPS:
+        if effect == "zoom":
+            result = Manual(panel).zoom(fps=30, **params)
+        else:
+            result = getattr(Manual(panel), effect)(**params)
+        clips["/" + result["file_name"]] = s3.objects[f"videos/{result['file_name']}"]
+    rendered = time.perf_counter() - started
+    base, server = serve_files(clips, latency_s=0)
+    result = create_anime([base + name for name in clips], transition=0)
+    joined = time.perf_counter() - started
+    uploaded = sum(len(data) for data in list(s3.objects.values())[before:])
+    server.shutdown()
+    print(f"separate effects + create_anime: {joined:6.2f} s ({rendered:.2f} s effects), "
+          f"{len(s3.objects) - before} uploads, {uploaded / 1e6:.2f} MB")
+
+    started = time.perf_counter()
+    before = len(s3.objects)
+    timeline = Timeline.from_dict({"fps": 30, "tracks": [{"effect": effect, **params} for effect, params in STEPS]})
+    result = Manual(panel).timeline(timeline)
+    elapsed = time.perf_counter() - started
+    uploaded = sum(len(data) for data in list(s3.objects.values())[before:])
+    print(f"one timeline:                    {elapsed:6.2f} s, {len(s3.objects) - before} upload, {uploaded / 1e6:.2f} MB")
@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+from moviepy.video.VideoClip import ImageClip
+from moviepy.video.io.VideoFileClip import VideoFileClip
+
+from anime_timeline import CANVAS, DIRECTIONS, TRANSITION_STYLES, build_composite, plan_layers, scale_clip, timeline_duration
+from bench_segment_render import synthetic_clips
+from transition_compositor import Compositor
+
+
+def transition_times(durations: list[float], transition: float, fps: float) -> np.ndarray:
+    # the frames of the first transition, as create_anime's frame loop would produce them
+    times = np.arange(0, timeline_duration(durations, transition), 1.0 / fps)
+    start = durations[0] - transition
+    return times[(times >= start) & (times < start + transition)]
+
+
+def per_frame_ms(frames, n: int) -> float:
+    started = time.perf_counter()
+    for _ in frames:
+        pass
+    return (time.perf_counter() - started) * 1000 / n
+
+
+def table(label: str, clips: dict, durations: list[float], transition: float, fps: float):
+    times = transition_times(durations, transition, fps)
+    print(f"{label}: {len(times)} transition frames")
+    for kind in [*DIRECTIONS, *TRANSITION_STYLES["mixed"][len(DIRECTIONS):]]:
+        layers = plan_layers(durations, transition, [kind])
+        compositor = Compositor(layers, clips, transition)
+        line = f"  {kind:10s} compositor {per_frame_ms(compositor.frames(times), len(times)):6.1f} ms/frame"
+        if kind in DIRECTIONS:
+            composite = build_composite(layers, clips, timeline_duration(durations, transition), transition)
+            legacy = per_frame_ms((composite.get_frame(t) for t in times), len(times))
+            same = all(np.array_equal(composite.get_frame(t), frame) for t, frame in zip(times, compositor.frames(times)))
+            line += f" | moviepy {legacy:6.1f} ms/frame | identical: {same}"
+        print(line)
+
+
+if __name__ == '__main__':
+    seconds = float(os.getenv("BENCH_CLIP_SECONDS", 3))
+    transition = float(os.getenv("BENCH_TRANSITION", 0.25))
+    size = os.getenv("BENCH_CLIP_SIZE", "720x1280")
+    fps = 30
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for name, data in synthetic_clips(2, seconds, size, fps).items():
+            paths.append(os.path.join(tmp, name.lstrip("/")))
+            with open(paths[-1], "wb") as f:
+                f.write(data)
+        raw = [VideoFileClip(path) for path in paths]
+        durations = [clip.duration for clip in raw]
+        # decoding and scaling included, as in create_anime
+        table(f"{size} h264 clips", {i: scale_clip(clip) for i, clip in enumerate(raw)}, durations, transition, fps)
+        # still sources: what is left is the compositing itself
+        stills = {i: scale_clip(ImageClip(clip.get_frame(0)).set_duration(clip.duration).set_fps(fps))
+                  for i, clip in enumerate(raw)}
+        table(f"{size} still clips", stills, durations, transition, fps)
+        for clip in raw:
+            clip.close()
+    print(f"canvas {CANVAS[0]}x{CANVAS[1]}")
@@ -0,0 +1,159 @@
+import asyncio
+import ctypes
+import io
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(__file__))
+
+
+def rss_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        return int(re.search(rf"{field}:\s+(\d+)", f.read()).group(1))
+
+
+def serve(port: int):
+    # the API in its own process, so its peak RSS is the server's alone; no lifespan, so the
+    # job runner leaves the submitted jobs in the store and only ingestion is measured
+    import uvicorn
+    from fastapi import File, Form, UploadFile
+
+    import app
+    from ai_models.wan_api_model import wan_key
+    from image_ingest import check_bytes, open_image
+
+    @app.app.post("/legacy/wan_animate/", status_code=202)
+    async def legacy_wan_animate(file: UploadFile = File(...), prompt: str = Form(...)):
+        # /wan_animate/ before the streaming ingest: the body read into bytes and hashed again
+        check_bytes(file.size)
+        contents = await file.read()
+        open_image(contents)
+        content_type = file.content_type or "image/png"
+        key = await asyncio.to_thread(wan_key, contents, prompt, content_type)
+        return await app.submit_job("wan_animate", {"prompt": prompt, "content_type": content_type}, contents, key=key)
+
+    @app.app.post("/bench/reset")
+    def reset():
+        # freed heap back to the OS first, or a request reusing it would look free
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return {"rss_kb": rss_kb("VmRSS")}
+
+    @app.app.get("/bench/peak")
+    def peak():
+        return {"hwm_kb": rss_kb("VmHWM")}
+
+    uvicorn.Server(uvicorn.Config(app.app, port=port, log_level="warning", lifespan="off")).run()
+
+
+def noise_png(size_mb: float) -> bytes:
+    # noise doesn't compress, so the PNG is about as big as its pixels
+    side = int((size_mb * 1e6 / 3) ** 0.5)
+    buf = io.BytesIO()
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (side, side, 3), np.uint8)).save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def multipart(page: bytes, tag: bytes, boundary: str = "benchboundary") -> tuple[list, int]:
+    # the form as chunks around the shared page, so 50 requests don't hold 50 copies in
+    # the client; the trailing tag (PNG readers ignore what follows IEND) makes every
+    # upload distinct, so no job is coalesced
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="prompt"\r\n\r\nbench\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="page.png"\r\n'
+            f'Content-Type: image/png\r\n\r\n').encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    view = memoryview(page)
+    chunks = [head, *(view[i:i + (1 << 20)] for i in range(0, len(page), 1 << 20)), tag, tail]
+    return chunks, sum(len(chunk) for chunk in chunks)
+
+
+async def upload(client, path: str, page: bytes, tag: bytes):
+    chunks, length = multipart(page, tag)
+
+    async def body():
+        for chunk in chunks:
+            yield bytes(chunk)
+
+    return await client.post(path, content=body(), headers={
+        "Content-Type": "multipart/form-data; boundary=benchboundary", "Content-Length": str(length)})
+
+
+async def announce(port: int, path: str, length: int) -> int:
+    # only the request head: the status shows whether the server answered without the body
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: multipart/form-data; boundary=x\r\n"
+                 f"Content-Length: {length}\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await asyncio.wait_for(reader.readline(), 30)).split()[1])
+    writer.close()
+    return status
+
+
+async def phase(client, requests) -> dict:
+    baseline = (await client.post("/bench/reset")).json()["rss_kb"]
+    started = time.perf_counter()
+    results = await asyncio.gather(*requests)
+    elapsed = time.perf_counter() - started
+    hwm = (await client.get("/bench/peak")).json()["hwm_kb"]
+    statuses = {}
+    for result in results:
+        status = getattr(result, "status_code", result)
+        statuses[status] = statuses.get(status, 0) + 1
+    return {"elapsed": elapsed, "peak_mb": (hwm - baseline) / 1024, "statuses": statuses}
+
+
+async def main():
+    import httpx
+
+    n = int(os.getenv("BENCH_UPLOADS", 50))
+    size_mb = float(os.getenv("BENCH_UPLOAD_MB", 20))
+    page = noise_png(size_mb)
+    print(f"{n} concurrent uploads of {len(page) / 1e6:.1f} MB")
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    tmp = tempfile.mkdtemp(prefix="bench_uploads_")
+    env = {**os.environ, "JOB_STORE": os.getenv("BENCH_JOB_STORE", "sqlite"), "JOB_DB_PATH": os.path.join(tmp, "jobs.sqlite3")}
+    server = subprocess.Popen([sys.executable, __file__, "serve", str(port)], env=env)
+    try:
+        limits = httpx.Limits(max_connections=n, max_keepalive_connections=n)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600, limits=limits) as client:
+            for _ in range(600):
+                try:
+                    (await client.get("/healthz")).raise_for_status()
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            phases = [
+                ("read into bytes", lambda: [upload(client, "/legacy/wan_animate/", page, b"legacy%04d" % i) for i in range(n)]),
+                ("streaming ingest", lambda: [upload(client, "/wan_animate/", page, b"stream%04d" % i) for i in range(n)]),
+                ("60 MB announced", lambda: [announce(port, "/wan_animate/", 60 * 1000 ** 2) for _ in range(n)]),
+            ]
+            for label, requests in phases:
+                result = await phase(client, requests())
+                statuses = ", ".join(f"{count}x {status}" for status, count in sorted(result["statuses"].items()))
+                print(f"  {label:18s} {result['elapsed']:6.2f} s | server peak {result['peak_mb']:7.1f} MB | {statuses}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["serve"]:
+        serve(int(sys.argv[2]))
+    else:
+        asyncio.run(main())
@@ -0,0 +1,323 @@
+import os
+import threading
+import uuid
+
+import numpy as np
+
+
+class LocalS3:
+    # just enough of the boto3 S3 client surface for s3_save_file, kept in memory
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.uploads: dict[str, dict[int, bytes]] = {}
+        self.aborted: list[str] = []
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def _count(self):
+        with self.lock:
+            self.requests += 1
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None, Callback=None):
+        self._count()
+        with open(Filename, "rb") as f:
+            self.objects[Key] = f.read()
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None, Callback=None):
+        self._count()
+        self.objects[Key] = Fileobj.read()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._count()
+        self.objects[Key] = bytes(Body)
+        return {"ETag": '"%s"' % uuid.uuid4().hex}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._count()
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._count()
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": '"%s-%d"' % (UploadId, PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._count()
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b"".join(parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._count()
+        self.uploads.pop(UploadId, None)
+        self.aborted.append(Key)
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600):
+        return f"http://local-s3/{Params['Bucket']}/{Params['Key']}"
+
+
+def install_local_s3() -> LocalS3:
+    import s3_save_file
+
+    client = LocalS3()
+    s3_save_file.make_s3_client = lambda *args, **kwargs: client
+    s3_save_file._uploaders.clear()
+    return client
+
+
+def serve_s3(latency_s: float = 0.0):
+    # S3-compatible HTTP stand-in (put/multipart/abort/get) for benchmarks that should go
+    # through real boto3 clients; returns (endpoint_url, server, objects)
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    objects: dict[str, bytes] = {}
+    uploads: dict[str, dict[int, bytes]] = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status=200, body=b"", headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_PUT(self):
+            time.sleep(latency_s)
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            data = self.body()
+            etag = '"%s"' % uuid.uuid4().hex
+            if "uploadId" in query:
+                uploads[query["uploadId"][0]][int(query["partNumber"][0])] = data
+            else:
+                objects[url.path] = data
+            self.reply(headers={"ETag": etag})
+
+        def do_POST(self):
+            time.sleep(latency_s)
+            url = urlparse(self.path)
+            query = parse_qs(url.query, keep_blank_values=True)
+            self.body()
+            if "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                uploads[upload_id] = {}
+                xml = f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            else:
+                parts = uploads.pop(query["uploadId"][0])
+                objects[url.path] = b"".join(parts[n] for n in sorted(parts))
+                xml = f"<CompleteMultipartUploadResult><Key>{url.path}</Key><ETag>\"x\"</ETag></CompleteMultipartUploadResult>"
+            self.reply(body=xml.encode(), headers={"Content-Type": "application/xml"})
+
+        def do_GET(self):
+            time.sleep(latency_s)
+            data = objects.get(urlparse(self.path).path)
+            if data is None:
+                self.reply(404)
+            else:
+                self.reply(body=data, headers={"Content-Type": "application/octet-stream"})
+
+        def do_DELETE(self):
+            query = parse_qs(urlparse(self.path).query)
+            uploads.pop(query.get("uploadId", [""])[0], None)
+            self.reply(204)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server, objects
+
+
+class StubMagiProcessor:
+    def crop_image(self, image, bboxes):
+        return [image[int(y1):int(y2), int(x1):int(x2)] for x1, y1, x2, y2 in bboxes]
+
+
+class StubMagi:
+    # Stands in for ragavsachdeva/magi: a fixed per-call cost plus a per-page cost, which is
+    # the shape that makes batching pay off; panels are a 2x3 grid over the page.
+
+    def __init__(self, call_overhead_s: float = 0.05, per_page_s: float = 0.02):
+        self.call_overhead_s = call_overhead_s
+        self.per_page_s = per_page_s
+        self.processor = StubMagiProcessor()
+        self.calls = 0
+
+    def predict_detections_and_associations(self, images):
+        import time
+
+        self.calls += 1
+        time.sleep(self.call_overhead_s + self.per_page_s * len(images))
+        results = []
+        for image in images:
+            h, w = image.shape[:2]
+            panels = [[c * w / 2, r * h / 3, (c + 1) * w / 2, (r + 1) * h / 3] for r in range(3) for c in range(2)]
+            results.append({"panels": panels, "texts": [], "characters": []})
+        return results
+
+
+def load_stub_magi():
+    return StubMagi()
+
+
+def stub_detect_panels(model, images):
+    return [r["panels"] for r in model.predict_detections_and_associations(images)]
+
+
+class StubColorizator:
+    # MangaColorizator's set_image/colorize surface with a cheap sepia tint as the "model"
+
+    def set_image(self, image, size=576, apply_denoise=True, denoise_sigma=25):
+        self.current_image = image
+
+    def colorize(self):
+        return self.current_image * np.array([1.0, 0.9, 0.7], dtype=np.float32)
+
+
+def stub_main_colorize(input_path: str):
+    # the file based entry point: reads `input_path`, writes `<stem>_colorized.png` next to it
+    from PIL import Image
+
+    stem, ext = os.path.splitext(input_path)
+    colorizator = StubColorizator()
+    colorizator.set_image(np.asarray(Image.open(input_path).convert("RGB"), dtype=np.float32) / 255)
+    Image.fromarray((np.clip(colorizator.colorize(), 0, 1) * 255).astype(np.uint8)).save(f"{stem}_colorized{ext}")
+
+
+def load_stub_colorizator():
+    return StubColorizator()
+
+
+def serve_files(files: dict[str, bytes], latency_s: float = 0.05):
+    # local HTTP stand-in for fal.media / the music bucket; each request pays `latency_s`
+    # before the first byte, like a remote CDN round trip
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency_s)
+            body = files.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def serve_fal(run_s: float = 0.5, queue_s: float = 0.1, fail_submits: int = 0, fail_polls: int = 0,
+              latency_s: float = 0.0):
+    # fal-compatible stand-in: CDN token + upload, queue submit/status/result/cancel.
+    # Requests are queued for `queue_s`, then run for `run_s`; the first `fail_submits`
+    # submissions and `fail_polls` status polls get a 503. Returns (base_url, server, stats).
+    import json
+    import time
+    from datetime import datetime, timedelta, timezone
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse
+
+    stats = {"uploads": 0, "upload_bytes": 0, "submits": 0, "submit_bytes": [], "polls": 0, "failed_submits": 0,
+             "failed_polls": 0}
+    requests: dict[str, float] = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status=200, data=None):
+            body = json.dumps(data).encode() if data is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            time.sleep(latency_s)
+            path = urlparse(self.path).path
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            base = f"http://127.0.0.1:{self.server.server_port}"
+            if path.startswith("/rest/storage/auth/token"):
+                expires = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+                return self.reply(data={"token": "mock", "token_type": "Bearer", "base_url": f"{base}/cdn", "expires_at": expires})
+            if path == "/cdn/files/upload":
+                with lock:
+                    stats["uploads"] += 1
+                    stats["upload_bytes"] += len(body)
+                return self.reply(data={"access_url": f"{base}/files/{uuid.uuid4().hex}"})
+            if path.startswith("/queue/"):
+                with lock:
+                    stats["submit_bytes"].append(len(body))
+                    if stats["failed_submits"] < fail_submits:
+                        stats["failed_submits"] += 1
+                        return self.reply(503, {"detail": "mock overload"})
+                    stats["submits"] += 1
+                    request_id = uuid.uuid4().hex
+                    requests[request_id] = time.monotonic()
+                url = f"{base}/requests/{request_id}"
+                return self.reply(data={"request_id": request_id, "response_url": url,
+                                        "status_url": f"{url}/status", "cancel_url": f"{url}/cancel"})
+            self.reply(404, {"detail": "not found"})
+
+        def do_GET(self):
+            time.sleep(latency_s)
+            parts = urlparse(self.path).path.strip("/").split("/")
+            if len(parts) < 2 or parts[0] != "requests" or parts[1] not in requests:
+                return self.reply(404, {"detail": "not found"})
+            age = time.monotonic() - requests[parts[1]]
+            if parts[-1] == "status":
+                with lock:
+                    stats["polls"] += 1
+                    if stats["failed_polls"] < fail_polls:
+                        stats["failed_polls"] += 1
+                        return self.reply(503, {"detail": "mock overload"})
+                if age < queue_s:
+                    return self.reply(data={"status": "IN_QUEUE", "queue_position": 0})
+                if age < queue_s + run_s:
+                    return self.reply(data={"status": "IN_PROGRESS", "logs": [{"message": "generating"}]})
+                return self.reply(data={"status": "COMPLETED", "logs": [{"message": "generating"}], "metrics": {}})
+            self.reply(data={"video": {"url": f"http://127.0.0.1:{self.server.server_port}/files/{parts[1]}.mp4"}})
+
+        def do_PUT(self):
+            self.reply(data={"status": "CANCELLATION_REQUESTED"})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server, stats
+
+
+def install_fal(base_url: str):
+    # point fal_client (and so ai_models.generation_client) at a serve_fal() stand-in
+    import fal_client.client
+
+    os.environ.setdefault("FAL_KEY", "mock")
+    fal_client.client.QUEUE_URL_FORMAT = f"{base_url}/queue/"
+    fal_client.client.REST_URL = f"{base_url}/rest"
+    fal_client.client.CDN_URL = f"{base_url}/cdn"
@@ -0,0 +1,231 @@
+import asyncio
+import inspect
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import metrics
+from encoder_profiles import share_cores
+from quality import DEFAULT_QUALITY, quality_tier
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", os.cpu_count() or 1))
+MANUAL_EFFECTS = ("reveal", "zoom", "shake")
+GENERATED_EFFECTS = ("vidu", "wan")
+EFFECTS = MANUAL_EFFECTS + GENERATED_EFFECTS
+# the shortest panel clip: the manual effects render 3 s, generated clips are longer
+PANEL_SECONDS = 3.0
+
+
+def check_transition_style(style: str):
+    from anime_timeline import TRANSITION_STYLES
+
+    if style not in TRANSITION_STYLES:
+        raise ValueError(f"transition_style must be one of {', '.join(TRANSITION_STYLES)}")
+
+
+def is_url(value) -> bool:
+    return isinstance(value, str) and value.startswith(("http://", "https://"))
+
+
+def check_transition(transition: float):
+    # the change between two panels overlaps both, so it has to fit inside one
+    if not 0 <= transition < PANEL_SECONDS:
+        raise ValueError(f"transition must be at least 0 and under {PANEL_SECONDS:g} seconds")
+
+
+@dataclass
+class PanelSpec:
+    effect: str
+    prompt: str | None = None
+
+
+@dataclass
+class ChapterSpec:
+    # `panels` overrides the defaults for single panels, keyed "page/panel" (both 0-based,
+    # panels in detection order)
+    effect: str = "zoom"
+    prompt: str | None = None
+    colorize: bool = True
+    music: str | None = None
+    transition: float = 0.25
+    panels: dict[str, PanelSpec] = field(default_factory=dict)
+    # manual effects and the assembly; vidu / wan panels are generated the same either way
+    quality: str = DEFAULT_QUALITY
+    # one of anime_timeline.TRANSITION_STYLES
+    transition_style: str = "slide"
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChapterSpec":
+        if not isinstance(data, dict):
+            raise ValueError("spec must be a JSON object")
+        if not isinstance(data.get("panels") or {}, dict):
+            raise ValueError('panels must be an object keyed "page/panel"')
+        # checked before any panel is generated, not when the assembly gets to them
+        if data.get("music") is not None and not is_url(data["music"]):
+            raise ValueError("music must be an http(s) URL or null")
+        panels = {}
+        for key, panel in (data.get("panels") or {}).items():
+            if not isinstance(panel, dict):
+                raise ValueError(f"panel {key} must be an object")
+            panels[key] = PanelSpec(panel.get("effect", data.get("effect", "zoom")), panel.get("prompt", data.get("prompt")))
+        if not isinstance(data.get("colorize", True), bool):
+            raise ValueError("colorize must be true or false")
+        spec = cls(data.get("effect", "zoom"), data.get("prompt"), data.get("colorize", True),
+                   data.get("music"), float(data.get("transition", 0.25)), panels, data.get("quality", DEFAULT_QUALITY),
+                   data.get("transition_style", "slide"))
+        quality_tier(spec.quality)
+        check_transition(spec.transition)
+        check_transition_style(spec.transition_style)
+        for key, panel in [("default", spec.panel(-1, -1)), *spec.panels.items()]:
+            if panel.effect not in EFFECTS:
+                raise ValueError(f"effect for {key} must be one of {', '.join(EFFECTS)}")
+            if panel.prompt is not None and not isinstance(panel.prompt, str):
+                raise ValueError(f"prompt for {key} must be a string")
+            if panel.effect in GENERATED_EFFECTS and not panel.prompt:
+                raise ValueError(f"{panel.effect} for {key} needs a prompt")
+        return spec
+
+    def panel(self, page: int, index: int) -> PanelSpec:
+        return self.panels.get(f"{page}/{index}", PanelSpec(self.effect, self.prompt))
+
+
+class StageGraph:
+    # Runs coroutines as soon as the awaitables they depend on are done (plain values are
+    # passed through) and keeps, per stage, how many ran, the time spent in them, and the
+    # span from the first start to the last end. Nodes can be added while the graph runs
+    # (fan-out after detection).
+
+    def __init__(self, on_stage=None):
+        self.on_stage = on_stage
+        self.timings: dict[str, dict] = {}
+        self.tasks: list[asyncio.Task] = []
+        self.started = time.perf_counter()
+
+    def add(self, stage: str, fn, *deps) -> asyncio.Task:
+        async def run():
+            args = [await dep if inspect.isawaitable(dep) else dep for dep in deps]
+            started = time.perf_counter()
+            try:
+                return await fn(*args)
+            finally:
+                self._record(stage, started, time.perf_counter())
+
+        return self.spawn(run())
+
+    def spawn(self, coroutine) -> asyncio.Task:
+        # untimed glue that belongs to the graph, so a failure elsewhere cancels it too
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.append(task)
+        return task
+
+    def _record(self, stage: str, started: float, ended: float):
+        timing = self.timings.setdefault(stage, {"count": 0, "busy_seconds": 0.0, "first_start": started, "last_end": ended})
+        timing["count"] += 1
+        timing["busy_seconds"] += ended - started
+        timing["first_start"] = min(timing["first_start"], started)
+        timing["last_end"] = max(timing["last_end"], ended)
+        metrics.record(f"chapter_{stage}", ended - started, started)
+        if self.on_stage is not None:
+            # an async on_stage (a progress write) runs as a task the graph holds on to
+            result = self.on_stage(stage, self.summary())
+            if inspect.isawaitable(result):
+                self.spawn(result)
+
+    def summary(self) -> dict:
+        return {
+            stage: {"count": t["count"], "busy_seconds": round(t["busy_seconds"], 3),
+                    "wall_seconds": round(t["last_end"] - t["first_start"], 3)}
+            for stage, t in self.timings.items()
+        }
+
+    async def wait(self, task: asyncio.Task):
+        # the first failure cancels everything still running
+        try:
+            return await task
+        except BaseException:
+            for other in self.tasks:
+                other.cancel()
+            raise
+
+
+_effect_pool: ProcessPoolExecutor | None = None
+
+
+def effect_pool() -> ProcessPoolExecutor:
+    global _effect_pool
+    if _effect_pool is None:
+        # the workers encode side by side, so each x264 gets its share of the cores
+        _effect_pool = ProcessPoolExecutor(max_workers=PIPELINE_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=share_cores, initargs=(PIPELINE_WORKERS,))
+    return _effect_pool
+
+
+def shutdown_effect_pool():
+    global _effect_pool
+    if _effect_pool is not None:
+        _effect_pool.shutdown(wait=False, cancel_futures=True)
+        _effect_pool = None
+
+
+def render_effect(effect: str, panel: np.ndarray, quality: str = DEFAULT_QUALITY) -> tuple[str, list]:
+    # runs in an effect_pool worker; the spans go back to the API process with the url
+    from anime_timeline import CANVAS
+    from image_ingest import fit_image
+    from manual_creation import Manual
+
+    with metrics.trace() as spans:
+        url = getattr(Manual(fit_image(panel, CANVAS)), effect)(quality=quality)["file_url"]
+    return url, spans
+
+
+async def run_chapter(pages: list[bytes], spec: ChapterSpec, ops, on_stage=None) -> dict:
+    # ops supplies the app's stages as coroutines: decode(bytes) -> array,
+    # detect(array) -> boxes, colorize(list of arrays) -> list of arrays,
+    # animate(PanelSpec, array, quality) -> video url, assemble(urls, spec) -> create_anime result.
+    # Pages and panels only exist as arrays in this process between stages.
+    graph = StageGraph(on_stage)
+    panels = []
+
+    async def crop(image, boxes):
+        return [image[y1:y2, x1:x2] for x1, y1, x2, y2 in boxes]
+
+    async def animate_page(p: int, crops_task, boxes_task):
+        crops, boxes = await crops_task, await boxes_task
+        entries, tasks = [], []
+        for i, (panel, box) in enumerate(zip(crops, boxes)):
+            panel_spec = spec.panel(p, i)
+            entries.append({"page": p, "panel": i, "box": list(box), "effect": panel_spec.effect})
+            tasks.append(graph.add("animate", ops.animate, panel_spec, panel, spec.quality))
+        for entry, url in zip(entries, await asyncio.gather(*tasks)):
+            entry["url"] = url
+        panels.extend(entries)
+        return [entry["url"] for entry in entries]
+
+    page_videos = []
+    for p, data in enumerate(pages):
+        image = graph.add("decode", ops.decode, data)
+        boxes = graph.add("detect", ops.detect, image)
+        crops = graph.add("crop", crop, image, boxes)
+        if spec.colorize:
+            crops = graph.add("colorize", ops.colorize, crops)
+        page_videos.append(graph.spawn(animate_page(p, crops, boxes)))
+
+    async def assemble(*videos):
+        urls = [url for page in videos for url in page]
+        if not urls:
+            raise ValueError("no panels were detected")
+        return await ops.assemble(urls, spec)
+
+    result = await graph.wait(graph.add("assemble", assemble, *page_videos))
+    # progress writes still in flight; they are best effort, so a failed one doesn't fail the chapter
+    await asyncio.gather(*graph.tasks, return_exceptions=True)
+    return {
+        **result,
+        "panels": sorted(panels, key=lambda panel: (panel["page"], panel["panel"])),
+        "timings": graph.summary(),
+        "total_seconds": round(time.perf_counter() - graph.started, 3),
+    }
@@ -0,0 +1,130 @@
+import math
+import re
+import subprocess
+import tempfile
+from dataclasses import dataclass
+
+from moviepy.config import get_setting
+
+from anime_timeline import CANVAS, Layer
+from video_encoder import EncoderSettings
+
+# libx264 and friends write these bitstreams
+CODEC_NAMES = {"libx264": "h264", "libx265": "hevc", "libvpx-vp9": "vp9"}
+MIN_COPY_SECONDS = 0.5
+
+
+@dataclass
+class ClipInfo:
+    codec: str
+    pix_fmt: str
+    width: int
+    height: int
+    fps: float
+    keyframes: list[float]
+
+
+@dataclass(frozen=True)
+class CopySpan:
+    # output frames [first, last) taken as-is from clip `clip`, starting at source time
+    # `src_start`; both ends sit on keyframes of the source
+    clip: int
+    first: int
+    last: int
+    src_start: float
+
+
+def probe_video(path: str) -> ClipInfo:
+    # decoding only keyframes through showinfo gives their timestamps without ffprobe,
+    # which imageio-ffmpeg doesn't ship
+    log = subprocess.run(
+        [get_setting("FFMPEG_BINARY"), "-hide_banner", "-skip_frame", "nokey", "-i", path,
+         "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"],
+        capture_output=True, text=True,
+    ).stderr
+    stream = re.search(r"Stream #\d+:\d+.*?: Video: (\w+)[^,]*, (\w+).*?, (\d{2,5})x(\d{2,5})", log)
+    fps = re.search(r", ([\d.]+) fps", log)
+    if not stream or not fps:
+        raise IOError(f"could not probe {path}")
+    keyframes = [float(t) for t in re.findall(r"pts_time:\s*([\d.]+)", log)]
+    return ClipInfo(stream.group(1), stream.group(2), int(stream.group(3)), int(stream.group(4)), float(fps.group(1)), keyframes)
+
+
+def matches(info: ClipInfo, settings: EncoderSettings, fps: float, canvas: tuple[int, int] = CANVAS) -> bool:
+    return (
+        info.codec == CODEC_NAMES.get(settings.codec, settings.codec)
+        and info.pix_fmt == settings.pix_fmt
+        and (info.width, info.height) == tuple(canvas)
+        and abs(info.fps - fps) < 1e-3
+    )
+
+
+def body_windows(layers: list[Layer], fps: float) -> dict[int, tuple[int, int, int]]:
+    # output frames [first, last) where a clip body is the only layer on screen: there the
+    # output frame is exactly the (canvas sized) source frame `f + shift`, since moviepy
+    # floors t * fps when it picks a source frame
+    windows = {}
+    for layer in layers:
+        if layer.transition:
+            continue
+        start, end = layer.start, layer.end
+        for other in layers:
+            if other is layer:
+                continue
+            if other.start <= start < other.end:
+                start = other.end
+            if other.start < end <= other.end:
+                end = other.start
+        first, last = int(round(start * fps)), int(round(end * fps))
+        if last > first:
+            windows[layer.clip] = (first, last, math.floor((layer.src_start - layer.start) * fps + 1e-5))
+    return windows
+
+
+def normalize_clip(path: str, info: ClipInfo, settings: EncoderSettings, fps: float, keyframes: list[int],
+                   canvas: tuple[int, int] = CANVAS) -> str:
+    # one ffmpeg pass that does what scale_clip + centring on the white canvas did, with
+    # keyframes forced on the source frames where the copied body will start and end
+    canvas_w, canvas_h = canvas
+    scale = min(1.5, canvas_w / info.width, canvas_h / info.height)
+    w, h = int(info.width * scale + 0.5), int(info.height * scale + 0.5)
+    out = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
+    subprocess.run(
+        [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-i", path, "-map", "0:v:0", "-an",
+         "-vf", f"scale={w}:{h},pad={canvas_w}:{canvas_h}:(ow-iw)/2:(oh-ih)/2:white,fps={fps},format={settings.pix_fmt}",
+         *settings.video_args(), "-force_key_frames", "expr:" + "+".join(f"eq(n,{k})" for k in keyframes), out],
+        check=True, capture_output=True,
+    )
+    return out
+
+
+def plan_copies(layers: list[Layer], infos: dict[int, ClipInfo], fps: float, n_frames: int) -> list[CopySpan]:
+    # the keyframe-aligned middle of every body window; everything else gets rendered. A
+    # body running to the end of the video needs no keyframe there.
+    spans = []
+    for clip, (first, last, shift) in body_windows(layers, fps).items():
+        info = infos.get(clip)
+        if info is None:
+            continue
+        last = min(last, n_frames)
+        keyframes = {int(round(k * fps)) - shift for k in info.keyframes}
+        if last == n_frames:
+            keyframes.add(last)
+        keyframes = sorted(k for k in keyframes if first <= k <= last)
+        if len(keyframes) >= 2 and keyframes[-1] - keyframes[0] >= MIN_COPY_SECONDS * fps:
+            spans.append(CopySpan(clip, keyframes[0], keyframes[-1], (keyframes[0] + shift) / fps))
+    return sorted(spans, key=lambda span: span.first)
+
+
+def copy_span(path: str, span: CopySpan, fps: float, out_path: str) -> str:
+    # seeking a hair past the keyframe keeps float error from landing on the previous one,
+    # and -copyts keeps the B-frame reordering delay from pushing the keyframe below zero
+    # (where the edit list would hide it). With closed GOPs the packets up to the next
+    # keyframe are exactly the frames we want.
+    subprocess.run(
+        [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-ss", f"{span.src_start + 0.25 / fps:.6f}",
+         "-i", path, "-copyts", "-map", "0:v:0", "-an", "-c:v", "copy", "-frames:v", str(span.last - span.first),
+         "-f", "mp4", out_path],
+        check=True, capture_output=True,
+    )
+    return out_path
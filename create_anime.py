@@ -1,14 +1,24 @@
 import os
 import tempfile
-import requests
 import math
-import random
+import numpy as np
 from uuid import uuid4
-from moviepy.editor import VideoFileClip, CompositeVideoClip, ColorClip, concatenate_audioclips
-from s3_save_file import load_file_s3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from downloader import download_all, download_cached
+from encoder_profiles import encoding
+from metrics import span, timed_iter
+from moviepy.audio.AudioClip import concatenate_audioclips
+from moviepy.video.io.VideoFileClip import VideoFileClip
+from video_encoder import EncoderSettings, ENCODER_SETTINGS, encode_to_s3
+from quality import DEFAULT_QUALITY, quality_tier
+from anime_timeline import CANVAS, build_composite, plan_layers, random_transitions, scale_clip, timeline_duration
+from segment_renderer import RENDER_WORKERS, STREAM_COPY_BODIES, render_segments
+from transition_compositor import Compositor
 
 from moviepy.audio.io.AudioFileClip import AudioFileClip
 from moviepy.audio.fx.audio_loop import audio_loop 
+from moviepy.audio.fx.volumex import volumex
 
 video_urls = [
     "https://fal.media/files/lion/1Uh0DkBsAv2ZVPeV91OLd_output.mp4",
@@ -29,29 +39,18 @@ music_urls = [
  
 
 
-def download_video(url: str) -> str:
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-    for chunk in response.iter_content(8192):
-        if chunk:
-            tmp_file.write(chunk)
-    tmp_file.close()
-    return tmp_file.name
-
-def download_audio(url: str) -> str:
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-    for chunk in response.iter_content(8192):
-        if chunk:
-            tmp_file.write(chunk)
-    tmp_file.close()
-    return tmp_file.name
-
-
-def add_background_music(clip: VideoFileClip, audio_url: str, volume: float = 1.0) -> VideoFileClip:
-    audio_path = download_audio(audio_url)
+def download_audio(url: str):
+    # the music library is a small fixed set, so tracks stay in the on-disk cache; the
+    # track can't be evicted while the `with` block using it runs
+    return download_cached(url, '.mp3')
+
+
+def prefetch_audio(url: str):
+    with download_audio(url):
+        pass
+
+
+def add_background_music(clip: VideoFileClip, audio_path: str, volume: float = 1.0) -> VideoFileClip:
     base_audio = AudioFileClip(audio_path)
 
     if base_audio.duration < clip.duration - 1e-3:
@@ -60,84 +59,66 @@ def add_background_music(clip: VideoFileClip, audio_url: str, volume: float = 1.
     else:
         bgm = base_audio.subclip(0, clip.duration)
 
-    bgm = bgm.volumex(volume).set_duration(clip.duration)
+    bgm = bgm.fx(volumex, volume).set_duration(clip.duration)
     return clip.set_audio(bgm) 
 
-def _scale_clip(clip: VideoFileClip, canvas_w: int, canvas_h: int, limit: float = 1.5) -> VideoFileClip:
-    scale = min(limit, canvas_w / clip.w, canvas_h / clip.h)
-    return clip if scale == 1 else clip.resize(scale)
-
-def create_anime(urls: list[str], transition: float = 0.25, music_url: str | None = None, music_volume: float = 1.0) -> dict:
-    CANVAS_WIDTH, CANVAS_HEIGHT = 1080, 1920 
-    raw_clips = [VideoFileClip(download_video(u)) for u in urls]
-
-    overlap = max(0, len(raw_clips) - 1) * transition
-    total_duration = sum(c.duration for c in raw_clips) - overlap
-
-    background = (
-        ColorClip((CANVAS_WIDTH, CANVAS_HEIGHT), color=(255, 255, 255))
-        .set_duration(total_duration)
-    )
-
-    layers = []
-    current_t = 0.0 
-
-    for idx, clip in enumerate(raw_clips):
-        clip = _scale_clip(clip, CANVAS_WIDTH, CANVAS_HEIGHT)
-
-        if idx == 0:
-            main = clip.subclip(0, clip.duration - transition)
-            layers.append(main.set_start(current_t).set_position(('center', 'center')))
-            current_t += clip.duration - transition
-            continue
-
-        direction = random.choice(['right', 'left', 'down', 'up'])
-
-        prev_clip = _scale_clip(raw_clips[idx - 1], CANVAS_WIDTH, CANVAS_HEIGHT)
-        prev_tail = prev_clip.subclip(prev_clip.duration - transition)
-        next_head = clip.subclip(0, transition)
-
-        if direction == 'right':
-            prev_pos = lambda t: (CANVAS_WIDTH * (t / transition), 'center')
-            next_pos = lambda t: (-CANVAS_WIDTH + CANVAS_WIDTH * (t / transition), 'center')
-        elif direction == 'left':
-            prev_pos = lambda t: (-CANVAS_WIDTH * (t / transition), 'center')
-            next_pos = lambda t: (CANVAS_WIDTH - CANVAS_WIDTH * (t / transition), 'center')
-        elif direction == 'down':
-            prev_pos = lambda t: ('center', CANVAS_HEIGHT * (t / transition))
-            next_pos = lambda t: ('center', -CANVAS_HEIGHT + CANVAS_HEIGHT * (t / transition))
-        else: 
-            prev_pos = lambda t: ('center', -CANVAS_HEIGHT * (t / transition))
-            next_pos = lambda t: ('center', CANVAS_HEIGHT - CANVAS_HEIGHT * (t / transition))
-
-        slide_prev = prev_tail.set_start(current_t).set_position(prev_pos)
-        slide_next = next_head.set_start(current_t).set_position(next_pos)
-        main_next = (
-            clip.subclip(transition)
-            .set_start(current_t + transition)
-            .set_position(('center', 'center'))
-        )
-
-        layers.extend([slide_prev, slide_next, main_next])
-        current_t += clip.duration - transition
-
-    final = CompositeVideoClip([background, *layers], size=(CANVAS_WIDTH, CANVAS_HEIGHT))
-    
-    if music_url:
-        final = add_background_music(final, music_url, music_volume)
-
-    output_name = f'vertical_final_{uuid4()}.mp4'
-    final.write_videofile(output_name, codec='libx264', preset='slow', ffmpeg_params=['-crf', '18'], audio_codec='aac')
-
-    url = load_file_s3(output_name)
-
-    for c in raw_clips:
-        if hasattr(c, 'filename') and os.path.exists(c.filename):
-            os.remove(c.filename)
-    if os.path.exists(output_name):
-        os.remove(output_name)
-
-    return {'file_url': url, 'file_name': output_name}
+def create_anime(urls: list[str], transition: float = 0.25, music_url: str | None = None, music_volume: float = 1.0,
+                 encoder: EncoderSettings = ENCODER_SETTINGS["create_anime"], workers: int = RENDER_WORKERS,
+                 copy_bodies: bool = STREAM_COPY_BODIES, quality: str = DEFAULT_QUALITY,
+                 transition_style: str = 'slide') -> dict:
+    tier = quality_tier(quality)
+    canvas = tier.size(*CANVAS)
+    encoder = tier.encoder(encoder)
+    # filled in as they are created, so the finally below cleans up whatever got that far
+    paths, raw_clips, audio_path = [], [], None
+    try:
+        with span("download"), ThreadPoolExecutor(max_workers=1) as music_pool:
+            # fetch the track alongside the clips; the audio mix then reads it from the cache
+            music_future = music_pool.submit(prefetch_audio, music_url) if music_url else None
+            paths = download_all(urls, '.mp4')
+            for path in paths:
+                raw_clips.append(VideoFileClip(path))
+            if music_future is not None:
+                music_future.result()
+
+        durations = [c.duration for c in raw_clips]
+        total_duration = timeline_duration(durations, transition)
+        layers = plan_layers(durations, transition, random_transitions(len(raw_clips), transition_style))
+
+        with span("composite_build"):
+            scaled = {i: scale_clip(c, *canvas) for i, c in enumerate(raw_clips)}
+            final = build_composite(layers, scaled, total_duration, transition, canvas)
+            fps = tier.fps(final.fps)
+
+        output_name = f'vertical_final_{uuid4()}.mp4'
+        with span("audio_mix"), ExitStack() as held:
+            # the track is read until write_audiofile is done with it
+            if music_url:
+                final = add_background_music(final, held.enter_context(download_audio(music_url)), music_volume)
+            if final.audio is not None:
+                audio_path = tempfile.NamedTemporaryFile(delete=False, suffix='.wav').name
+                final.audio.write_audiofile(audio_path, fps=44100, codec='pcm_s16le', logger=None)
+
+        if workers > 1 or copy_bodies:
+            # frames are generated and encoded in the worker processes, so this one span covers both
+            with span("render_segments"), encoding("anime", encoder, canvas, fps, total_duration, workers) as settings:
+                url = render_segments(paths, layers, total_duration, transition, fps, settings, output_name,
+                                      audio_path=audio_path, workers=workers, copy_bodies=copy_bodies, canvas=canvas)
+        else:
+            compositor = Compositor(layers, scaled, transition, canvas)
+            frames = timed_iter(compositor.frames(np.arange(0, final.duration, 1.0 / fps)), "frame_generation")
+            with encoding("anime", encoder, canvas, fps, total_duration) as settings:
+                url = encode_to_s3(frames, final.size, fps, settings, output_name, audio_path=audio_path)
+    finally:
+        for c in raw_clips:
+            c.close()
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        if audio_path and os.path.exists(audio_path):
+            os.remove(audio_path)
+
+    return {'file_url': url, 'file_name': output_name, 'quality': quality}
 
 
 if __name__ == '__main__':
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", 8))
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_CONCURRENCY, pool_maxsize=DOWNLOAD_CONCURRENCY, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def fetch(url: str, path: str, timeout: float = 60):
+    with get_session().get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+
+
+def download(url: str, suffix: str) -> str:
+    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    tmp_file.close()
+    try:
+        fetch(url, tmp_file.name)
+    except BaseException:
+        os.remove(tmp_file.name)
+        raise
+    return tmp_file.name
+
+
+def download_all(urls: list[str], suffix: str) -> list[str]:
+    # order of the returned paths follows `urls`; on failure the finished files are removed
+    with ThreadPoolExecutor(max_workers=max(1, min(DOWNLOAD_CONCURRENCY, len(urls)))) as pool:
+        futures = [pool.submit(download, url, suffix) for url in urls]
+    paths, error = [], None
+    for future in futures:
+        if future.exception() is None:
+            paths.append(future.result())
+        elif error is None:
+            error = future.exception()
+    if error is not None:
+        for path in paths:
+            os.remove(path)
+        raise error
+    return paths
+
+
+class DownloadCache:
+    # Files fetched by URL, kept on disk and evicted least recently used first once the
+    # directory grows past max_bytes. Callers get a path inside the cache inside use():
+    # it is pinned until the block exits, so eviction skips it while ffmpeg or moviepy
+    # may still open it. Callers must not delete it.
+
+    def __init__(self, directory: str | Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # per entry being fetched or looked up: its lock and how many callers want it
+        self.key_locks: dict[str, list] = {}
+        self.pins: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, url: str, suffix: str) -> Path:
+        return self.directory / (hashlib.sha256(url.encode()).hexdigest() + suffix)
+
+    def _pin(self, path: Path):
+        # under self.lock
+        self.pins[path.name] = self.pins.get(path.name, 0) + 1
+
+    def acquire(self, url: str, suffix: str) -> str:
+        # the path stays in the cache until release()
+        path = self.path(url, suffix)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(path.name, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            # one fetch per URL even when several renders ask for the same track at once
+            with key_lock[0]:
+                fetched = self._acquire(url, path)
+        finally:
+            with self.lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self.key_locks[path.name]
+        if fetched:
+            self.evict()
+        return str(path)
+
+    def _acquire(self, url: str, path: Path) -> bool:
+        # under the entry's key lock; True if it had to be fetched
+        with self.lock:
+            # pinned in the same step as the check, so an eviction can't come in between
+            if path.exists():
+                os.utime(path)
+                self._pin(path)
+                self.hits += 1
+                return False
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        os.close(fd)
+        try:
+            fetch(url, tmp)
+            with self.lock:
+                os.replace(tmp, path)
+                self._pin(path)
+                self.misses += 1
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return True
+
+    def release(self, path: str):
+        name = Path(path).name
+        with self.lock:
+            self.pins[name] -= 1
+            if not self.pins[name]:
+                del self.pins[name]
+
+    @contextmanager
+    def use(self, url: str, suffix: str):
+        path = self.acquire(url, suffix)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def evict(self):
+        with self.lock:
+            files = [p for p in self.directory.iterdir() if p.suffix != ".part"]
+            stats = {p: p.stat() for p in files}
+            total = sum(s.st_size for s in stats.values())
+            for p in sorted(files, key=lambda p: stats[p].st_mtime):
+                if total <= self.max_bytes:
+                    break
+                if p.name in self.pins:
+                    continue
+                total -= stats[p].st_size
+                p.unlink(missing_ok=True)
+
+
+_cache: DownloadCache | None = None
+
+
+def get_cache() -> DownloadCache:
+    global _cache
+    with _session_lock:
+        if _cache is None:
+            _cache = DownloadCache(
+                os.getenv("DOWNLOAD_CACHE_DIR", "./download_cache"),
+                int(os.getenv("DOWNLOAD_CACHE_MB", 1024)) * 1024 * 1024,
+            )
+        return _cache
+
+
+def download_cached(url: str, suffix: str):
+    # with download_cached(url, suffix) as path: ...
+    return get_cache().use(url, suffix)
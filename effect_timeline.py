@@ -0,0 +1,232 @@
+import math
+import os
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+from frame_engine import FrameEngine, smootherstep
+
+MAX_DURATION = float(os.getenv("TIMELINE_MAX_SECONDS", 60))
+MAX_FPS = 120
+# zoom scales and pan offsets (in frame widths / heights) a track may ask for
+MIN_SCALE, MAX_SCALE = 0.1, 10.0
+MAX_OFFSET = 2.0
+# the background-padded copy of the source that zoom and pan frames are resampled from,
+# in frames' worth of pixels; timelines that would need more (tracks that compound to a
+# tiny scale or far offset) are transformed with a fill colour instead
+PADDED_MAX_FRAMES = 16
+
+EASINGS = {
+    "linear": lambda x: x,
+    "smoothstep": lambda x: 3*x**2 - 2*x**3,
+    "smootherstep": smootherstep,
+    "ease_in": lambda x: x**2,
+    "ease_out": lambda x: 1 - (1 - x)**2,
+}
+
+# parameters of each effect with their defaults; the defaults are what the fixed manual
+# endpoints always rendered
+EFFECTS = {
+    "reveal": {"easing": "linear", "direction": "right"},
+    "zoom": {"easing": "smootherstep", "start_scale": 0.7, "end_scale": 1.0},
+    "shake": {"max_angle": 1.0, "frequency": 1.0},
+    "pan": {"easing": "smootherstep", "start_offset": [0.0, 0.0], "end_offset": [0.0, 0.0]},
+    "fade": {"easing": "linear", "direction": "in", "color": 255},
+}
+REVEAL_DIRECTIONS = ("right", "left", "down", "up")
+
+
+def color(value, name: str) -> tuple[int, int, int]:
+    # a grey level or [r, g, b]
+    values = [value] * 3 if isinstance(value, (int, float)) else list(value)
+    if len(values) != 3 or not all(isinstance(v, (int, float)) and 0 <= v <= 255 for v in values):
+        raise ValueError(f"{name} must be a grey level or [r, g, b] in 0..255")
+    return tuple(int(v) for v in values)
+
+
+def offset(value, name: str) -> tuple[float, float]:
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"{name} must be [x, y]")
+    return float(value[0]), float(value[1])
+
+
+@dataclass
+class Track:
+    # one effect over [start, start + duration); before it starts and after it ends the
+    # effect holds its first and last state (shake is still outside its window)
+    effect: str
+    start: float
+    duration: float
+    params: dict
+
+    def progress(self, times: np.ndarray) -> np.ndarray:
+        return EASINGS[self.params.get("easing", "linear")](np.clip((times - self.start) / self.duration, 0, 1))
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+
+@dataclass
+class Timeline:
+    # Tracks without a `start` begin where the previous one ended, so a plain list is a
+    # sequence; tracks given a `start` overlay the others. Geometric effects (zoom, pan,
+    # shake) compose into one transform of the source per frame, then reveal masks and
+    # fades apply to the result, so the whole timeline is a single render and encode.
+    tracks: list[Track]
+    fps: float = 30
+    duration: float = 0
+    background: tuple[int, int, int] = (255, 255, 255)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Timeline":
+        if not isinstance(data, dict):
+            raise ValueError("timeline must be a JSON object")
+        if not isinstance(data.get("tracks"), list) or not data["tracks"]:
+            raise ValueError("timeline needs a non-empty list of tracks")
+        tracks, end = [], 0.0
+        for i, track in enumerate(data["tracks"]):
+            if not isinstance(track, dict):
+                raise ValueError(f"track {i} must be an object")
+            effect = track.get("effect")
+            if effect not in EFFECTS:
+                raise ValueError(f"effect of track {i} must be one of {', '.join(EFFECTS)}")
+            unknown = set(track) - {"effect", "start", "duration"} - set(EFFECTS[effect])
+            if unknown:
+                raise ValueError(f"track {i} ({effect}) has unknown parameters: {', '.join(sorted(unknown))}")
+            params = {**EFFECTS[effect], **{k: v for k, v in track.items() if k in EFFECTS[effect]}}
+            if params.get("easing", "linear") not in EASINGS:
+                raise ValueError(f"easing of track {i} must be one of {', '.join(EASINGS)}")
+            if effect == "reveal" and params["direction"] not in REVEAL_DIRECTIONS:
+                raise ValueError(f"direction of track {i} must be one of {', '.join(REVEAL_DIRECTIONS)}")
+            if effect == "fade" and params["direction"] not in ("in", "out"):
+                raise ValueError(f"direction of track {i} must be in or out")
+            if effect == "fade":
+                params["color"] = color(params["color"], f"color of track {i}")
+            if effect == "pan":
+                for name in ("start_offset", "end_offset"):
+                    params[name] = offset(params[name], f"{name} of track {i}")
+                    if not all(abs(v) <= MAX_OFFSET for v in params[name]):
+                        raise ValueError(f"{name} of track {i} must be within [-{MAX_OFFSET:g}, {MAX_OFFSET:g}]")
+            for name in ("start_scale", "end_scale", "max_angle", "frequency"):
+                if name in params:
+                    params[name] = float(params[name])
+            for name in ("start_scale", "end_scale"):
+                if name in params and not MIN_SCALE <= params[name] <= MAX_SCALE:
+                    raise ValueError(f"{name} of track {i} must be in [{MIN_SCALE:g}, {MAX_SCALE:g}]")
+            start = float(track.get("start", end))
+            duration = float(track.get("duration", 3.0))
+            if start < 0 or not duration > 0:
+                raise ValueError(f"track {i} needs start >= 0 and duration > 0")
+            tracks.append(Track(effect, start, duration, params))
+            end = tracks[-1].end
+        timeline = cls(tracks, float(data.get("fps", 30)), float(data.get("duration", max(t.end for t in tracks))),
+                       color(data.get("background", 255), "background"))
+        if not 0 < timeline.fps <= MAX_FPS:
+            raise ValueError(f"fps must be in (0, {MAX_FPS}]")
+        if not 0 < timeline.duration <= MAX_DURATION:
+            raise ValueError(f"duration must be in (0, {MAX_DURATION:g}] seconds")
+        return timeline
+
+
+class TimelineEngine(FrameEngine):
+    def __init__(self, image: np.ndarray, timeline: Timeline, fps: float | None = None,
+                 resample=Image.BILINEAR, cache_frames: int = 64):
+        super().__init__(image, timeline.duration, fps or timeline.fps)
+        W, H = self.size
+        t = self.times
+        self.resample = resample
+        self.background = timeline.background
+        # per frame: scale about the centre, then offset in output pixels, then rotation
+        # about the centre (degrees, counter-clockwise)
+        self.scales = np.ones(self.n_frames)
+        self.offsets = np.zeros((self.n_frames, 2))
+        self.angles = np.zeros(self.n_frames)
+        self.reveals: list[tuple[str, np.ndarray]] = []
+        self.fades: list[tuple[np.ndarray, Image.Image]] = []
+        for track in timeline.tracks:
+            p, params = track.progress(t), track.params
+            if track.effect == "zoom":
+                self.scales *= params["start_scale"] + (params["end_scale"] - params["start_scale"]) * p
+            elif track.effect == "pan":
+                start, end = np.array(params["start_offset"]), np.array(params["end_offset"])
+                self.offsets += (start + (end - start) * p[:, None]) * (W, H)
+            elif track.effect == "shake":
+                inside = (t >= track.start) & (t < track.end)
+                self.angles += np.where(inside, params["max_angle"] * np.sin(2 * np.pi * params["frequency"] * (t - track.start)), 0)
+            elif track.effect == "reveal":
+                length = W if params["direction"] in ("right", "left") else H
+                # visible rows / columns per frame: count of gradient values < progress
+                self.reveals.append((params["direction"], np.searchsorted(np.linspace(0, 1, length), p, side="left")))
+            elif track.effect == "fade":
+                alpha = 1 - p if params["direction"] == "in" else p
+                self.fades.append((alpha, Image.new("RGB", self.size, params["color"])))
+        # the sine repeats every period, so shaken frames mostly share an angle with an earlier one
+        self.angles = np.round(self.angles, 9)
+        self.source = Image.fromarray(self.image)
+        # frames without rotation come out of one resample of the region that lands on the
+        # canvas, padded with the background wide enough to keep every region inside
+        half_w, half_h = W / (2 * self.scales), H / (2 * self.scales)
+        centre_x = W / 2 - self.offsets[:, 0] / self.scales
+        centre_y = H / 2 - self.offsets[:, 1] / self.scales
+        pad_x = int(math.ceil(max(0.0, (half_w - centre_x).max(), (centre_x + half_w - W).max()))) + 4
+        pad_y = int(math.ceil(max(0.0, (half_h - centre_y).max(), (centre_y + half_h - H).max()))) + 4
+        self.boxes = np.stack([pad_x + centre_x - half_w, pad_y + centre_y - half_h,
+                               pad_x + centre_x + half_w, pad_y + centre_y + half_h], axis=1)
+        fits = (W + 2 * pad_x) * (H + 2 * pad_y) <= PADDED_MAX_FRAMES * W * H
+        self.padding = (pad_x, pad_y) if fits else None
+        self._padded = None
+        self.cache_frames = cache_frames
+        self._cache: dict[float, np.ndarray] = {}
+
+    @property
+    def padded(self) -> Image.Image:
+        if self._padded is None:
+            (W, H), (pad_x, pad_y) = self.size, self.padding
+            padded = np.empty((H + 2 * pad_y, W + 2 * pad_x, 3), dtype=np.uint8)
+            padded[:] = self.background
+            padded[pad_y:pad_y + H, pad_x:pad_x + W] = self.image
+            self._padded = Image.fromarray(padded)
+        return self._padded
+
+    def transform(self, scale: float, offset_x: float, offset_y: float, angle: float) -> Image.Image:
+        # inverse of scale -> offset -> rotate, mapping output pixels to source pixels
+        W, H = self.size
+        a = -math.radians(angle)
+        cos, sin = math.cos(a), math.sin(a)
+        matrix = (cos / scale, sin / scale, W / 2 - (cos * W / 2 + sin * H / 2 + offset_x) / scale,
+                  -sin / scale, cos / scale, H / 2 - (-sin * W / 2 + cos * H / 2 + offset_y) / scale)
+        return self.source.transform(self.size, Image.AFFINE, matrix, self.resample, fillcolor=self.background)
+
+    def render(self, index: int, out: np.ndarray):
+        scale, angle = float(self.scales[index]), float(self.angles[index])
+        offset_x, offset_y = self.offsets[index]
+        still = scale == 1 and offset_x == 0 and offset_y == 0
+        if still and angle % 360 == 0:
+            np.copyto(out, self.image)
+        elif angle % 360 == 0 and self.padding is not None:
+            np.copyto(out, np.asarray(self.padded.resize(self.size, self.resample, box=tuple(self.boxes[index]))))
+        elif still:
+            cached = self._cache.get(angle)
+            if cached is None:
+                cached = np.asarray(self.source.rotate(angle, resample=self.resample, expand=False, fillcolor=self.background))
+                if len(self._cache) < self.cache_frames:
+                    self._cache[angle] = cached
+            np.copyto(out, cached)
+        else:
+            np.copyto(out, np.asarray(self.transform(scale, offset_x, offset_y, angle)))
+
+        for direction, visible in self.reveals:
+            k = int(visible[index])
+            if direction == "right":
+                out[:, k:] = self.background
+            elif direction == "left":
+                out[:, :out.shape[1] - k] = self.background
+            elif direction == "down":
+                out[k:] = self.background
+            else:
+                out[:out.shape[0] - k] = self.background
+        for alpha, fill in self.fades:
+            if alpha[index] > 0:
+                np.copyto(out, np.asarray(Image.blend(Image.fromarray(out), fill, float(alpha[index]))))
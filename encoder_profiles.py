@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from encoder_settings import EncoderSettings
+
+logger = logging.getLogger(__name__)
+
+# render seconds a job may take per second of output; 0 keeps every endpoint's preset
+RENDER_BUDGET_RATIO = float(os.getenv("RENDER_BUDGET_RATIO", 10))
+# the fastest preset the budget may fall back to
+ENCODER_FASTEST_PRESET = os.getenv("ENCODER_FASTEST_PRESET", "veryfast")
+# 0: the cores available to the process, shared between the encoders running at once
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", 0))
+
+# x264 presets from slowest to fastest, with the megapixels a second one core encodes at
+# each (zoom frames of a manga panel, tune animation; benchmarks/bench_encoder_profiles.py).
+# These are only the starting point: finished jobs correct them per content type.
+PRESET_SPEEDS = {
+    "veryslow": 6.4,
+    "slower": 8.2,
+    "slow": 15.0,
+    "medium": 25.6,
+    "fast": 29.0,
+    "faster": 34.0,
+    "veryfast": 67.9,
+    "superfast": 84.1,
+    "ultrafast": 126.8,
+}
+PRESETS = list(PRESET_SPEEDS)
+
+
+@dataclass(frozen=True)
+class ContentProfile:
+    # tune: x264 -tune (None: none); keyint_seconds: longest GOP
+    tune: str | None
+    keyint_seconds: float
+
+
+CONTENT_PROFILES: dict[str, ContentProfile] = {
+    # manual effects: one drawn panel moving slowly, so keyframes can be far apart
+    "panel": ContentProfile("animation", 10),
+    # create_anime: generated anime clips cut together
+    "anime": ContentProfile("animation", 5),
+    # CogVideoX output is closer to film than to flat colour
+    "generated": ContentProfile(None, 5),
+}
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    content: str
+    settings: EncoderSettings
+    frames: int
+    megapixels: float
+    cores: int
+    estimate_s: float
+    budget_s: float | None
+
+
+_host_encoders = 1
+# observed / PRESET_SPEEDS throughput per content type: frame generation shares the
+# encode time, and machines differ from the one the seeds come from
+_corrections: dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def share_cores(encoders: int):
+    # pool initializer: this many processes encode side by side on the host
+    global _host_encoders
+    _host_encoders = max(1, encoders)
+
+
+def available_cores() -> int:
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        # a container's CPU quota (cgroup v2)
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def expected_speed(content: str, preset: str) -> float:
+    with _lock:
+        return PRESET_SPEEDS[preset] * _corrections.get(content, 1.0)
+
+
+def candidate_presets(preset: str) -> list[str]:
+    # the endpoint's (or quality tier's) preset is the best quality a job gets; the budget
+    # only ever moves it towards faster ones
+    if preset not in PRESET_SPEEDS:
+        return [preset]
+    first = PRESETS.index(preset)
+    last = max(first, PRESETS.index(ENCODER_FASTEST_PRESET) if ENCODER_FASTEST_PRESET in PRESET_SPEEDS else first)
+    return PRESETS[first:last + 1]
+
+
+def choose_profile(content: str, settings: EncoderSettings, size: tuple[int, int], fps: float, duration: float,
+                   encoders: int = 1) -> EncoderProfile:
+    # `encoders`: how many encoders this job runs at once (render_segments' workers)
+    profile = CONTENT_PROFILES[content]
+    cores = available_cores()
+    threads = ENCODER_THREADS or max(1, cores // (encoders * _host_encoders))
+    job_cores = min(cores, threads * encoders)
+    frames = max(1, round(duration * fps))
+    megapixels = size[0] * size[1] * frames / 1e6
+    budget = RENDER_BUDGET_RATIO * duration if RENDER_BUDGET_RATIO > 0 else None
+
+    for preset in candidate_presets(settings.preset):
+        speed = expected_speed(content, preset) if preset in PRESET_SPEEDS else None
+        estimate = megapixels / (speed * job_cores) if speed else 0.0
+        if budget is None or estimate <= budget:
+            break
+    tuned = settings.with_overrides(
+        preset=preset,
+        tune=profile.tune if settings.codec in ("libx264", "libx265") else None,
+        keyint=max(1, round(profile.keyint_seconds * fps)),
+        threads=threads,
+    )
+    return EncoderProfile(content, tuned, frames, megapixels, job_cores, estimate, budget)
+
+
+def observe(profile: EncoderProfile, elapsed: float):
+    preset = profile.settings.preset
+    if preset in PRESET_SPEEDS and elapsed > 0:
+        ratio = profile.megapixels / (elapsed * profile.cores) / PRESET_SPEEDS[preset]
+        with _lock:
+            previous = _corrections.get(profile.content)
+            _corrections[profile.content] = ratio if previous is None else 0.7 * previous + 0.3 * ratio
+    s = profile.settings
+    logger.info(
+        "%s: preset=%s tune=%s keyint=%d threads=%d crf=%d, %d frames in %.1f s (%.1f fps; estimate %.1f s, budget %s)",
+        profile.content, s.preset, s.tune, s.keyint, s.threads, s.crf, profile.frames, elapsed,
+        profile.frames / elapsed if elapsed > 0 else 0.0, profile.estimate_s,
+        f"{profile.budget_s:.1f} s" if profile.budget_s is not None else "none",
+    )
+
+
+@contextmanager
+def encoding(content: str, settings: EncoderSettings, size: tuple[int, int], fps: float, duration: float,
+             encoders: int = 1):
+    # yields the settings to encode with; a job that finishes is logged and corrects the
+    # speed estimates of the next ones
+    profile = choose_profile(content, settings, size, fps, duration, encoders)
+    started = time.perf_counter()
+    yield profile.settings
+    observe(profile, time.perf_counter() - started)
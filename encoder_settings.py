@@ -0,0 +1,30 @@
+from dataclasses import dataclass, replace
+
+
+# kept apart from video_encoder so modules `import app` loads (quality, encoder_profiles)
+# can use it without pulling in moviepy and boto3
+@dataclass(frozen=True)
+class EncoderSettings:
+    codec: str = "libx264"
+    preset: str = "medium"
+    crf: int = 23
+    pix_fmt: str = "yuv420p"
+    audio_codec: str = "aac"
+    # None leaves these to the encoder: x264 tune, frames between keyframes, encoder threads
+    tune: str | None = None
+    keyint: int | None = None
+    threads: int | None = None
+    extra: tuple[str, ...] = ()
+
+    def with_overrides(self, **overrides) -> "EncoderSettings":
+        return replace(self, **{k: v for k, v in overrides.items() if v is not None})
+
+    def video_args(self) -> list[str]:
+        args = ["-c:v", self.codec, "-preset", self.preset, "-crf", str(self.crf), "-pix_fmt", self.pix_fmt]
+        if self.tune:
+            args += ["-tune", self.tune]
+        if self.keyint:
+            args += ["-g", str(self.keyint)]
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        return args + list(self.extra)
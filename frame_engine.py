@@ -0,0 +1,51 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+from PIL import Image
+
+
+def smootherstep(x):
+    return 6*x**5 - 15*x**4 + 10*x**3
+
+
+def even_image(image: np.ndarray) -> np.ndarray:
+    # libx264 + yuv420p needs even dimensions; resize the source once instead of every frame
+    image = np.ascontiguousarray(image[..., :3], dtype=np.uint8)
+    h, w = image.shape[:2]
+    if w % 2 or h % 2:
+        image = np.asarray(Image.fromarray(image).resize(((w // 2) * 2, (h // 2) * 2), Image.LANCZOS))
+    return image
+
+
+class FrameEngine(ABC):
+    def __init__(self, image: np.ndarray, duration: float, fps: int):
+        self.image = even_image(image)
+        self.height, self.width = self.image.shape[:2]
+        self.duration = duration
+        self.fps = fps
+        # same frame times moviepy's iter_frames/write_videofile would request
+        self.times = np.arange(0, duration, 1.0 / fps)
+        self.n_frames = len(self.times)
+        self.buffer = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    @abstractmethod
+    def render(self, index: int, out: np.ndarray):
+        # draws frame `index` into `out`
+        ...
+
+    def frame(self, index: int) -> np.ndarray:
+        # the returned array is reused by the next call; copy it if it has to outlive the iteration
+        self.render(index, self.buffer)
+        return self.buffer
+
+    def frame_at(self, t: float) -> np.ndarray:
+        return self.frame(min(int(round(t * self.fps)), self.n_frames - 1))
+
+    def frames(self):
+        for i in range(self.n_frames):
+            yield self.frame(i)
+
@@ -0,0 +1,96 @@
+import io
+import math
+import os
+from typing import BinaryIO
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+MAX_IMAGE_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 50 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 100_000_000))
+# longest side of pages for panel detection, cropping and colorization; bigger scans are
+# reduced while decoding
+PAGE_MAX_SIDE = int(os.getenv("PAGE_MAX_SIDE", 4096))
+PAGE_MAX_SIZE = (PAGE_MAX_SIDE, PAGE_MAX_SIDE)
+# modes PIL can resize directly; the rest (palette, 1-bit, 16-bit) go to RGB first
+RESIZABLE_MODES = ("RGB", "RGBA", "L", "CMYK")
+BAND_PIXELS = 1 << 20
+
+# our own limit replaces PIL's decompression bomb guard (a warning from 89 MP on)
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def check_bytes(size: int | None):
+    if size is not None and size > MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f"image is {size} bytes, the limit is {MAX_IMAGE_BYTES}")
+
+
+def open_image(data: bytes | BinaryIO) -> Image.Image:
+    # `data` is the bytes or a seekable binary file (a spooled upload). Reads only the
+    # header; pixels are decoded on load(), after the limits are checked
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        check_bytes(len(data))
+        data = io.BytesIO(data)
+    else:
+        check_bytes(data.seek(0, io.SEEK_END))
+        data.seek(0)
+    try:
+        image = Image.open(data)
+    except UnidentifiedImageError:
+        raise InvalidImage("could not read image: not an image, or a format that is not supported")
+    except (OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f"could not read image: {e}")
+    w, h = image.size
+    if w * h > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"image is {w}x{h}, the limit is {MAX_IMAGE_PIXELS} pixels")
+    return image
+
+
+def to_array(image: Image.Image) -> np.ndarray:
+    # np.asarray(image) goes through tobytes(), which holds the pixels twice more while it
+    # joins the chunks; copying bands of rows keeps a single RGB copy next to PIL's
+    w, h = image.size
+    out = np.empty((h, w, 3), dtype=np.uint8)
+    rows = max(1, BAND_PIXELS // w)
+    for y in range(0, h, rows):
+        out[y:y + rows] = np.asarray(image.crop((0, y, w, min(h, y + rows))))
+    return out
+
+
+def decode_image(data: bytes | BinaryIO, max_size: tuple[int, int] | None = None) -> np.ndarray:
+    # RGB pixels, no larger than `max_size` (aspect kept). JPEGs decode straight at 1/2,
+    # 1/4 or 1/8 scale through draft() and other formats reduce() by an integer factor
+    # before the final resample, so a scan is not held at full size just to shrink it.
+    image = open_image(data)
+    try:
+        w, h = image.size
+        if max_size is not None and (w > max_size[0] or h > max_size[1]):
+            scale = min(max_size[0] / w, max_size[1] / h)
+            # thumbnail() only drafts at twice the target; anything at or above it will do
+            image.draft(None, (math.ceil(w * scale), math.ceil(h * scale)))
+            if image.mode not in RESIZABLE_MODES:
+                image = image.convert("RGB")
+            image.thumbnail(max_size, Image.BICUBIC, reducing_gap=2.0)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return to_array(image)
+    except (OSError, SyntaxError, ValueError) as e:
+        raise InvalidImage(f"could not decode image: {e}")
+
+
+def fit_image(image: np.ndarray, max_size: tuple[int, int]) -> np.ndarray:
+    # the same reduction for pixels that are already decoded (panels cut from a page)
+    h, w = image.shape[:2]
+    if w <= max_size[0] and h <= max_size[1]:
+        return image
+    fitted = Image.fromarray(image)
+    fitted.thumbnail(max_size, Image.BICUBIC, reducing_gap=2.0)
+    return to_array(fitted)
@@ -0,0 +1,200 @@
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# models loaded in this process, with how long each took; in workers the warm ones are
+# loaded by the initializer (or inherited from the parent when weights are shared through
+# fork) and the rest on first use
+_MODELS: dict[str, object] = {}
+_LOAD_SECONDS: dict[str, float] = {}
+
+UNLOADED, LOADING, READY, FAILED = "unloaded", "loading", "ready", "failed"
+
+
+class PoolBusy(Exception):
+    pass
+
+
+class ModelLoadError(Exception):
+    pass
+
+
+class WorkerCrashed(Exception):
+    # a worker died (OOM, a crash in native model code) while serving the call
+    pass
+
+
+def _load(path: str):
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+def _ensure(name: str, path: str):
+    if name not in _MODELS:
+        started = time.perf_counter()
+        try:
+            _MODELS[name] = _load(path)
+        except Exception as e:
+            raise ModelLoadError(f"loading {name} failed: {type(e).__name__}: {e}") from None
+        _LOAD_SECONDS[name] = time.perf_counter() - started
+    return _MODELS[name]
+
+
+def _init_worker(loaders: dict[str, str]):
+    for name, path in loaders.items():
+        _ensure(name, path)
+
+
+def _invoke(model_name: str, path: str, fn, args: tuple):
+    loaded = model_name in _MODELS
+    model = _ensure(model_name, path)
+    started = time.perf_counter()
+    result = fn(model, *args)
+    return result, None if loaded else _LOAD_SECONDS[model_name], time.perf_counter() - started
+
+
+def _ready() -> dict[str, float]:
+    return dict(_LOAD_SECONDS)
+
+
+class InferencePool:
+    # Bounded pool of worker processes serving the models listed in `loaders`
+    # ({"name": "module:loader_function"}). A worker loads a model the first time it gets a
+    # call for it; warm_up() loads the ones in `warm` into every worker up front. Calls are
+    # admitted up to `queue_size` in total and up to `limits[endpoint]` per endpoint;
+    # anything beyond that fails fast with PoolBusy instead of piling up behind the model.
+    # A worker that dies breaks the whole executor: the calls it had fail with WorkerCrashed,
+    # and the pool starts over with fresh workers for the next ones.
+
+    def __init__(self, loaders: dict[str, str], workers: int = 1, queue_size: int = 16,
+                 limits: dict[str, int] | None = None, timeout: float = 300, share_weights: bool = False,
+                 warm: list[str] | tuple[str, ...] = ()):
+        self.loaders = loaders
+        self.warm = [name for name in warm if name in loaders]
+        self.models = {name: {"state": UNLOADED, "load_seconds": None, "error": None} for name in loaders}
+        self.workers = workers
+        self.queue_size = queue_size
+        self.limits = limits or {}
+        self.timeout = timeout
+        self.share_weights = share_weights and "fork" in multiprocessing.get_all_start_methods()
+        self.in_flight = 0
+        self.per_endpoint: dict[str, int] = {}
+        self.executor: ProcessPoolExecutor | None = None
+        self.restarts = 0
+        self._warming: asyncio.Task | None = None
+
+    def start(self):
+        if self.executor is not None:
+            return
+        warm = {name: self.loaders[name] for name in self.warm}
+        if self.share_weights:
+            # load once in the parent; forked workers see the weights copy-on-write (models
+            # loaded later, on first use, are loaded by each worker on its own)
+            _init_worker(warm)
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context("spawn")
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context,
+            initializer=_init_worker, initargs=(warm,),
+        )
+
+    async def warm_up(self):
+        for name in self.warm:
+            self.models[name]["state"] = LOADING
+        try:
+            self.start()
+            loop = asyncio.get_running_loop()
+            loaded = await asyncio.gather(*(loop.run_in_executor(self.executor, _ready) for _ in range(self.workers)))
+        except Exception as e:
+            for name in self.warm:
+                self.models[name].update(state=FAILED, error=f"{type(e).__name__}: {e}")
+            raise
+        for name in self.warm:
+            self.models[name].update(state=READY, load_seconds=max(w.get(name, 0.0) for w in loaded))
+
+    def status(self) -> dict[str, dict]:
+        return {name: dict(model) for name, model in self.models.items()}
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def run(self, endpoint: str, model_name: str, fn, *args, timeout: float | None = None):
+        limit = self.limits.get(endpoint, self.queue_size)
+        if self.in_flight >= self.queue_size or self.per_endpoint.get(endpoint, 0) >= limit:
+            raise PoolBusy(endpoint)
+
+        self.start()
+        self.in_flight += 1
+        self.per_endpoint[endpoint] = self.per_endpoint.get(endpoint, 0) + 1
+        loop = asyncio.get_running_loop()
+        model = self.models[model_name]
+        if model["state"] != READY:
+            model["state"] = LOADING
+        submitted = time.perf_counter()
+        executor = self.executor
+        try:
+            future = executor.submit(_invoke, model_name, self.loaders[model_name], fn, args)
+        except BrokenProcessPool:
+            self._release(endpoint)
+            self._restart(executor)
+            raise WorkerCrashed(model_name) from None
+        # the slot is held until the worker is actually free again, even if the caller timed out
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release, endpoint))
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._loaded, model_name, f))
+        try:
+            result, load_seconds, seconds = await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise WorkerCrashed(model_name) from None
+        # the rest of the round trip is waiting for a free worker and pickling the arrays
+        metrics.record(f"{model_name}_inference", seconds)
+        metrics.record(f"{model_name}_queue_wait", max(0.0, time.perf_counter() - submitted - seconds - (load_seconds or 0)))
+        if load_seconds is not None:
+            metrics.record(f"{model_name}_load", load_seconds)
+        return result
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        # every call that was on the broken executor lands here; only the first replaces it
+        if self.executor is not broken:
+            return
+        logger.error("inference worker died, restarting the pool (%d workers)", self.workers)
+        self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+        # the models went with the workers; the warm ones are loaded again in the background
+        for model in self.models.values():
+            model.update(state=UNLOADED, load_seconds=None, error=None)
+        if self.warm and (self._warming is None or self._warming.done()):
+            self._warming = asyncio.ensure_future(self._rewarm())
+        else:
+            self.start()
+
+    async def _rewarm(self):
+        try:
+            await self.warm_up()
+        except Exception:
+            logger.exception("warming the restarted inference pool failed")
+
+    def _loaded(self, model_name: str, future):
+        model = self.models[model_name]
+        error = None if future.cancelled() else future.exception()
+        if error is None and not future.cancelled():
+            # the model is up in at least one worker
+            model.update(state=READY, error=None, load_seconds=future.result()[1] or model["load_seconds"])
+        elif isinstance(error, ModelLoadError) and model["state"] != READY:
+            model.update(state=FAILED, error=str(error))
+
+    def _release(self, endpoint: str):
+        self.in_flight -= 1
+        self.per_endpoint[endpoint] -= 1
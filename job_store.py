@@ -0,0 +1,493 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from uuid import uuid4
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+
+
+def public_view(job: dict) -> dict:
+    view = {"task_id": job["id"], "kind": job["kind"], "status": job["status"]}
+    if job["status"] in (PENDING, RUNNING) and job.get("progress"):
+        view["progress"] = job["progress"]
+    if job["status"] == DONE:
+        view["result"] = job["result"]
+    elif job["status"] == FAILED:
+        view["error"] = job["error"]
+    return view
+
+
+class JobStore(ABC):
+    # Jobs move pending -> running -> done | failed, or to cancelled from either of the first
+    # two. A running job holds a lease; a worker that dies without finishing lets the lease
+    # expire and the job goes back to pending (or to failed once it has used up
+    # max_attempts). Finished jobs are evicted after ttl. The input blob is dropped when a
+    # job finishes, unless its payload has "keep_data" (e.g. drafts, to render again).
+
+    def __init__(self, ttl: float = 24 * 3600, lease: float = 60, max_attempts: int = 3, reuse_ttl: float = 3600):
+        self.ttl = ttl
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.reuse_ttl = reuse_ttl
+
+    @abstractmethod
+    def create(self, kind: str, payload: dict, data: bytes | memoryview | None = None, key: str | None = None) -> str:
+        # With a key, a pending or running job with the same key (or one that finished
+        # within reuse_ttl) is returned instead of creating a new one; failed jobs never match.
+        ...
+
+    @abstractmethod
+    def coalesced(self) -> int:
+        # how many create() calls were answered with an existing job, ever: the count
+        # doesn't drop when maintain() evicts those jobs
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def data(self, job_id: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    def depth(self) -> dict[str, int]:
+        # pending jobs per kind
+        ...
+
+    @abstractmethod
+    def claim(self, kinds: list[str], worker: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def renew(self, job_id: str, worker: str) -> bool:
+        ...
+
+    @abstractmethod
+    def progress(self, job_id: str, progress: dict) -> None:
+        # latest progress report of a running job, shown in its status
+        ...
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> bool:
+        # False if the job doesn't exist or has already finished; a running job is stopped
+        # by its runner the next time it renews the lease
+        ...
+
+    @abstractmethod
+    def finish(self, job_id: str, result, keep_data: bool = False) -> None:
+        ...
+
+    @abstractmethod
+    def fail(self, job_id: str, error: str) -> None:
+        ...
+
+    @abstractmethod
+    def maintain(self) -> None:
+        ...
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.jobs: dict[str, dict] = {}
+        self.keys: dict[str, str] = {}
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def create(self, kind: str, payload: dict, data: bytes | memoryview | None = None, key: str | None = None) -> str:
+        job_id = str(uuid4())
+        now = time.time()
+        with self.lock:
+            existing = self.jobs.get(self.keys.get(key))
+            if existing and (existing["status"] in (PENDING, RUNNING)
+                             or existing["status"] == DONE and existing["updated_at"] > now - self.reuse_ttl):
+                existing["hits"] += 1
+                self.hits += 1
+                return existing["id"]
+            self.jobs[job_id] = {
+                # a view of a spooled upload goes away with the request
+                "id": job_id, "kind": kind, "status": PENDING, "payload": payload,
+                "data": bytes(data) if isinstance(data, memoryview) else data,
+                "result": None, "error": None, "progress": None, "attempts": 0, "worker": None,
+                "dedup_key": key, "hits": 0, "created_at": now, "updated_at": now, "lease_until": None,
+            }
+            if key is not None:
+                self.keys[key] = job_id
+        return job_id
+
+    def coalesced(self) -> int:
+        with self.lock:
+            return self.hits
+
+    def get(self, job_id: str) -> dict | None:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def data(self, job_id: str) -> bytes | None:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job["data"] if job else None
+
+    def depth(self) -> dict[str, int]:
+        with self.lock:
+            depth = {}
+            for job in self.jobs.values():
+                if job["status"] == PENDING:
+                    depth[job["kind"]] = depth.get(job["kind"], 0) + 1
+            return depth
+
+    def claim(self, kinds: list[str], worker: str) -> dict | None:
+        now = time.time()
+        with self.lock:
+            pending = [j for j in self.jobs.values() if j["status"] == PENDING and j["kind"] in kinds]
+            if not pending:
+                return None
+            job = min(pending, key=lambda j: j["created_at"])
+            job.update(status=RUNNING, worker=worker, attempts=job["attempts"] + 1, progress=None,
+                       updated_at=now, lease_until=now + self.lease)
+            return dict(job)
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job["status"] != RUNNING or job["worker"] != worker:
+                return False
+            job["lease_until"] = time.time() + self.lease
+            return True
+
+    def progress(self, job_id: str, progress: dict) -> None:
+        with self.lock:
+            if job_id in self.jobs and self.jobs[job_id]["status"] == RUNNING:
+                self.jobs[job_id]["progress"] = progress
+
+    def cancel(self, job_id: str) -> bool:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job["status"] not in (PENDING, RUNNING):
+                return False
+            job.update(status=CANCELLED, data=None, updated_at=time.time(), lease_until=None)
+            return True
+
+    def finish(self, job_id: str, result, keep_data: bool = False) -> None:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job and job["status"] != CANCELLED:
+                job.update(status=DONE, result=result, data=job["data"] if keep_data else None,
+                           updated_at=time.time(), lease_until=None)
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self.lock:
+            if job_id in self.jobs and self.jobs[job_id]["status"] != CANCELLED:
+                self.jobs[job_id].update(status=FAILED, error=error, data=None, updated_at=time.time(), lease_until=None)
+
+    def maintain(self) -> None:
+        now = time.time()
+        with self.lock:
+            for job_id, job in list(self.jobs.items()):
+                if job["status"] in (DONE, FAILED, CANCELLED) and job["updated_at"] < now - self.ttl:
+                    del self.jobs[job_id]
+                    if self.keys.get(job["dedup_key"]) == job_id:
+                        del self.keys[job["dedup_key"]]
+                elif job["status"] == RUNNING and job["lease_until"] < now:
+                    if job["attempts"] >= self.max_attempts:
+                        job.update(status=FAILED, error="worker lost", data=None, updated_at=now, lease_until=None)
+                    else:
+                        job.update(status=PENDING, worker=None, updated_at=now, lease_until=None)
+
+
+class SQLiteJobStore(JobStore):
+    # one database file shared by every uvicorn worker on the host; claims are a single
+    # UPDATE ... RETURNING so two workers can never pick up the same job
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    data BLOB,
+                    result TEXT,
+                    error TEXT,
+                    progress TEXT,
+                    dedup_key TEXT,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    lease_until REAL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, kind, created_at)")
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            for name, declaration in (("progress", "TEXT"), ("dedup_key", "TEXT"), ("hits", "INTEGER NOT NULL DEFAULT 0")):
+                if name not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {declaration}")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_dedup_key ON jobs (dedup_key)")
+            # totals that outlive the job rows maintain() deletes; a database from before
+            # the table starts from the hits of the jobs it still has
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            db.execute("INSERT OR IGNORE INTO counters SELECT 'coalesced', COALESCE(SUM(hits), 0) FROM jobs")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # autocommit: every statement below is its own transaction
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _row(self, row) -> dict | None:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job["progress"] = json.loads(job["progress"]) if job.get("progress") is not None else None
+        return job
+
+    def create(self, kind: str, payload: dict, data: bytes | memoryview | None = None, key: str | None = None) -> str:
+        job_id = str(uuid4())
+        now = time.time()
+        with self._connect() as db:
+            # the write lock up front, so two workers can't both miss and insert the same key
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if key is not None:
+                    row = db.execute(
+                        "SELECT id FROM jobs WHERE dedup_key = ? AND (status IN (?, ?) OR status = ? AND updated_at > ?) "
+                        "ORDER BY created_at DESC LIMIT 1",
+                        (key, PENDING, RUNNING, DONE, now - self.reuse_ttl),
+                    ).fetchone()
+                    if row is not None:
+                        db.execute("UPDATE jobs SET hits = hits + 1 WHERE id = ?", (row["id"],))
+                        db.execute("UPDATE counters SET value = value + 1 WHERE name = 'coalesced'")
+                        db.execute("COMMIT")
+                        return row["id"]
+                db.execute(
+                    "INSERT INTO jobs (id, kind, status, payload, data, dedup_key, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, PENDING, json.dumps(payload), data, key, now, now),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def coalesced(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT value FROM counters WHERE name = 'coalesced'").fetchone()[0]
+
+    def get(self, job_id: str) -> dict | None:
+        with self._connect() as db:
+            # status polls don't need the input blob
+            row = db.execute(
+                "SELECT id, kind, status, payload, NULL AS data, result, error, progress, dedup_key, hits, attempts, worker, "
+                "created_at, updated_at, lease_until FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            return self._row(row)
+
+    def data(self, job_id: str) -> bytes | None:
+        with self._connect() as db:
+            row = db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return row["data"] if row else None
+
+    def depth(self) -> dict[str, int]:
+        with self._connect() as db:
+            rows = db.execute("SELECT kind, COUNT(*) FROM jobs WHERE status = ? GROUP BY kind", (PENDING,)).fetchall()
+            return {kind: count for kind, count in rows}
+
+    def claim(self, kinds: list[str], worker: str) -> dict | None:
+        now = time.time()
+        marks = ",".join("?" * len(kinds))
+        with self._connect() as db:
+            row = db.execute(
+                f"""
+                UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, progress = NULL, updated_at = ?, lease_until = ?
+                WHERE id = (
+                    SELECT id FROM jobs WHERE status = ? AND kind IN ({marks}) ORDER BY created_at LIMIT 1
+                ) AND status = ?
+                RETURNING *
+                """,
+                (RUNNING, worker, now, now + self.lease, PENDING, *kinds, PENDING),
+            ).fetchone()
+        return self._row(row)
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ? AND worker = ?",
+                (time.time() + self.lease, job_id, RUNNING, worker),
+            )
+            return cursor.rowcount == 1
+
+    def progress(self, job_id: str, progress: dict) -> None:
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (json.dumps(progress), time.time(), job_id, RUNNING),
+            )
+
+    def cancel(self, job_id: str) -> bool:
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, data = NULL, updated_at = ?, lease_until = NULL WHERE id = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), job_id, PENDING, RUNNING),
+            )
+            return cursor.rowcount == 1
+
+    def finish(self, job_id: str, result, keep_data: bool = False) -> None:
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, data = CASE WHEN ? THEN data END, updated_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status != ?",
+                (DONE, json.dumps(result), keep_data, time.time(), job_id, CANCELLED),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, data = NULL, updated_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status != ?",
+                (FAILED, error, time.time(), job_id, CANCELLED),
+            )
+
+    def maintain(self) -> None:
+        now = time.time()
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?", (DONE, FAILED, CANCELLED, now - self.ttl))
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, data = NULL, updated_at = ?, lease_until = NULL "
+                "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, "worker lost", now, RUNNING, now, self.max_attempts),
+            )
+            db.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, updated_at = ?, lease_until = NULL "
+                "WHERE status = ? AND lease_until < ?",
+                (PENDING, now, RUNNING, now),
+            )
+
+
+def make_job_store() -> JobStore:
+    options = {
+        "ttl": float(os.getenv("JOB_TTL_SECONDS", 24 * 3600)),
+        "lease": float(os.getenv("JOB_LEASE_SECONDS", 60)),
+        "max_attempts": int(os.getenv("JOB_MAX_ATTEMPTS", 3)),
+        "reuse_ttl": float(os.getenv("JOB_REUSE_TTL_SECONDS", 3600)),
+    }
+    if os.getenv("JOB_STORE", "sqlite") == "memory":
+        return MemoryJobStore(**options)
+    return SQLiteJobStore(os.getenv("JOB_DB_PATH", "./jobs.sqlite3"), **options)
+
+
+JOBS = metrics.REGISTRY.counter("manga_jobs_total", "Jobs run by this process, by outcome", ("kind", "outcome"))
+JOB_SECONDS = metrics.REGISTRY.histogram("manga_job_seconds", "Time from claiming a job to its outcome", ("kind",))
+JOB_WAIT_SECONDS = metrics.REGISTRY.histogram("manga_job_wait_seconds", "Time jobs were pending before this process claimed them", ("kind",))
+
+
+class JobRunner:
+    # Polls the store for pending jobs of the registered kinds and runs their handlers
+    # (async functions taking the job dict) with bounded concurrency. Every process runs its
+    # own runner against the shared store.
+
+    def __init__(self, store: JobStore, handlers: dict, concurrency: int = 4, poll_interval: float = 0.5):
+        self.store = store
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.worker = f"{os.getpid()}-{uuid4().hex[:8]}"
+        self.active: dict[str, asyncio.Task] = {}
+        self.kinds: dict[str, str] = {}
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        for task in list(self.active.values()):
+            task.cancel()
+
+    def notify(self):
+        self.wakeup.set()
+
+    def cancel(self, job_id: str):
+        # stops the handler if this runner has the job; other runners notice at their next renewal
+        if job_id in self.active:
+            self.active[job_id].cancel()
+
+    async def _loop(self):
+        last_maintenance = 0.0
+        while True:
+            now = time.monotonic()
+            if now - last_maintenance > self.store.lease / 3:
+                last_maintenance = now
+                await asyncio.to_thread(self.store.maintain)
+                for job_id in list(self.active):
+                    if not await asyncio.to_thread(self.store.renew, job_id, self.worker):
+                        job = await asyncio.to_thread(self.store.get, job_id)
+                        if job and job["status"] == CANCELLED:
+                            self.cancel(job_id)
+
+            while len(self.active) < self.concurrency:
+                job = await asyncio.to_thread(self.store.claim, list(self.handlers), self.worker)
+                if job is None:
+                    break
+                JOB_WAIT_SECONDS.observe(max(0.0, time.time() - job["created_at"]), kind=job["kind"])
+                self.kinds[job["id"]] = job["kind"]
+                self.active[job["id"]] = asyncio.get_running_loop().create_task(self._run(job))
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def in_flight(self) -> dict[str, int]:
+        counts = {}
+        for kind in self.kinds.values():
+            counts[kind] = counts.get(kind, 0) + 1
+        return counts
+
+    async def _run(self, job: dict):
+        started, outcome = time.perf_counter(), CANCELLED
+        try:
+            result = await self.handlers[job["kind"]](job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            outcome = FAILED
+            logger.exception("%s job %s failed", job["kind"], job["id"])
+            await asyncio.to_thread(self.store.fail, job["id"], f"{type(e).__name__}: {e}")
+        else:
+            outcome = DONE
+            await asyncio.to_thread(self.store.finish, job["id"], result, bool(job["payload"].get("keep_data")))
+        finally:
+            JOBS.inc(kind=job["kind"], outcome=outcome)
+            JOB_SECONDS.observe(time.perf_counter() - started, kind=job["kind"])
+            self.active.pop(job["id"], None)
+            self.kinds.pop(job["id"], None)
+            self.wakeup.set()
@@ -0,0 +1,181 @@
+import contextlib
+import contextvars
+import math
+import threading
+import time
+
+# seconds; stages run from a few milliseconds (decode, encode) to minutes (renders, generations)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _labels(names: tuple[str, ...], values: dict) -> tuple:
+    if set(values) != set(names):
+        raise ValueError(f"expected labels {names}, got {tuple(values)}")
+    return tuple(str(values[name]) for name in names)
+
+
+def _format(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"'.replace("\n", " ") for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values: dict[tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(self.labels, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name + _format(self.labels, key), value) for key, value in self.values.items()]
+
+
+class Gauge:
+    # read when scraped: `read` returns the value, or {label values: value} for labelled gauges
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.labels, self.read = name, help, labels, read
+
+    def samples(self):
+        value = self.read()
+        if not self.labels:
+            return [(self.name, value)]
+        return [(self.name + _format(self.labels, key if isinstance(key, tuple) else (key,)), v) for key, v in value.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self.values: dict[tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(self.labels, labels)
+        with self.lock:
+            counts = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        samples = []
+        for key, counts in values.items():
+            total = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                total += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                samples.append((self.name + "_bucket" + _format(self.labels, key, f'le="{le}"'), total))
+            samples.append((self.name + "_sum" + _format(self.labels, key), counts[-1]))
+            samples.append((self.name + "_count" + _format(self.labels, key), total))
+        return samples
+
+
+class Registry:
+    # Prometheus text exposition of everything registered in this process; with several
+    # uvicorn workers every process is scraped on its own
+
+    def __init__(self):
+        self.metrics: dict[str, object] = {}
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, read, labels: tuple[str, ...] = ()) -> Gauge:
+        # re-registering replaces the reader, so the app can point it at its own objects
+        gauge = Gauge(name, help, read, labels)
+        self.metrics[name] = gauge
+        return gauge
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value:.6g}" if isinstance(value, float) else f"{name} {value}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram("manga_stage_seconds", "Time spent in each processing stage", ("stage",))
+
+# spans of the request or job being profiled, if any: a list of (stage, offset, seconds)
+_trace: contextvars.ContextVar[list | None] = contextvars.ContextVar("trace", default=None)
+
+
+def record(stage: str, seconds: float, started: float | None = None):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, started, seconds))
+
+
+@contextlib.contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started, started)
+
+
+def timed_iter(iterable, stage: str):
+    # the time spent producing the items (e.g. rendering frames), recorded once at the end;
+    # whatever the consumer does in between is not counted
+    busy, started = 0.0, time.perf_counter()
+    iterator = iter(iterable)
+    try:
+        while True:
+            t = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                busy += time.perf_counter() - t
+            yield item
+    finally:
+        record(stage, busy, started)
+
+
+@contextlib.contextmanager
+def trace():
+    # collects the spans recorded in this context (threads started with asyncio.to_thread
+    # included), e.g. to return them from a worker process or attach them to a profile
+    spans = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+def replay(spans: list):
+    # spans recorded in another process (see trace())
+    for stage, started, seconds in spans:
+        record(stage, seconds)
@@ -0,0 +1,95 @@
+import asyncio
+import math
+
+import numpy as np
+
+
+class PanelBatcher:
+    # Collects concurrent page submissions for a few milliseconds and runs them through the
+    # detector as one batch. Pages are bucketed by size and padded with white up to the
+    # bucket's shape, so a batch is a set of equally sized arrays.
+
+    def __init__(self, predict_batch, max_batch: int = 8, max_wait_ms: float = 10, bucket_px: int = 256, executor=None, max_concurrent_batches: int = 1):
+        self.predict_batch = predict_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.bucket_px = bucket_px
+        self.executor = executor
+        # the model owns one device; running batches side by side only splits it
+        self.running = asyncio.Semaphore(max_concurrent_batches)
+        self.pending: dict[tuple[int, int], list[tuple[np.ndarray, asyncio.Future]]] = {}
+        self.timers: dict[tuple[int, int], asyncio.TimerHandle] = {}
+        self.batches = 0
+        self.pages = 0
+
+    def bucket(self, image: np.ndarray) -> tuple[int, int]:
+        h, w = image.shape[:2]
+        return math.ceil(h / self.bucket_px) * self.bucket_px, math.ceil(w / self.bucket_px) * self.bucket_px
+
+    async def submit(self, image: np.ndarray):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = self.bucket(image)
+        queue = self.pending.setdefault(key, [])
+        queue.append((image, future))
+
+        if len(queue) >= self.max_batch:
+            self._flush(key)
+        elif key not in self.timers:
+            self.timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        return await future
+
+    async def submit_many(self, images: list[np.ndarray]) -> list:
+        return await asyncio.gather(*(self.submit(image) for image in images))
+
+    def _flush(self, key: tuple[int, int]):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.pending.pop(key, [])
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(key, batch))
+
+    async def _run(self, key: tuple[int, int], batch: list[tuple[np.ndarray, asyncio.Future]]):
+        images = [pad_to(image, key) for image, _ in batch]
+        try:
+            loop = asyncio.get_running_loop()
+            async with self.running:
+                if asyncio.iscoroutinefunction(self.predict_batch):
+                    results = await self.predict_batch(images)
+                else:
+                    results = await loop.run_in_executor(self.executor, self.predict_batch, images)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.pages += len(batch)
+        for (image, future), bboxes in zip(batch, results):
+            if not future.done():
+                future.set_result(clip_bboxes(bboxes, image.shape[:2]))
+
+
+def pad_to(image: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    h, w = image.shape[:2]
+    if (h, w) == shape:
+        return image
+    padded = np.full((*shape, image.shape[2]), 255, dtype=image.dtype)
+    padded[:h, :w] = image
+    return padded
+
+
+def clip_bboxes(bboxes, shape: tuple[int, int]) -> list[list[float]]:
+    # padding only extends the page right and down, so boxes keep their coordinates;
+    # drop the ones that ended up entirely in the padding
+    h, w = shape
+    clipped = []
+    for box in bboxes:
+        x1, y1, x2, y2 = map(float, box)
+        x1, x2 = max(0, min(x1, w)), max(0, min(x2, w))
+        y1, y2 = max(0, min(y1, h)), max(0, min(y2, h))
+        if x2 > x1 and y2 > y1:
+            clipped.append([x1, y1, x2, y2])
+    return clipped
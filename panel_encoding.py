@@ -0,0 +1,90 @@
+import asyncio
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import numpy as np
+from PIL import Image
+
+import metrics
+
+# format -> (PIL format, content type, default level, valid levels); the level is zlib's
+# compress_level for PNG and quality for the lossy ones
+FORMATS = {
+    "png": ("PNG", "image/png", 6, range(0, 10)),
+    "webp": ("WEBP", "image/webp", 90, range(1, 101)),
+    "jpeg": ("JPEG", "image/jpeg", 90, range(1, 101)),
+}
+
+# PIL drops the GIL while zlib/libjpeg/libwebp run, so panels really encode side by side
+encode_pool = ThreadPoolExecutor(max_workers=int(os.getenv("PANEL_ENCODE_THREADS", os.cpu_count() or 1)),
+                                 thread_name_prefix="panel-encode")
+
+
+def encode_image(image: np.ndarray, format: str = "png", level: int | None = None) -> bytes:
+    pil_format, _, default_level, _ = FORMATS[format]
+    level = default_level if level is None else level
+    options = {"compress_level": level} if format == "png" else {"quality": level}
+    buf = io.BytesIO()
+    with metrics.span(f"{format}_encode"):
+        Image.fromarray(image).save(buf, format=pil_format, **options)
+    return buf.getvalue()
+
+
+def encode_all(crops: list[np.ndarray], format: str = "png", level: int | None = None) -> list[asyncio.Future]:
+    # one future per crop, in panel order; they finish in any order
+    loop = asyncio.get_running_loop()
+    return [loop.run_in_executor(encode_pool, encode_image, crop, format, level) for crop in crops]
+
+
+class _Sink(io.RawIOBase):
+    # unseekable target for ZipFile, emptied after every member
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+async def zip_stream(boxes: list, encoded: list[asyncio.Future], format: str):
+    # panels.json first, then every crop as soon as it (and the ones before it) is encoded;
+    # members are stored, the images are compressed already
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("panels.json", json.dumps({"panels": boxes}))
+        yield sink.drain()
+        for i, future in enumerate(encoded):
+            archive.writestr(f"panel_{i:03d}.{format}", await future)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def multipart_boundary() -> str:
+    return uuid4().hex
+
+
+async def multipart_stream(boxes: list, encoded: list[asyncio.Future], format: str, boundary: str):
+    content_type = FORMATS[format][1]
+    for i, (box, future) in enumerate(zip(boxes, encoded)):
+        data = await future
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Disposition: attachment; name=\"panel\"; filename=\"panel_{i:03d}.{format}\"\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"X-Panel-Box: {','.join(str(v) for v in box)}\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
@@ -0,0 +1,106 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 32))
+
+# innermost frames of threads that are parked rather than working (idle pool workers, the
+# event loop waiting in select); their samples are counted but left out of the stacks
+IDLE = {
+    ("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+    ("thread.py", "_worker"), ("connection.py", "_recv"), ("connection.py", "_poll"),
+}
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    # Samples the Python stacks of every thread in the process every `interval` seconds from
+    # a thread of its own. Work other requests do at the same time shows up too, so profile
+    # on a quiet instance, or read the stacks with that in mind.
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.idle = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        self.seconds = time.perf_counter() - self.started
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopping.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                self.samples += 1
+                if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE:
+                    self.idle += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        # one "outer;...;inner count" line per stack, as flamegraph.pl and speedscope read it
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top(self, n: int = 25) -> list[dict]:
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        return [{"function": name, "self_samples": count, "total_samples": total[name]}
+                for name, count in own.most_common(n)]
+
+    def report(self, spans: list | None = None) -> dict:
+        return {
+            "seconds": round(self.seconds, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "idle_samples": self.idle,
+            "spans": [{"stage": stage, "offset": round(started - self.started, 4) if started else None,
+                       "seconds": round(seconds, 4)} for stage, started, seconds in spans or []],
+            "top": self.top(),
+            "folded": self.folded(),
+        }
+
+
+class ProfileStore:
+    # the last `keep` profiles of this process, by request or job id
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.keep = keep
+        self.profiles: OrderedDict[str, dict] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, profile_id: str, report: dict):
+        with self.lock:
+            self.profiles[profile_id] = report
+            while len(self.profiles) > self.keep:
+                self.profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> dict | None:
+        with self.lock:
+            return self.profiles.get(profile_id)
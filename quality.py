@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+from encoder_settings import EncoderSettings
+
+
+@dataclass(frozen=True)
+class QualityTier:
+    # scale: of the output resolution; max_fps: cap on the effect's frame rate (None keeps
+    # it); preset / crf: override the endpoint's encoder settings (None keeps them);
+    # resample: PIL filter of the timeline engine's zoom, pan and shake
+    scale: float = 1.0
+    max_fps: float | None = None
+    preset: str | None = None
+    crf: int | None = None
+    resample: int = Image.BILINEAR
+
+    def fps(self, fps: float) -> float:
+        return fps if self.max_fps is None else min(fps, self.max_fps)
+
+    def size(self, width: int, height: int) -> tuple[int, int]:
+        # even, for yuv420p
+        return max(2, int(width * self.scale) // 2 * 2), max(2, int(height * self.scale) // 2 * 2)
+
+    def encoder(self, settings: EncoderSettings) -> EncoderSettings:
+        return settings.with_overrides(preset=self.preset, crf=self.crf)
+
+    def image(self, image: np.ndarray) -> np.ndarray:
+        if self.scale == 1:
+            return image
+        h, w = image.shape[:2]
+        return np.asarray(Image.fromarray(image).resize(self.size(w, h), Image.BILINEAR, reducing_gap=2.0))
+
+
+# final is what the endpoints rendered before tiers existed; a draft of the same job spec
+# shows the same motion at half size and a quarter of the frames or less
+QUALITY_TIERS: dict[str, QualityTier] = {
+    "draft": QualityTier(scale=0.5, max_fps=15, preset="ultrafast", crf=28, resample=Image.NEAREST),
+    "standard": QualityTier(max_fps=60, preset="fast"),
+    "final": QualityTier(),
+}
+DEFAULT_QUALITY = "final"
+
+
+def quality_tier(name: str) -> QualityTier:
+    if name not in QUALITY_TIERS:
+        raise ValueError(f"quality must be one of {', '.join(QUALITY_TIERS)}")
+    return QUALITY_TIERS[name]
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+def image_key(image: np.ndarray, **params) -> str:
+    # hash of the decoded pixels, so re-encoded or re-compressed uploads of the same page
+    # still hit, plus everything that changes the output (model, revision, format, ...)
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha256()
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    digest.update(f"{image.shape}{image.dtype}".encode())
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # Two tiers of encoded results: an LRU in memory bounded by bytes, and a directory of
+    # files on disk bounded by total size, evicted least recently used first.
+
+    def __init__(self, directory: str | Path | None, memory_bytes: int = 256 * 1024 * 1024, disk_bytes: int = 2 * 1024 ** 3):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory: OrderedDict[str, bytes] = OrderedDict()
+        self.memory_used = 0
+        self.disk: OrderedDict[str, int] = OrderedDict()
+        self.disk_used = 0
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "memory_evictions": 0, "disk_evictions": 0}
+
+        self.directory = Path(directory) if directory else None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            files = [p for p in self.directory.glob("*/*") if len(p.name) == 64]
+            files.sort(key=lambda p: p.stat().st_mtime)
+            for path in files:
+                size = path.stat().st_size
+                self.disk[path.name] = size
+                self.disk_used += size
+            self._evict_disk()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: str) -> bytes | None:
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+            on_disk = key in self.disk
+
+        if on_disk:
+            path = self._path(key)
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+            except FileNotFoundError:
+                data = None
+            if data is not None:
+                with self.lock:
+                    if key in self.disk:
+                        self.disk.move_to_end(key)
+                    self.stats["disk_hits"] += 1
+                    self._put_memory(key, data)
+                return data
+
+        with self.lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, data: bytes):
+        with self.lock:
+            self._put_memory(key, data)
+        if not self.directory or len(data) > self.disk_bytes:
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self.lock:
+            self.disk_used += len(data) - self.disk.pop(key, 0)
+            self.disk[key] = len(data)
+            self._evict_disk()
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        self.memory_used += len(data) - len(self.memory.pop(key, b""))
+        self.memory[key] = data
+        while self.memory_used > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_used -= len(evicted)
+            self.stats["memory_evictions"] += 1
+
+    def _evict_disk(self):
+        while self.disk_used > self.disk_bytes:
+            key, size = self.disk.popitem(last=False)
+            self.disk_used -= size
+            self.stats["disk_evictions"] += 1
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                **self.stats,
+                "memory_items": len(self.memory),
+                "memory_bytes": self.memory_used,
+                "disk_items": len(self.disk),
+                "disk_bytes": self.disk_used,
+            }
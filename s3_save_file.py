@@ -1,5 +1,15 @@
+import asyncio
+import io
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+import metrics
 
 
 from dotenv import load_dotenv
@@ -9,31 +19,154 @@ load_dotenv()
 ACCESS_KEY = os.getenv("ACCESS_KEY")
 SECRET_KEY = os.getenv("SECRET_KEY")
 BUCKET_NAME = os.getenv("BUCKET_NAME")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "https://storage.yandexcloud.net")
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE_MB", 8)) * 1024 * 1024
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", 8))
 
+# S3 rejects multipart parts under 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
 
-def load_file_s3(OUTPUT_NAME , ACCESS_KEY=ACCESS_KEY, SECRET_KEY=SECRET_KEY, BUCKET_NAME=BUCKET_NAME, ContentType="video/mp4"):
+
+def make_s3_client(ACCESS_KEY=ACCESS_KEY, SECRET_KEY=SECRET_KEY, max_pool_connections=10):
     session = boto3.session.Session()
-    s3 = session.client(
+    return session.client(
         service_name="s3",
-        endpoint_url="https://storage.yandexcloud.net",
+        endpoint_url=S3_ENDPOINT_URL,
         region_name="ru-central1",
         aws_access_key_id=ACCESS_KEY,
         aws_secret_access_key=SECRET_KEY,
+        config=Config(
+            max_pool_connections=max_pool_connections,
+            retries={"max_attempts": 3, "mode": "standard"},
+            tcp_keepalive=True,
+            # the default CRC checksums since botocore 1.36 aren't understood by every
+            # S3-compatible store; only send them where the API demands it
+            request_checksum_calculation="when_required",
+            response_checksum_validation="when_required",
+        ),
     )
 
-    s3.upload_file(
-        Filename=OUTPUT_NAME,
-        Bucket=BUCKET_NAME,
-        Key=f"videos/{OUTPUT_NAME}",
-        ExtraArgs={
-            "ACL": "public-read",
-            "ContentType": ContentType,
-        },
-    )
-    
-    url = s3.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": BUCKET_NAME, "Key": f"videos/{OUTPUT_NAME}"},
-            # ExpiresIn=3600  # сек
+
+class S3Uploader:
+    # One client (boto3 clients are thread-safe) with a connection pool big enough for
+    # `concurrency` parallel part uploads, shared by every upload in the process.
+
+    def __init__(self, access_key=ACCESS_KEY, secret_key=SECRET_KEY, bucket=BUCKET_NAME,
+                 part_size: int = S3_PART_SIZE, concurrency: int = S3_UPLOAD_CONCURRENCY):
+        self.bucket = bucket
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.concurrency = max(1, concurrency)
+        self.client = make_s3_client(access_key, secret_key, max_pool_connections=self.concurrency * 2)
+        self.config = TransferConfig(
+            multipart_threshold=self.part_size, multipart_chunksize=self.part_size,
+            max_concurrency=self.concurrency, use_threads=True,
         )
-    return url
\ No newline at end of file
+        self.parts = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="s3-part")
+
+    def url(self, key: str) -> str:
+        return self.client.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key})
+
+    def upload_path(self, path: str, name: str | None = None, ContentType="video/mp4") -> str:
+        key = f"videos/{name or path}"
+        with metrics.span("s3_upload"):
+            self.client.upload_file(
+                Filename=path, Bucket=self.bucket, Key=key,
+                ExtraArgs={"ACL": "public-read", "ContentType": ContentType}, Config=self.config,
+            )
+        return self.url(key)
+
+    def upload_bytes(self, data, name: str, ContentType="video/mp4") -> str:
+        # `data` is bytes or a readable binary file object
+        key = f"videos/{name}"
+        fileobj = io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        with metrics.span("s3_upload"):
+            self.client.upload_fileobj(
+                Fileobj=fileobj, Bucket=self.bucket, Key=key,
+                ExtraArgs={"ACL": "public-read", "ContentType": ContentType}, Config=self.config,
+            )
+        return self.url(key)
+
+    def upload_stream(self, chunks, name: str, ContentType="video/mp4") -> str:
+        # multipart upload of an iterable of byte chunks whose total size isn't known up front
+        # (e.g. ffmpeg's stdout); up to `concurrency` parts are in flight while the producer
+        # keeps going, so memory stays around concurrency * part_size. The s3_upload span is
+        # the time spent in S3 requests, summed over the parallel parts.
+        key = f"videos/{name}"
+        upload_id = None
+        futures = []
+        buffer = bytearray()
+        busy, started = [], time.perf_counter()
+
+        def timed(request, **kwargs):
+            started = time.perf_counter()
+            try:
+                return request(**kwargs)
+            finally:
+                busy.append(time.perf_counter() - started)
+
+        def submit():
+            while sum(not f.done() for f in futures) >= self.concurrency:
+                wait(futures, return_when=FIRST_COMPLETED)
+            futures.append(self.parts.submit(
+                timed, self.client.upload_part, Bucket=self.bucket, Key=key, UploadId=upload_id,
+                PartNumber=len(futures) + 1, Body=bytes(buffer),
+            ))
+            buffer.clear()
+
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                if len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = timed(
+                            self.client.create_multipart_upload,
+                            Bucket=self.bucket, Key=key, ACL="public-read", ContentType=ContentType,
+                        )["UploadId"]
+                    submit()
+
+            if upload_id is None:
+                # small output: one request is cheaper than a multipart round trip
+                timed(self.client.put_object, Bucket=self.bucket, Key=key, Body=bytes(buffer), ACL="public-read",
+                      ContentType=ContentType)
+            else:
+                if buffer:
+                    submit()
+                parts = [{"PartNumber": i + 1, "ETag": f.result()["ETag"]} for i, f in enumerate(futures)]
+                timed(
+                    self.client.complete_multipart_upload,
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts},
+                )
+        except BaseException:
+            if upload_id is not None:
+                wait(futures)
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        finally:
+            metrics.record("s3_upload", sum(busy), started)
+        return self.url(key)
+
+    async def upload_path_async(self, path: str, name: str | None = None, ContentType="video/mp4") -> str:
+        return await asyncio.to_thread(self.upload_path, path, name, ContentType)
+
+    async def upload_bytes_async(self, data, name: str, ContentType="video/mp4") -> str:
+        return await asyncio.to_thread(self.upload_bytes, data, name, ContentType)
+
+
+_uploaders: dict[tuple, S3Uploader] = {}
+_uploaders_lock = threading.Lock()
+
+
+def get_uploader(ACCESS_KEY=ACCESS_KEY, SECRET_KEY=SECRET_KEY, BUCKET_NAME=BUCKET_NAME) -> S3Uploader:
+    with _uploaders_lock:
+        key = (ACCESS_KEY, SECRET_KEY, BUCKET_NAME)
+        if key not in _uploaders:
+            _uploaders[key] = S3Uploader(ACCESS_KEY, SECRET_KEY, BUCKET_NAME)
+        return _uploaders[key]
+
+
+def load_file_s3(OUTPUT_NAME , ACCESS_KEY=ACCESS_KEY, SECRET_KEY=SECRET_KEY, BUCKET_NAME=BUCKET_NAME, ContentType="video/mp4"):
+    return get_uploader(ACCESS_KEY, SECRET_KEY, BUCKET_NAME).upload_path(OUTPUT_NAME, ContentType=ContentType)
+
+
+def load_stream_s3(chunks, OUTPUT_NAME, ACCESS_KEY=ACCESS_KEY, SECRET_KEY=SECRET_KEY, BUCKET_NAME=BUCKET_NAME, ContentType="video/mp4"):
+    return get_uploader(ACCESS_KEY, SECRET_KEY, BUCKET_NAME).upload_stream(chunks, OUTPUT_NAME, ContentType=ContentType)
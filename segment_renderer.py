@@ -0,0 +1,119 @@
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from moviepy.video.io.VideoFileClip import VideoFileClip
+
+from anime_timeline import CANVAS, Layer, scale_clip
+from copy_planner import CopySpan, body_windows, copy_span, matches, normalize_clip, plan_copies, probe_video
+from transition_compositor import Compositor
+from video_encoder import EncoderSettings, concat_to_s3, encode_frames_to_file
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+RENDER_SEGMENT_SECONDS = float(os.getenv("RENDER_SEGMENT_SECONDS", 2.0))
+STREAM_COPY_BODIES = os.getenv("STREAM_COPY_BODIES", "1") == "1"
+
+
+def split_timeline(layers: list[Layer], duration: float, fps: float, max_seconds: float = RENDER_SEGMENT_SECONDS,
+                   extra_cuts: tuple[int, ...] = ()) -> list[tuple[int, int]]:
+    # frame ranges [first, last) cut at every layer boundary, so each segment composites a
+    # fixed set of layers, and long bodies split further so workers stay evenly loaded
+    n_frames = len(np.arange(0, duration, 1.0 / fps))
+    cuts = {0, n_frames, *(min(n_frames, max(0, c)) for c in extra_cuts)}
+    for layer in layers:
+        for t in (layer.start, layer.end):
+            cuts.add(min(n_frames, max(0, int(round(t * fps)))))
+    cuts = sorted(cuts)
+
+    max_frames = max(1, int(round(max_seconds * fps)))
+    windows = []
+    for first, last in zip(cuts, cuts[1:]):
+        pieces = math.ceil((last - first) / max_frames)
+        for i in range(pieces):
+            windows.append((first + (last - first) * i // pieces, first + (last - first) * (i + 1) // pieces))
+    return [w for w in windows if w[1] > w[0]]
+
+
+def render_window(paths: list[str], layers: list[Layer], duration: float, transition: float, fps: float,
+                  window: tuple[int, int], settings: EncoderSettings, out_path: str, canvas: tuple[int, int] = CANVAS) -> str:
+    first, last = window
+    t0, t1 = first / fps, last / fps
+    active = [layer for layer in layers if layer.start < t1 and layer.end > t0]
+    raw = {i: VideoFileClip(paths[i]) for i in {layer.clip for layer in active}}
+    try:
+        compositor = Compositor(active, {i: scale_clip(c, *canvas) for i, c in raw.items()}, transition, canvas)
+        frames = compositor.frames(np.arange(first, last) / fps)
+        encode_frames_to_file(frames, canvas, fps, settings, out_path)
+    finally:
+        for clip in raw.values():
+            clip.close()
+    return out_path
+
+
+def prepare_copies(pool, paths: list[str], layers: list[Layer], fps: float, n_frames: int, settings: EncoderSettings,
+                   normalized: list, canvas: tuple[int, int] = CANVAS):
+    # clips that already look like the output (codec, canvas size, fps, pix_fmt) are used
+    # as they are; the rest go through one ffmpeg pass that scales, pads and puts keyframes
+    # on the edges of their body window. Returns the paths to copy the spans from and the
+    # spans; the normalized files are appended to `normalized` for the caller to remove.
+    # Only the copied bodies come from these: the padded canvas centres a clip that isn't
+    # canvas sized, where a slide puts its corner on the sliding edge, so everything that
+    # is rendered reads the original clips.
+    paths = list(paths)
+    infos = dict(enumerate(pool.map(probe_video, paths)))
+    pending = {}
+    for clip, (first, last, shift) in body_windows(layers, fps).items():
+        if not matches(infos[clip], settings, fps, canvas):
+            pending[clip] = pool.submit(normalize_clip, paths[clip], infos[clip], settings, fps, [first + shift, last + shift],
+                                        canvas)
+    normalized.extend(pending.values())
+    for clip, future in pending.items():
+        paths[clip] = future.result()
+    for clip, info in zip(pending, pool.map(probe_video, [paths[c] for c in pending])):
+        infos[clip] = info
+    return paths, plan_copies(layers, infos, fps, n_frames)
+
+
+def render_segments(paths: list[str], layers: list[Layer], duration: float, transition: float, fps: float,
+                    settings: EncoderSettings, output_name: str, audio_path: str | None = None,
+                    workers: int = RENDER_WORKERS, copy_bodies: bool = STREAM_COPY_BODIES,
+                    canvas: tuple[int, int] = CANVAS) -> str:
+    # every segment gets the same encoder parameters (concat demuxer needs that); unless
+    # the settings say otherwise, the cores are shared between the parallel encoders
+    workers = max(1, workers)
+    if settings.threads is None:
+        settings = settings.with_overrides(threads=max(1, (os.cpu_count() or 1) // workers))
+
+    tmp_dir = tempfile.mkdtemp(prefix="segments_")
+    normalized = []
+    try:
+        # spawn: the caller usually sits in a thread of the API process
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            copies = []
+            if copy_bodies:
+                n_frames = len(np.arange(0, duration, 1.0 / fps))
+                copy_paths, copies = prepare_copies(pool, paths, layers, fps, n_frames, settings, normalized, canvas)
+            cuts = tuple(c for span in copies for c in (span.first, span.last))
+            tasks = [w for w in split_timeline(layers, duration, fps, extra_cuts=cuts)
+                     if not any(span.first <= w[0] and w[1] <= span.last for span in copies)]
+            tasks = sorted([*tasks, *copies], key=lambda task: task.first if isinstance(task, CopySpan) else task[0])
+
+            futures = []
+            for i, task in enumerate(tasks):
+                out_path = os.path.join(tmp_dir, f"{i:05d}.mp4")
+                if isinstance(task, CopySpan):
+                    futures.append(pool.submit(copy_span, copy_paths[task.clip], task, fps, out_path))
+                else:
+                    futures.append(pool.submit(render_window, paths, layers, duration, transition, fps, task,
+                                               settings, out_path, canvas))
+            segment_paths = [future.result() for future in futures]
+        return concat_to_s3(segment_paths, output_name, settings, audio_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        for future in normalized:
+            if future.done() and future.exception() is None and os.path.exists(future.result()):
+                os.remove(future.result())
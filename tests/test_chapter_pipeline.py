@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+
+from chapter_pipeline import ChapterSpec, run_chapter
+
+
+def fake_ops():
+    async def decode(data):
+        return np.zeros((100, 100, 3), dtype=np.uint8)
+
+    async def detect(image):
+        return [(0, 0, 50, 50), (50, 50, 100, 100)]
+
+    async def colorize(crops):
+        return crops
+
+    async def animate(panel_spec, panel, quality):
+        await asyncio.sleep(0.01)
+        return f"video-{panel_spec.effect}"
+
+    async def assemble(urls, spec):
+        return {"file_url": "chapter.mp4", "count": len(urls)}
+
+    return SimpleNamespace(decode=decode, detect=detect, colorize=colorize, animate=animate, assemble=assemble)
+
+
+def test_progress_writes_finish_in_order_before_the_result():
+    writes = []
+    in_flight = []
+
+    async def on_stage(stage, timings):
+        # slower than the stages, so writes pile up behind each other
+        in_flight.append(stage)
+        await asyncio.sleep(0.02)
+        writes.append((stage, timings))
+
+    async def main():
+        result = await run_chapter([b"page"] * 2, ChapterSpec.from_dict({}), fake_ops(), on_stage)
+        return result, len(writes)
+
+    result, written = asyncio.run(main())
+
+    assert result["count"] == 4
+    # every stage that finished has its write done by the time the chapter returns
+    assert written == len(in_flight) == sum(t["count"] for t in result["timings"].values())
+    assert writes[-1][0] == "assemble"
+    assert writes[-1][1] == result["timings"]
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import threading
+
+import pytest
+
+from downloader import DownloadCache, download_all
+from stubs import serve_files
+
+TRACK = 1024 * 1024
+
+
+@pytest.fixture(scope="module")
+def base():
+    files = {f"/track{i}.mp3": bytes([i]) * TRACK for i in range(3)}
+    base, server = serve_files(files, latency_s=0)
+    yield base
+    server.shutdown()
+
+
+def test_pinned_entry_survives_eviction(tmp_path, base):
+    # room for one track only
+    cache = DownloadCache(tmp_path, int(TRACK * 1.5))
+    with cache.use(f"{base}/track0.mp3", ".mp3") as first:
+        with cache.use(f"{base}/track1.mp3", ".mp3") as second:
+            # the newer entry pushed the cache past its limit, but the older one is in use
+            assert os.path.exists(first) and os.path.exists(second)
+        with cache.use(f"{base}/track2.mp3", ".mp3") as third:
+            assert os.path.exists(first) and os.path.exists(third)
+            assert not os.path.exists(second)
+        with open(first, "rb") as f:
+            assert f.read() == bytes([0]) * TRACK
+
+    # unpinned now, so the next fetch may evict it
+    with cache.use(f"{base}/track1.mp3", ".mp3"):
+        pass
+    assert not os.path.exists(first)
+    assert not cache.pins
+
+
+def test_concurrent_use_fetches_once(tmp_path, base):
+    cache = DownloadCache(tmp_path, 10 * TRACK)
+    barrier = threading.Barrier(8)
+    seen = []
+
+    def worker():
+        barrier.wait()
+        with cache.use(f"{base}/track0.mp3", ".mp3") as path:
+            seen.append(path)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(set(seen)) == 1 and len(seen) == 8
+    assert cache.misses == 1 and cache.hits == 7
+    # per-key locks are dropped once nobody is waiting on them
+    assert not cache.key_locks and not cache.pins
+
+
+def test_failed_fetch_leaves_nothing_behind(tmp_path, base):
+    cache = DownloadCache(tmp_path, 10 * TRACK)
+    with pytest.raises(Exception):
+        with cache.use(f"{base}/missing.mp3", ".mp3"):
+            pass
+    assert not list(tmp_path.iterdir())
+    assert not cache.key_locks and not cache.pins
+
+
+def test_download_all_removes_finished_files_on_failure(tmp_path, monkeypatch, base):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    with pytest.raises(Exception):
+        download_all([f"{base}/track0.mp3", f"{base}/missing.mp3"], ".mp4")
+    assert not list(tmp_path.iterdir())
+
+    paths = download_all([f"{base}/track0.mp3", f"{base}/track1.mp3"], ".mp4")
+    try:
+        assert [open(p, "rb").read(1) for p in paths] == [b"\x00", b"\x01"]
+    finally:
+        for p in paths:
+            os.remove(p)
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from ai_models.generation_client import FalProvider, GenerationClient
+from stubs import install_fal, serve_fal
+
+APPLICATION = "fal-ai/vidu/q1/image-to-video"
+IMAGE = b"\x89PNG not really an image"
+
+
+def fal(**kwargs):
+    base, server, stats = serve_fal(run_s=0.05, queue_s=0.0, **kwargs)
+    install_fal(base)
+    return server, stats
+
+
+def generate(**kwargs) -> tuple[GenerationClient, list, dict]:
+    server, stats = fal(**kwargs)
+    client = GenerationClient(FalProvider(poll_interval=0.05), concurrency=2, backoff=0.01)
+    events = []
+    try:
+        result = asyncio.run(client.generate(APPLICATION, IMAGE, {"prompt": "p"}, on_event=events.append))
+    finally:
+        server.shutdown()
+    assert result
+    return client, [e.stage for e in events], stats
+
+
+def test_failed_polls_resume_the_submitted_request():
+    client, stages, stats = generate(fail_polls=2)
+    assert stats["failed_polls"] == 2
+    # the request is watched again rather than submitted a second time
+    assert stats["submits"] == 1
+    assert client.stats["retries"] == 2
+    assert stages.count("submitted") == 1
+    assert stages[-1] == "completed"
+
+
+def test_failed_submits_are_retried():
+    client, stages, stats = generate(fail_submits=2)
+    assert stats["failed_submits"] == 2 and stats["submits"] == 1
+    assert client.stats["retries"] == 2
+    assert stages[-1] == "completed"
+
+
+def test_gives_up_after_the_retry_budget():
+    server, stats = fal(fail_submits=10)
+    client = GenerationClient(FalProvider(poll_interval=0.05), retries=2, backoff=0.01)
+    events = []
+    try:
+        with pytest.raises(Exception):
+            asyncio.run(client.generate(APPLICATION, IMAGE, {"prompt": "p"}, on_event=events.append))
+    finally:
+        server.shutdown()
+    assert stats["failed_submits"] == 3 and stats["submits"] == 0
+    assert client.stats["failures"] == 1
+    assert events[-1].stage == "failed"
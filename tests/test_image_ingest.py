@@ -0,0 +1,86 @@
+import ctypes
+import io
+import os
+import re
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+os.environ.setdefault("JOB_STORE", "memory")
+
+import app
+import image_ingest
+from image_ingest import ImageTooLarge, InvalidImage, decode_image
+
+
+def jpeg(width: int, height: int) -> bytes:
+    # smooth gradients compress well, so a large page is a small file
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+    y = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    pixels = np.dstack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                        np.full((height, width), 128, dtype=np.uint8)])
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def rss_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        return int(re.search(rf"{field}:\s+(\d+)", f.read()).group(1))
+
+
+def test_byte_limit(monkeypatch):
+    data = jpeg(64, 64)
+    monkeypatch.setattr(image_ingest, "MAX_IMAGE_BYTES", len(data) - 1)
+    with pytest.raises(ImageTooLarge):
+        decode_image(data)
+    # a spooled upload is measured by seeking, not by reading it
+    with pytest.raises(ImageTooLarge):
+        decode_image(io.BytesIO(data))
+    with pytest.raises(HTTPException) as e:
+        app.read_imagefile(data)
+    assert e.value.status_code == 413
+
+
+def test_pixel_limit(monkeypatch):
+    data = jpeg(200, 100)
+    monkeypatch.setattr(image_ingest, "MAX_IMAGE_PIXELS", 200 * 100 - 1)
+    with pytest.raises(ImageTooLarge):
+        decode_image(data)
+    with pytest.raises(HTTPException) as e:
+        app.read_imagefile(data)
+    assert e.value.status_code == 413
+
+
+def test_not_an_image():
+    with pytest.raises(InvalidImage):
+        decode_image(b"not an image at all")
+    with pytest.raises(HTTPException) as e:
+        app.read_imagefile(b"not an image at all")
+    assert e.value.status_code == 400
+
+
+def test_decode_keeps_size_under_the_bound():
+    image = decode_image(jpeg(1200, 1800), (400, 400))
+    assert image.shape == (400, 267, 3) and image.dtype == np.uint8
+    # smaller pages are left alone
+    assert decode_image(jpeg(300, 200), (400, 400)).shape == (200, 300, 3)
+
+
+def test_large_jpeg_is_reduced_while_decoding():
+    # 8000x8000 is 192 MB as RGB; drafted at 1/4 it is 12 MB
+    data = jpeg(8000, 8000)
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pytest.skip("peak RSS can't be reset here")
+    base = rss_kb("VmRSS")
+    image = decode_image(data, (1000, 1000))
+    peak_mb = (rss_kb("VmHWM") - base) / 1024
+
+    assert image.shape == (1000, 1000, 3)
+    assert peak_mb < 64
@@ -0,0 +1,47 @@
+import sys
+
+import numpy as np
+import pytest
+
+from encoder_settings import EncoderSettings
+from s3_save_file import MIN_PART_SIZE, S3Uploader
+from stubs import install_local_s3
+from video_encoder import encode_to_s3, run_ffmpeg
+
+
+@pytest.fixture
+def s3():
+    return install_local_s3()
+
+
+def test_stream_completes_a_multipart_upload(s3):
+    uploader = S3Uploader(bucket="test", concurrency=2)
+    chunks = [bytes([i]) * (1024 * 1024) for i in range(12)]
+    url = uploader.upload_stream(iter(chunks), "stream.bin")
+
+    assert s3.objects["videos/stream.bin"] == b"".join(chunks)
+    assert url.endswith("videos/stream.bin")
+    assert not s3.uploads and not s3.aborted
+
+
+def test_small_stream_is_one_put(s3):
+    S3Uploader(bucket="test").upload_stream(iter([b"abc", b"def"]), "small.bin")
+    assert s3.objects["videos/small.bin"] == b"abcdef"
+    assert s3.requests == 1
+
+
+def test_failing_ffmpeg_aborts_the_upload(s3):
+    # stands in for an ffmpeg that dies after writing more than a part
+    failing = [sys.executable, "-c",
+               f"import sys; sys.stdout.buffer.write(b'x' * {3 * MIN_PART_SIZE}); sys.stdout.flush(); sys.exit(1)"]
+    with pytest.raises(IOError, match="exited with code 1"):
+        S3Uploader(bucket="test").upload_stream(run_ffmpeg(failing), "broken.mp4")
+
+    assert s3.aborted == ["videos/broken.mp4"]
+    assert "videos/broken.mp4" not in s3.objects and not s3.uploads
+
+
+def test_encoded_frames_land_in_s3(s3):
+    frames = (np.full((64, 64, 3), i * 8, np.uint8) for i in range(30))
+    encode_to_s3(frames, (64, 64), 30, EncoderSettings(preset="ultrafast"), "frames.mp4")
+    assert s3.objects["videos/frames.mp4"][4:8] == b"ftyp"
@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from moviepy.video.io.VideoFileClip import VideoFileClip
+
+from anime_timeline import plan_layers, scale_clip, timeline_duration
+from bench_segment_render import synthetic_clips
+from encoder_settings import EncoderSettings
+from segment_renderer import prepare_copies, render_segments
+from stubs import install_local_s3
+from transition_compositor import Compositor
+
+CANVAS = (540, 960)
+FPS = 30
+TRANSITION = 0.25
+SETTINGS = EncoderSettings(preset="ultrafast", crf=12)
+
+
+@pytest.fixture
+def clips(tmp_path):
+    # smaller than the canvas, so they are scaled and, for the copied bodies, padded
+    paths = []
+    for name, data in synthetic_clips(2, 2, "240x360", FPS).items():
+        paths.append(str(tmp_path / name.lstrip("/")))
+        with open(paths[-1], "wb") as f:
+            f.write(data)
+    return paths
+
+
+def decode(data: bytes, path: str, n_frames: int) -> list[np.ndarray]:
+    with open(path, "wb") as f:
+        f.write(data)
+    clip = VideoFileClip(path)
+    try:
+        return [clip.get_frame(i / FPS).astype(np.int16) for i in range(n_frames)]
+    finally:
+        clip.close()
+
+
+@pytest.mark.parametrize("direction", ["right", "down"])
+def test_stream_copied_bodies_keep_the_serial_render_frames(clips, tmp_path, direction):
+    raw = [VideoFileClip(path) for path in clips]
+    durations = [clip.duration for clip in raw]
+    duration = timeline_duration(durations, TRANSITION)
+    layers = plan_layers(durations, TRANSITION, [direction])
+    compositor = Compositor(layers, {i: scale_clip(c, *CANVAS) for i, c in enumerate(raw)}, TRANSITION, CANVAS)
+    serial = [frame.astype(np.int16) for frame in compositor.frames(np.arange(0, duration, 1.0 / FPS))]
+    for clip in raw:
+        clip.close()
+
+    normalized = []
+    with ThreadPoolExecutor(2) as pool:
+        _, copies = prepare_copies(pool, clips, layers, FPS, len(serial), SETTINGS, normalized, CANVAS)
+    for future in normalized:
+        os.remove(future.result())
+    assert copies, "the bodies should be stream-copied"
+
+    s3 = install_local_s3()
+    render_segments(clips, layers, duration, TRANSITION, FPS, SETTINGS, "copied.mp4", workers=2, copy_bodies=True,
+                    canvas=CANVAS)
+    copied = decode(s3.objects["videos/copied.mp4"], str(tmp_path / "copied.mp4"), len(serial))
+
+    # encoding (and ffmpeg's scaler for the copied bodies) costs a little on every frame;
+    # a slide placed like the padded canvas is off by tens of levels
+    diffs = [np.abs(a - b).mean() for a, b in zip(copied, serial)]
+    assert max(diffs) < 4, f"frame {int(np.argmax(diffs))} differs by {max(diffs):.1f}"
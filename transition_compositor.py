@@ -0,0 +1,119 @@
+import numpy as np
+from PIL import Image
+
+from anime_timeline import CANVAS, DIRECTIONS, Layer
+
+WHITE = 255
+
+
+def blit(frame: np.ndarray, out: np.ndarray, x: int, y: int, clip_box: tuple[int, int, int, int] | None = None):
+    # frame's top-left corner at (x, y) of `out`, cut to the canvas and to `clip_box`
+    # (x1, y1, x2, y2 of the canvas), in place
+    h, w = frame.shape[:2]
+    H, W = out.shape[:2]
+    bx1, by1, bx2, by2 = clip_box or (0, 0, W, H)
+    x1, y1 = max(x, bx1), max(y, by1)
+    x2, y2 = min(x + w, bx2), min(y + h, by2)
+    if x1 < x2 and y1 < y2:
+        out[y1:y2, x1:x2] = frame[y1 - y:y2 - y, x1 - x:x2 - x, :3]
+
+
+class Compositor:
+    # Frames of create_anime's timeline written straight into a preallocated canvas: the
+    # white background is one fill, every clip one slice assignment. Per-layer positions
+    # and transition progress are computed for a whole run of frames at once. Slides land
+    # on the same pixels as build_composite's moviepy composite (positions truncated like
+    # moviepy's blit), so rendered output doesn't change; crossfade, wipes and zoom are
+    # blends and masks on the same canvas.
+
+    def __init__(self, layers: list[Layer], clips: dict, transition: float, canvas: tuple[int, int] = CANVAS):
+        # `clips` are moviepy clips already scaled to the canvas, keyed like Layer.clip
+        self.transition = transition
+        self.canvas = canvas
+        self.layers = layers
+        # same subclips the moviepy composite plays, so the same source frames come out
+        self.placed = [clips[layer.clip].subclip(layer.src_start, layer.src_end).set_start(layer.start) for layer in layers]
+        width, height = canvas
+        self.out = np.empty((height, width, 3), dtype=np.uint8)
+        self.other = np.empty_like(self.out)
+        self.mix = np.empty((height, width, 3), dtype=np.uint16)
+        self.mix_other = np.empty_like(self.mix)
+
+    def positions(self, layer: Layer, size: tuple[int, int], ct: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # top-left corner per frame; the slide formulas are anime_timeline.slide_position's
+        width, height = self.canvas
+        w, h = size
+        cx, cy = np.full(len(ct), int((width - w) / 2)), np.full(len(ct), int((height - h) / 2))
+        kind = layer.transition
+        if kind not in DIRECTIONS:
+            return cx, cy
+        travel = width if kind in ('right', 'left') else height
+        if kind in ('right', 'down'):
+            offset = travel * (ct / self.transition) if layer.role == 'prev' else -travel + travel * (ct / self.transition)
+        else:
+            offset = -travel * (ct / self.transition) if layer.role == 'prev' else travel - travel * (ct / self.transition)
+        # moviepy truncates positions to int before blitting
+        offset = offset.astype(np.int64)
+        return (offset, cy) if kind in ('right', 'left') else (cx, offset)
+
+    def frames(self, times: np.ndarray):
+        # yields the frame at each time; the array is reused by the next one
+        width, height = self.canvas
+        runs = []
+        for layer, clip in zip(self.layers, self.placed):
+            playing = (times >= clip.start) & (times < clip.end)
+            if not playing.any():
+                continue
+            ct = times - clip.start
+            xs, ys = self.positions(layer, clip.size, ct)
+            progress = np.clip(ct / self.transition, 0, 1)
+            runs.append((layer, clip, playing, ct, xs, ys, progress))
+
+        for k in range(len(times)):
+            active = [run for run in runs if run[2][k]]
+            prev = next((run for run in active if run[0].role == 'prev'), None)
+            nxt = next((run for run in active if run[0].role == 'next'), None)
+            kind = (prev or nxt)[0].transition if prev or nxt else None
+            self.out.fill(WHITE)
+            if kind in ('crossfade', 'zoom') and prev and nxt:
+                self.place(prev, k, self.out)
+                self.other.fill(WHITE)
+                self.place(nxt, k, self.other)
+                a = float(nxt[6][k])
+                if kind == 'zoom':
+                    # through the previous clip into the next: one zooms in 1x -> 2x while the
+                    # next settles from 2x to 1x
+                    self.zoom(self.out, 1 + a)
+                    self.zoom(self.other, 2 - a)
+                self.blend(a)
+            elif kind in ('wipe_right', 'wipe_left', 'wipe_down', 'wipe_up') and prev and nxt:
+                self.place(prev, k, self.out)
+                edge_x, edge_y = int(width * nxt[6][k]), int(height * nxt[6][k])
+                box = {'wipe_right': (0, 0, edge_x, height), 'wipe_left': (width - edge_x, 0, width, height),
+                       'wipe_down': (0, 0, width, edge_y), 'wipe_up': (0, height - edge_y, width, height)}[kind]
+                self.place(nxt, k, self.out, box)
+            else:
+                for run in active:
+                    self.place(run, k, self.out)
+            yield self.out
+
+    def place(self, run, k: int, out: np.ndarray, box=None):
+        _, clip, _, ct, xs, ys, _ = run
+        blit(clip.get_frame(ct[k]), out, int(xs[k]), int(ys[k]), box)
+
+    def zoom(self, image: np.ndarray, scale: float):
+        if scale == 1:
+            return
+        width, height = self.canvas
+        half_w, half_h = width / (2 * scale), height / (2 * scale)
+        box = (width / 2 - half_w, height / 2 - half_h, width / 2 + half_w, height / 2 + half_h)
+        np.copyto(image, np.asarray(Image.fromarray(image).resize(self.canvas, Image.BILINEAR, box=box)))
+
+    def blend(self, a: float):
+        # out = out * (1 - a) + other * a in 8.8 fixed point
+        w = int(round(a * 256))
+        np.multiply(self.out, 256 - w, out=self.mix, dtype=np.uint16)
+        np.multiply(self.other, w, out=self.mix_other, dtype=np.uint16)
+        self.mix += self.mix_other
+        np.right_shift(self.mix, 8, out=self.mix)
+        np.copyto(self.out, self.mix, casting='unsafe')
@@ -0,0 +1,139 @@
+import hashlib
+import io
+import json
+import mmap
+import os
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from image_ingest import MAX_IMAGE_BYTES, check_bytes, open_image
+
+# whole request bodies: the largest image plus room for the other form fields
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", MAX_IMAGE_BYTES + 1024 * 1024))
+# routes taking several files (a chapter's pages) in one body
+UPLOAD_BATCH_MAX_BYTES = int(os.getenv("UPLOAD_BATCH_MAX_BYTES", 512 * 1024 * 1024))
+# bodies a process receives at once; the multipart parser spools files over 1 MB to disk,
+# so this bounds that temp storage, and requests beyond it are turned away with 503
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", 2 * 1024 ** 3))
+JSON_MAX_BYTES = int(os.getenv("JSON_MAX_BYTES", 1024 * 1024))
+CHUNK_SIZE = 1024 * 1024
+
+
+class BodyTooLarge(HTTPException):
+    # an HTTPException, so FastAPI's body parsing passes it on as the 413 response
+    def __init__(self, limit: int):
+        super().__init__(413, f"Request body is over the limit of {limit} bytes")
+
+
+class UploadLimit:
+    # Plain ASGI, in front of the multipart parser: a body whose Content-Length is over
+    # the limit (UPLOAD_MAX_BYTES, or the route's in `limits`) gets 413 before any of it is
+    # read, one sent without a length is cut off once it gets there, and every body
+    # reserves its size from the spool budget while it is being received.
+    in_flight = 0
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_BYTES, spool_bytes: int = UPLOAD_SPOOL_BYTES,
+                 limits: dict[str, int] | None = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.limits = limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+        limit = self.limits.get(scope["path"], self.max_bytes)
+        length = dict(scope["headers"]).get(b"content-length")
+        try:
+            length = int(length) if length is not None else None
+        except ValueError:
+            return await self.reject(scope, receive, send, 400, "Invalid Content-Length")
+        if length is not None and length > limit:
+            return await self.reject(scope, receive, send, 413, f"Request body is {length} bytes, the limit is {limit}")
+        reserved = length if length is not None else limit
+        if UploadLimit.in_flight + reserved > self.spool_bytes:
+            return await self.reject(scope, receive, send, 503, "Too many uploads in progress, retry later")
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise BodyTooLarge(limit)
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        UploadLimit.in_flight += reserved
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except BodyTooLarge as e:
+            if started:
+                raise
+            await self.reject(scope, receive, send, e.status_code, e.detail)
+        finally:
+            UploadLimit.in_flight -= reserved
+
+    async def reject(self, scope, receive, send, status: int, detail: str):
+        headers = {"Connection": "close", **({"Retry-After": "1"} if status == 503 else {})}
+        await JSONResponse({"detail": detail}, status, headers=headers)(scope, receive, send)
+
+
+@dataclass
+class Upload:
+    # an uploaded file as the multipart parser spooled it; `file` is at the start
+    file: BinaryIO
+    size: int
+    sha256: str
+    content_type: str
+
+    def view(self) -> memoryview:
+        # the contents without copying them into the heap: a read-only map of the spool
+        # file (small uploads the parser still holds in memory are copied)
+        inner = getattr(self.file, "_file", self.file)
+        if isinstance(inner, io.BytesIO):
+            return memoryview(inner.getvalue())
+        if self.size == 0:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(inner.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def spooled(file: UploadFile) -> tuple[int, str]:
+    # size and sha256 in one pass over the spool file
+    digest = hashlib.sha256()
+    size = 0
+    file.file.seek(0)
+    while chunk := file.file.read(CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    file.file.seek(0)
+    return size, digest.hexdigest()
+
+
+def ingest_image(file: UploadFile) -> Upload:
+    # raises ImageTooLarge / InvalidImage before anything holds the decoded pixels
+    check_bytes(file.size)
+    size, sha256 = spooled(file)
+    image = open_image(file.file)
+    file.file.seek(0)
+    return Upload(file.file, size, sha256, file.content_type or image.get_format_mimetype() or "image/png")
+
+
+def ingest_json(file: UploadFile, max_bytes: int = JSON_MAX_BYTES):
+    if file.content_type != "application/json":
+        raise ValueError("expected an application/json file")
+    file.file.seek(0)
+    content = file.file.read(max_bytes + 1)
+    if len(content) > max_bytes:
+        raise ValueError(f"JSON is over the limit of {max_bytes} bytes")
+    return json.loads(content)
@@ -0,0 +1,137 @@
+import contextvars
+import os
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+from moviepy.config import get_setting
+
+import metrics
+from encoder_settings import EncoderSettings
+from s3_save_file import load_stream_s3
+
+
+# per-endpoint settings; these reproduce what each write_videofile call used to do
+ENCODER_SETTINGS: dict[str, EncoderSettings] = {
+    "manual_reveal": EncoderSettings(),
+    "manual_zoom": EncoderSettings(preset="slow"),
+    "manual_shake": EncoderSettings(),
+    "manual_timeline": EncoderSettings(preset="slow"),
+    "create_anime": EncoderSettings(preset="slow", crf=18),
+    "cogvideox_animate": EncoderSettings(),
+}
+
+
+def ffmpeg_command(size: tuple[int, int], fps: float, settings: EncoderSettings, audio_path: str | None = None,
+                   output: str = "pipe:1") -> list[str]:
+    w, h = size
+    command = [
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-vcodec", "rawvideo", "-pix_fmt", "rgb24",
+        "-s", f"{w}x{h}", "-r", f"{fps:.02f}", "-i", "-",
+    ]
+    if audio_path:
+        command += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0", "-c:a", settings.audio_codec, "-shortest"]
+    else:
+        command += ["-an"]
+    return command + settings.video_args() + output_args(output)
+
+
+def output_args(output: str) -> list[str]:
+    if output == "pipe:1":
+        # a pipe is not seekable, so the moov atom can't be patched in at the end; delay_moov
+        # holds it until the first fragment so the edit list can cancel the B-frame delay
+        # (otherwise video starts two frames after the audio)
+        return ["-movflags", "frag_keyframe+empty_moov+delay_moov+default_base_moof", "-f", "mp4", "pipe:1"]
+    return ["-f", "mp4", output]
+
+
+def run_ffmpeg(command: list[str], frames=None, chunk_size: int = 1024 * 1024):
+    # yields whatever ffmpeg writes to stdout; `frames` (if any) are fed to stdin as rgb24.
+    # The ffmpeg span is wall time, so it includes waiting on the frames and on the consumer.
+    with metrics.span("ffmpeg"):
+        yield from _run_ffmpeg(command, frames, chunk_size)
+
+
+def _run_ffmpeg(command: list[str], frames, chunk_size: int):
+    stderr = tempfile.TemporaryFile()
+    proc = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if frames is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=stderr,
+    )
+    feed_error = []
+
+    def feed():
+        try:
+            for frame in frames:
+                proc.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+        except BaseException as e:
+            feed_error.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    # in a copy of this context, so spans the frame generator records land in the same trace
+    feeder = threading.Thread(target=contextvars.copy_context().run, args=(feed,), daemon=True)
+    if frames is not None:
+        feeder.start()
+    try:
+        while True:
+            chunk = proc.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        if frames is not None:
+            feeder.join()
+        proc.stdout.close()
+
+    stderr.seek(0)
+    log = stderr.read().decode(errors="replace")
+    stderr.close()
+    if feed_error and not isinstance(feed_error[0], BrokenPipeError):
+        raise feed_error[0]
+    if proc.returncode != 0:
+        raise IOError(f"ffmpeg exited with code {proc.returncode}:\n{log[-2000:]}")
+
+
+def encode_frames(frames, size: tuple[int, int], fps: float, settings: EncoderSettings,
+                  audio_path: str | None = None, chunk_size: int = 1024 * 1024):
+    return run_ffmpeg(ffmpeg_command(size, fps, settings, audio_path), frames, chunk_size)
+
+
+def encode_frames_to_file(frames, size: tuple[int, int], fps: float, settings: EncoderSettings, path: str):
+    for _ in run_ffmpeg(ffmpeg_command(size, fps, settings, output=path), frames):
+        pass
+
+
+def encode_to_s3(frames, size: tuple[int, int], fps: float, settings: EncoderSettings, output_name: str,
+                 audio_path: str | None = None) -> str:
+    return load_stream_s3(encode_frames(frames, size, fps, settings, audio_path), output_name)
+
+
+def concat_to_s3(segment_paths: list[str], output_name: str, settings: EncoderSettings, audio_path: str | None = None) -> str:
+    # segments share encoder parameters, so the concat demuxer can join them without re-encoding;
+    # stream-copied spans from other encoders work too, as its auto_convert puts the parameter
+    # sets of every segment in-band
+    list_file = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+    with list_file:
+        for path in segment_paths:
+            list_file.write(f"file '{os.path.abspath(path)}'\n")
+    command = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", list_file.name]
+    if audio_path:
+        command += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0", "-c:a", settings.audio_codec, "-shortest"]
+    command += ["-c:v", "copy"] + output_args("pipe:1")
+    try:
+        return load_stream_s3(run_ffmpeg(command), output_name)
+    finally:
+        os.remove(list_file.name)